@@ -1,7 +1,21 @@
-from scapy.all import sniff, DNS, DNSQR, DNSRR, IP, UDP, TCP
+import argparse
+import ctypes
 import logging
+import socket
+import struct
 import time
 
+import dnspcap
+import dnspipeline
+import dnsstore
+import dnswire
+from dnswire import RCODE_NAMES
+
+try:
+    from scapy.all import sniff, Ether, IP, IPv6
+except ImportError:
+    sniff = None  # only needed for the scapy capture backend
+
 # --- Configuration ---
 LOG_FILE = 'dns_traffic_analysis.log'
 # Interface to sniff on. Leave as None to let Scapy try to find one.
@@ -11,6 +25,89 @@ INTERFACE = None
 COUNT = 100
 # Timeout for sniffing. Set to 0 for no timeout (Ctrl+C to stop).
 TIMEOUT = 30
+# Capture backend: 'raw' reads frames from an AF_PACKET socket (Linux); 'scapy' captures
+# with scapy's sniff(). Either way the frames are decoded with dnswire.
+# 'auto' picks 'raw' where AF_PACKET exists and falls back to 'scapy'.
+CAPTURE_BACKEND = 'auto'
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_ATTACH_FILTER = 26
+PACKET_OUTGOING = 4
+ARPHRD_LOOPBACK = 772
+# Link types of the frames an AF_PACKET socket returns, by the interface's ARPHRD_* type.
+# Tunnel and point-to-point devices (tun/WireGuard, PPP, IPIP, SIT) carry bare IP packets.
+LINKTYPES_BY_HATYPE = {
+    1: dnswire.LINKTYPE_ETHERNET,    # ARPHRD_ETHER
+    ARPHRD_LOOPBACK: dnswire.LINKTYPE_ETHERNET,
+    512: dnswire.LINKTYPE_RAW,       # ARPHRD_PPP
+    519: dnswire.LINKTYPE_RAW,       # ARPHRD_RAWIP
+    768: dnswire.LINKTYPE_RAW,       # ARPHRD_TUNNEL
+    769: dnswire.LINKTYPE_RAW,       # ARPHRD_TUNNEL6
+    776: dnswire.LINKTYPE_RAW,       # ARPHRD_SIT
+    0xFFFE: dnswire.LINKTYPE_RAW,    # ARPHRD_NONE
+}
+# Classic BPF for 'udp port 53 or tcp port 53' on Ethernet frames, as (code, jt, jf, k)
+# like `tcpdump -dd`. Frames from other link types (tun, PPP, ...) are passed on, as are
+# IPv6 packets with extension headers, for dnswire to judge.
+DNS_BPF_FILTER = (
+    (0x20, 0, 0, 0xfffff01c),   # ld #hatype                link type (SKF_AD_HATYPE)
+    (0x15, 2, 0, 0x00000001),   # jeq #1       jt 4  jf 2   ARPHRD_ETHER
+    (0x15, 1, 0, 0x00000304),   # jeq #772     jt 4  jf 3   ARPHRD_LOOPBACK
+    (0x06, 0, 0, 0x00040000),   # ret #262144               not Ethernet: accept
+    (0x28, 0, 0, 0x0000000c),   # ldh [12]                  ethertype
+    (0x15, 0, 10, 0x00000800),  # jeq #0x800   jt 6  jf 16
+    (0x30, 0, 0, 0x00000017),   # ldb [23]                  IPv4 protocol
+    (0x15, 1, 0, 0x00000011),   # jeq #17      jt 9  jf 8
+    (0x15, 0, 20, 0x00000006),  # jeq #6       jt 9  jf 29
+    (0x28, 0, 0, 0x00000014),   # ldh [20]                  flags/fragment offset
+    (0x45, 18, 0, 0x00001fff),  # jset #0x1fff jt 29 jf 11
+    (0xb1, 0, 0, 0x0000000e),   # ldxb 4*([14]&0xf)         IPv4 header length
+    (0x48, 0, 0, 0x0000000e),   # ldh [x + 14]              source port
+    (0x15, 14, 0, 0x00000035),  # jeq #53      jt 28 jf 14
+    (0x48, 0, 0, 0x00000010),   # ldh [x + 16]              destination port
+    (0x15, 12, 13, 0x00000035), # jeq #53      jt 28 jf 29
+    (0x15, 0, 12, 0x000086dd),  # jeq #0x86dd  jt 17 jf 29
+    (0x30, 0, 0, 0x00000014),   # ldb [20]                  IPv6 next header
+    (0x15, 5, 0, 0x00000011),   # jeq #17      jt 24 jf 19
+    (0x15, 4, 0, 0x00000006),   # jeq #6       jt 24 jf 20
+    (0x15, 7, 0, 0x00000000),   # jeq #0       jt 28 jf 21  hop-by-hop
+    (0x15, 6, 0, 0x0000002b),   # jeq #43      jt 28 jf 22  routing
+    (0x15, 5, 0, 0x0000002c),   # jeq #44      jt 28 jf 23  fragment
+    (0x15, 4, 5, 0x0000003c),   # jeq #60      jt 28 jf 29  destination options
+    (0x28, 0, 0, 0x00000036),   # ldh [54]                  source port
+    (0x15, 2, 0, 0x00000035),   # jeq #53      jt 28 jf 26
+    (0x28, 0, 0, 0x00000038),   # ldh [56]                  destination port
+    (0x15, 0, 1, 0x00000035),   # jeq #53      jt 28 jf 29
+    (0x06, 0, 0, 0x00040000),   # ret #262144               accept
+    (0x06, 0, 0, 0x00000000),   # ret #0                    drop
+)
+# Worker processes for analysis (live capture and --pcap). 0 analyzes on the capture thread.
+WORKERS = 0
+# Query/response correlation: unanswered queries count as timeouts after this many seconds.
+TRANSACTION_TIMEOUT = 5.0
+# Open queries tracked at once (per worker); the oldest is evicted beyond this.
+TRANSACTION_TABLE_SIZE = 100000
+# Seconds covered by each resolver latency report and top-N snapshot.
+REPORT_INTERVAL = 60.0
+# Log every query and answer (debug mode). Normally only the periodic reports are written.
+LOG_PACKETS = False
+# Heavy-hitter sketches: count-min width x depth, keys monitored and keys reported per dimension.
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+TOP_CAPACITY = 200
+TOP_N = 20
+# Tunneling/DGA scoring of query names, in batches (vectorized when NumPy is installed).
+SCORE_NAMES = True
+SCORE_BATCH_SIZE = 512
+# Columnar event store directory (None disables it). Each writing process gets its own shard;
+# a segment is sealed every STORE_SEGMENT_ROWS rows or STORE_SEGMENT_SECONDS seconds.
+STORE_DIR = None
+STORE_SEGMENT_ROWS = 262144
+STORE_SEGMENT_SECONDS = 300.0
+
+# Analysis on the capture thread (when --workers is 0).
+INLINE = None
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -24,107 +121,261 @@ console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logging.getLogger().addHandler(console_handler)
 
-def dns_parser(packet):
+def analyzer_factory(log_packets=None, store_dir=None):
+    return dnspipeline.analyzer_factory(
+        log_packets=LOG_PACKETS if log_packets is None else log_packets,
+        store_dir=STORE_DIR if store_dir is None else store_dir,
+        store_segment_rows=STORE_SEGMENT_ROWS,
+        store_segment_seconds=STORE_SEGMENT_SECONDS,
+        transaction_timeout=TRANSACTION_TIMEOUT,
+        transaction_table_size=TRANSACTION_TABLE_SIZE,
+        report_interval=REPORT_INTERVAL,
+        sketch_width=SKETCH_WIDTH,
+        sketch_depth=SKETCH_DEPTH,
+        top_capacity=TOP_CAPACITY,
+        top_n=TOP_N,
+        score_names=SCORE_NAMES,
+        score_batch_size=SCORE_BATCH_SIZE,
+    )
+
+
+def handle_frame(frame, linktype=dnswire.LINKTYPE_ETHERNET, ts=None):
+    """
+    Decodes one raw frame and analyzes it on the calling thread: DNS packets
+    are correlated, counted into the top-N sketches, scored for tunneling
+    and, with LOG_PACKETS, logged one by one.
+    Returns True for DNS frames (including malformed ones), False otherwise.
+    """
+    global INLINE
+    if INLINE is None:
+        INLINE = dnspipeline.InlineAnalysis(analyzer_factory=analyzer_factory())
+    return INLINE.submit(frame, linktype, ts)
+
+
+def capture_raw(interface, count, timeout, on_frame=handle_frame):
+    """
+    Captures frames from a Linux AF_PACKET socket into one reused buffer and
+    passes them to ``on_frame(frame, linktype, ts)``, which decodes them in
+    place (handle_frame) or queues them for the worker pool.
+    The kernel only delivers DNS frames (DNS_BPF_FILTER), and the outgoing
+    copy of each loopback frame is skipped so ``lo`` traffic counts once.
+    Frames from interfaces whose link type is not in LINKTYPES_BY_HATYPE are
+    skipped, with one warning per type.
+    Returns the number of frames ``on_frame`` accepted.
+    """
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    try:
+        attach_dns_filter(sock)
+        if interface:
+            sock.bind((interface, 0))
+        buffer = bytearray(65536)
+        view = memoryview(buffer)
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        seen = 0
+        unsupported = set()
+        while count <= 0 or seen < count:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+            try:
+                size, address = sock.recvfrom_into(buffer)
+            except socket.timeout:
+                break
+            if address[2] == PACKET_OUTGOING and address[3] == ARPHRD_LOOPBACK:
+                continue  # the same frame is received again as PACKET_HOST
+            linktype = LINKTYPES_BY_HATYPE.get(address[3])
+            if linktype is None:
+                if address[3] not in unsupported:
+                    unsupported.add(address[3])
+                    logging.warning(f"Skipping frames from {address[0]}: unsupported link type (ARPHRD {address[3]})")
+                continue
+            if on_frame(view[:size], linktype, time.time()):
+                seen += 1
+        log_kernel_drops(sock)
+        return seen
+    finally:
+        sock.close()
+
+
+def attach_dns_filter(sock):
     """
-    Parses a DNS packet and logs relevant information.
+    Attaches DNS_BPF_FILTER to a packet socket and discards the frames that
+    were queued before it took effect. Without the filter (e.g. no
+    SO_ATTACH_FILTER support) every frame is read and dnswire drops the rest.
     """
-    if IP in packet and (UDP in packet or TCP in packet) and DNS in packet:
-        src_ip = packet[IP].src
-        dst_ip = packet[IP].dst
-        protocol = "UDP" if UDP in packet else "TCP"
-        query_type = "QUERY" if packet[DNS].qr == 0 else "RESPONSE"
-
-        try:
-            if query_type == "QUERY" and packet[DNS].qd:
-                # DNS Query
-                query_name = packet[DNS].qd.qname.decode('utf-8').rstrip('.')
-                query_type_str = packet[DNS].qd.qtype
-                # Map qtype to human-readable format if possible (Scapy often does this automatically)
-                # You can extend this mapping if needed
-                qtype_map = {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX', 16: 'TXT', 28: 'AAAA', 255: 'ANY'}
-                qtype_readable = qtype_map.get(query_type_str, str(query_type_str))
-
-                log_message = (
-                    f"[{protocol} DNS QUERY] "
-                    f"Src: {src_ip}, Dst: {dst_ip}, "
-                    f"Domain: {query_name}, Type: {qtype_readable}"
-                )
-                logging.info(log_message)
-
-            elif query_type == "RESPONSE" and packet[DNS].an:
-                # DNS Response (with answers)
-                for i in range(packet[DNS].ancount):
-                    ans = packet[DNS].an[i]
-                    ans_name = ans.rrname.decode('utf-8').rstrip('.')
-                    ans_type = ans.type
-                    ans_data = ""
-
-                    # Attempt to get readable answer data based on type
-                    if ans.type == 1: # A record
-                        ans_data = ans.rdata
-                    elif ans.type == 28: # AAAA record
-                        ans_data = ans.rdata
-                    elif ans.type == 5: # CNAME record
-                        ans_data = ans.rdata.decode('utf-8').rstrip('.')
-                    elif ans.type == 2: # NS record
-                        ans_data = ans.rdata.decode('utf-8').rstrip('.')
-                    elif ans.type == 12: # PTR record
-                        ans_data = ans.rdata.decode('utf-8').rstrip('.')
-                    elif ans.type == 15: # MX record
-                        # MX records have a preference and a mail exchanger
-                        ans_data = f"Preference:{ans.preference} MailExchanger:{ans.exchange.decode('utf-8').rstrip('.')}"
-                    else:
-                        ans_data = str(ans.rdata) # Fallback for other types
-
-                    atype_map = {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX', 16: 'TXT', 28: 'AAAA'}
-                    atype_readable = atype_map.get(ans_type, str(ans_type))
-
-                    log_message = (
-                        f"[{protocol} DNS RESPONSE] "
-                        f"Src: {src_ip}, Dst: {dst_ip}, "
-                        f"Domain: {ans_name}, Type: {atype_readable}, Answer: {ans_data}"
-                    )
-                    logging.info(log_message)
-            elif query_type == "RESPONSE" and packet[DNS].rcode != 0:
-                # DNS Response with error (e.g., NXDOMAIN - no such domain)
-                rcode_map = {
-                    0: "NoError", 1: "FormErr", 2: "ServFail", 3: "NXDomain",
-                    4: "NotImp", 5: "Refused", 6: "YXDomain", 7: "YXRRSet",
-                    8: "NXRRSet", 9: "NotAuth", 10: "NotZone"
-                }
-                rcode_readable = rcode_map.get(packet[DNS].rcode, f"Unknown Error {packet[DNS].rcode}")
-                query_name = "N/A"
-                if packet[DNS].qd:
-                    query_name = packet[DNS].qd.qname.decode('utf-8').rstrip('.')
-                log_message = (
-                    f"[{protocol} DNS ERROR RESPONSE] "
-                    f"Src: {src_ip}, Dst: {dst_ip}, "
-                    f"Query: {query_name}, Rcode: {rcode_readable}"
-                )
-                logging.warning(log_message)
-
-        except Exception as e:
-            logging.error(f"Error parsing DNS packet from {src_ip} to {dst_ip}: {e}")
-            # Optional: print(packet.show()) to see the full packet structure for debugging
-
-    # else:
-    #     logging.debug(f"Non-DNS packet or incomplete DNS packet received: {packet.summary()}")
-
-
-def main():
-    logging.info(f"Starting DNS traffic analysis on interface: {INTERFACE if INTERFACE else 'auto-selected'}")
-    logging.info(f"Capturing {COUNT if COUNT > 0 else 'infinite'} packets or for {TIMEOUT if TIMEOUT > 0 else 'no'} seconds...")
+    program = b''.join(struct.pack('HBBI', *insn) for insn in DNS_BPF_FILTER)
+    instructions = ctypes.create_string_buffer(program, len(program))
+    fprog = struct.pack('HP', len(DNS_BPF_FILTER), ctypes.addressof(instructions))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+    except OSError as e:
+        logging.warning(f"Could not attach the DNS socket filter, filtering in Python instead: {e}")
+        return
+    sock.setblocking(False)
+    try:
+        while True:
+            sock.recv(65536)
+    except (BlockingIOError, InterruptedError):
+        pass
+    finally:
+        sock.setblocking(True)
+
+
+def log_kernel_drops(sock):
+    """Logs the kernel's received/dropped counters for a packet socket."""
+    try:
+        received, dropped = struct.unpack('II', sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+    except OSError:
+        return
+    logging.info(f"Kernel socket: {received} packets received, {dropped} dropped")
+
+
+def capture_scapy(interface, count, timeout, on_frame=handle_frame):
+    """
+    Captures with scapy's sniff() and hands each packet's bytes to
+    ``on_frame`` like capture_raw does, so both backends share one analysis
+    path. Packets without an Ethernet header are passed as raw IP.
+    """
+    if sniff is None:
+        raise ImportError("scapy is not installed")
+
+    def forward(packet):
+        if Ether in packet:
+            on_frame(bytes(packet), dnswire.LINKTYPE_ETHERNET, float(packet.time))
+        elif IP in packet or IPv6 in packet:
+            layer = packet[IP] if IP in packet else packet[IPv6]
+            on_frame(bytes(layer), dnswire.LINKTYPE_RAW, float(packet.time))
+
+    sniff(
+        filter="udp port 53 or tcp port 53", # BPF filter for DNS traffic (UDP or TCP)
+        prn=forward,                         # Function to call for each packet
+        store=0,                             # Do not store packets in memory (save resources)
+        iface=interface,                     # Specify network interface
+        count=count,                         # Number of packets to capture
+        timeout=timeout                      # Timeout for sniffing
+    )
+
+
+def replay_pcap(path, on_frame=handle_frame):
+    """
+    Streams every frame of a pcap/pcapng file through ``on_frame`` as fast as
+    the CPU allows and logs the achieved rate.
+    Returns (packets, accepted, elapsed_seconds).
+    """
+    packets = accepted = 0
+    start = time.perf_counter()
+    for ts, frame, linktype in dnspcap.iter_frames(path):
+        packets += 1
+        if on_frame(frame, linktype, ts):
+            accepted += 1
+    elapsed = time.perf_counter() - start
+    rate = packets / elapsed if elapsed > 0 else 0.0
+    logging.info(
+        f"Replayed {packets} packets ({accepted} {'DNS' if on_frame is handle_frame else 'queued'}) "
+        f"from {path} in {elapsed:.3f}s ({rate:.0f} packets/sec)"
+    )
+    return packets, accepted, elapsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Log and analyze DNS traffic, live or from a capture file.")
+    parser.add_argument('--pcap', metavar='FILE',
+                        help="replay a pcap/pcapng file instead of sniffing (no root needed)")
+    parser.add_argument('--interface', default=INTERFACE, help="interface to sniff on")
+    parser.add_argument('--count', type=int, default=COUNT, help="packets to capture, 0 for infinite")
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help="seconds to capture, 0 for no timeout")
+    parser.add_argument('--log-packets', action='store_true', default=LOG_PACKETS,
+                        help="log every query and answer (debug; normally only periodic reports are logged)")
+    parser.add_argument('--store', metavar='DIR', default=STORE_DIR,
+                        help="also record every query and response in a columnar event store in DIR")
+    parser.add_argument('--query', metavar='DOMAIN',
+                        help="list who resolved DOMAIN, from the event store given with --store, and exit")
+    parser.add_argument('--since', type=float, default=3600, metavar='SECONDS',
+                        help="with --query, how far back to look (default: 3600)")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="analysis worker processes, 0 to analyze on the capture thread "
+                             "(with workers, --count counts captured frames rather than DNS packets)")
+    return parser.parse_args(argv)
+
+
+def query_store(directory, domain, since):
+    """Prints the clients that queried ``domain`` in the last ``since`` seconds, busiest first."""
+    start = time.perf_counter()
+    store = dnsstore.EventStore(directory)
+    try:
+        clients = {}  # client -> [queries, first seen, last seen, rcodes of the responses]
+        for event in store.find(domain, time.time() - since):
+            entry = clients.setdefault(event.client, [0, event.ts, event.ts, set()])
+            entry[1] = min(entry[1], event.ts)
+            entry[2] = max(entry[2], event.ts)
+            if event.response:
+                entry[3].add(RCODE_NAMES.get(event.rcode, str(event.rcode)))
+            else:
+                entry[0] += 1
+    finally:
+        store.close()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{'client':<40}{'queries':>8}  {'first seen':<20}{'last seen':<20}rcodes")
+    for client, (queries, first, last, rcodes) in sorted(clients.items(), key=lambda item: -item[1][0]):
+        print(f"{client:<40}{queries:>8}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first)):<20}"
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last)):<20}{','.join(sorted(rcodes)) or '-'}")
+    print(f"{len(clients)} clients resolved {domain} in the last {since:g}s ({elapsed:.1f} ms)")
+
+
+def main(argv=None):
+    global INLINE
+    args = parse_args(argv)
+    if args.query:
+        if not args.store:
+            logging.critical("--query needs --store DIR")
+            return
+        query_store(args.store, args.query, args.since)
+        return
+
+    pool = None
+    on_frame = handle_frame
+    factory = analyzer_factory(args.log_packets, args.store)
+    if args.workers > 0:
+        pool = dnspipeline.AnalysisPool(args.workers, analyzer_factory=factory, lossless=bool(args.pcap))
+        on_frame = pool.submit
+        logging.info(f"Analyzing with {args.workers} worker processes.")
+    else:
+        INLINE = dnspipeline.InlineAnalysis(analyzer_factory=factory)
+
+    try:
+        if args.pcap:
+            logging.info(f"Replaying DNS traffic from capture file: {args.pcap}")
+            try:
+                replay_pcap(args.pcap, on_frame)
+            except (OSError, dnspcap.PcapError) as e:
+                logging.critical(f"Could not replay {args.pcap}: {e}")
+            return
+        capture(args, on_frame)
+    finally:
+        if pool is not None:
+            pool.close()
+        if INLINE is not None:
+            INLINE.close()
+        logging.info("DNS traffic analysis finished.")
+
+
+def capture(args, on_frame):
+    logging.info(f"Starting DNS traffic analysis on interface: {args.interface if args.interface else 'auto-selected'}")
+    logging.info(f"Capturing {args.count if args.count > 0 else 'infinite'} packets or for {args.timeout if args.timeout > 0 else 'no'} seconds...")
     logging.info("Press Ctrl+C to stop the capture.")
 
+    backend = CAPTURE_BACKEND
+    if backend == 'auto':
+        backend = 'raw' if hasattr(socket, 'AF_PACKET') else 'scapy'
     try:
-        sniff(
-            filter="udp port 53 or tcp port 53", # BPF filter for DNS traffic (UDP or TCP)
-            prn=dns_parser,                      # Function to call for each packet
-            store=0,                             # Do not store packets in memory (save resources)
-            iface=INTERFACE,                     # Specify network interface
-            count=COUNT,                         # Number of packets to capture
-            timeout=TIMEOUT                      # Timeout for sniffing
-        )
+        if backend == 'raw':
+            capture_raw(args.interface, args.count, args.timeout, on_frame)
+        else:
+            capture_scapy(args.interface, args.count, args.timeout or None, on_frame)
+    except KeyboardInterrupt:
+        pass
     except PermissionError:
         logging.critical("Permission denied. You might need to run this script with root/administrator privileges (e.g., sudo python3 script.py).")
     except ImportError:
@@ -132,7 +383,5 @@ def main():
     except Exception as e:
         logging.critical(f"An error occurred during sniffing: {e}")
 
-    logging.info("DNS traffic analysis finished.")
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+"""
+Memory-mapped pcap / pcapng reader used by dnsanalyzer.py --pcap.
+
+The capture file is mapped read-only and frames are yielded as memoryview
+slices of the mapping, so replaying a file copies no packet data. Classic
+pcap (micro- and nanosecond, either byte order) and pcapng (section header,
+interface description, enhanced/simple/obsolete packet blocks, per-interface
+timestamp resolution) are supported.
+"""
+import mmap
+import struct
+
+PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+
+class PcapError(ValueError):
+    """Raised for files that are not valid pcap/pcapng captures."""
+
+
+def iter_frames(path):
+    """
+    Yields (timestamp, frame, linktype) for every packet in a pcap or pcapng
+    file. ``frame`` is a memoryview into the mapped file and is only valid
+    until the generator is closed or exhausted; copy it with bytes() to keep it.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+    view = memoryview(mapped)
+    try:
+        magic = bytes(view[:4])
+        if magic in PCAP_MAGICS:
+            yield from _iter_pcap(view, *PCAP_MAGICS[magic])
+        elif magic == PCAPNG_SHB:
+            yield from _iter_pcapng(view)
+        else:
+            raise PcapError(f"{path}: not a pcap or pcapng file")
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # caller still holds a frame; the mapping closes once it is released
+
+
+def _iter_pcap(view, order, resolution):
+    if len(view) < 24:
+        raise PcapError("truncated pcap global header")
+    linktype = struct.unpack_from(order + 'I', view, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(order + 'IIII')
+    pos, size = 24, len(view)
+    while pos + 16 <= size:
+        seconds, fraction, caplen, _origlen = record.unpack_from(view, pos)
+        pos += 16
+        if pos + caplen > size:
+            break  # truncated final packet
+        yield seconds + fraction * resolution, view[pos:pos + caplen], linktype
+        pos += caplen
+
+
+def _iter_pcapng(view):
+    size = len(view)
+    pos = 0
+    order = '<'
+    interfaces = []  # (linktype, seconds per timestamp unit)
+    while pos + 12 <= size:
+        block_type = struct.unpack_from(order + 'I', view, pos)[0]
+        if block_type == 0x0A0D0D0A:
+            bom = bytes(view[pos + 8:pos + 12])
+            if bom == b'\x4d\x3c\x2b\x1a':
+                order = '<'
+            elif bom == b'\x1a\x2b\x3c\x4d':
+                order = '>'
+            else:
+                raise PcapError("bad pcapng byte-order magic")
+            interfaces = []
+        length = struct.unpack_from(order + 'I', view, pos + 4)[0]
+        if length < 12 or pos + length > size:
+            break
+        body = pos + 8
+        if block_type == 1:  # interface description
+            linktype = struct.unpack_from(order + 'H', view, body)[0]
+            interfaces.append((linktype, _ts_resolution(view, body + 8, pos + length - 4, order)))
+        elif block_type == 6:  # enhanced packet
+            iface, high, low, caplen = struct.unpack_from(order + 'IIII', view, body)
+            _check_caplen(caplen, length, "enhanced")
+            linktype, resolution = interfaces[iface] if iface < len(interfaces) else (1, 1e-6)
+            data = body + 20
+            yield ((high << 32) | low) * resolution, view[data:data + caplen], linktype
+        elif block_type == 3:  # simple packet: no timestamp, interface 0
+            origlen = struct.unpack_from(order + 'I', view, body)[0]
+            caplen = min(origlen, length - 16)
+            linktype = interfaces[0][0] if interfaces else 1
+            yield None, view[body + 4:body + 4 + caplen], linktype
+        elif block_type == 2:  # obsolete packet block
+            iface, _drops, high, low, caplen = struct.unpack_from(order + 'HHIII', view, body)
+            _check_caplen(caplen, length, "obsolete")
+            linktype, resolution = interfaces[iface] if iface < len(interfaces) else (1, 1e-6)
+            data = body + 20
+            yield ((high << 32) | low) * resolution, view[data:data + caplen], linktype
+        pos += length
+
+
+def _check_caplen(caplen, length, kind):
+    # 28 header bytes (type, length, interface, timestamp, caplen, origlen) and the trailing length.
+    if caplen > length - 32:
+        raise PcapError(f"{kind} packet block: captured length {caplen} exceeds block length {length}")
+
+
+def _ts_resolution(view, pos, end, order):
+    """Reads the if_tsresol option of an interface description block (default: microseconds)."""
+    while pos + 4 <= end:
+        code, length = struct.unpack_from(order + 'HH', view, pos)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            value = view[pos + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        pos += 4 + ((length + 3) & ~3)
+    return 1e-6
@@ -0,0 +1,528 @@
+"""
+Multi-core DNS analysis pipeline used by dnsanalyzer.py --workers N.
+
+    capture loop -> FrameRing -> dispatcher thread -> one queue per worker -> worker processes
+                                                                                  |
+    main process (writes the log) <------------- results queue <------------------+
+
+The capture loop only copies each frame into a bounded ring buffer. A
+dispatcher thread drains the ring in batches and shards frames across worker
+processes by flow. The flow key is the same in both directions, so a query
+and its response go to the same worker in arrival order. Workers decode with
+dnswire and run a DNSAnalyzer. The log events they produce are sent back and
+written by the main process, which owns the log file. Periodic Reports from
+the workers are merged there first, so an aggregate over all flows is still
+logged as one line.
+
+Every stage counts what it loses: the ring buffer when capture outruns
+dispatch, each worker queue when its worker falls behind, and frames the
+workers could not decode. Kernel socket drops are reported by capture_raw().
+"""
+import collections
+import functools
+import logging
+import multiprocessing
+import queue
+import signal
+import struct
+import threading
+import time
+
+import dnswire
+from dnswire import QTYPE_NAMES, RCODE_NAMES
+
+_ports = struct.Struct('!HH').unpack_from
+
+
+# --- Log events ---
+
+def packet_events(pkt):
+    """
+    Yields (level, message) log events for a dnswire.DNSPacket: one per
+    query, one per answer and one per error response without answers.
+    """
+    dns = pkt.dns
+    if not dns.qr and dns.qname is not None:
+        qtype_readable = QTYPE_NAMES.get(dns.qtype, str(dns.qtype))
+        yield logging.INFO, (
+            f"[{pkt.protocol} DNS QUERY] "
+            f"Src: {pkt.src}, Dst: {pkt.dst}, "
+            f"Domain: {dns.qname}, Type: {qtype_readable}"
+        )
+    elif dns.qr and dns.answers:
+        for ans in dns.answers:
+            atype_readable = QTYPE_NAMES.get(ans.rtype, str(ans.rtype))
+            yield logging.INFO, (
+                f"[{pkt.protocol} DNS RESPONSE] "
+                f"Src: {pkt.src}, Dst: {pkt.dst}, "
+                f"Domain: {ans.name}, Type: {atype_readable}, Answer: {ans.data}"
+            )
+    elif dns.qr and dns.rcode != 0:
+        rcode_readable = RCODE_NAMES.get(dns.rcode, f"Unknown Error {dns.rcode}")
+        query_name = dns.qname if dns.qname is not None else "N/A"
+        yield logging.WARNING, (
+            f"[{pkt.protocol} DNS ERROR RESPONSE] "
+            f"Src: {pkt.src}, Dst: {pkt.dst}, "
+            f"Query: {query_name}, Rcode: {rcode_readable}"
+        )
+
+
+class Report:
+    """
+    Periodic aggregate produced by a stage.
+
+    Reports with the same ``key`` and ``period`` (the period start, a Unix
+    timestamp) coming from several workers are merged by calling
+    ``render(period, [data, ...])``, which returns (level, message) events.
+    ``render`` and ``data`` cross process boundaries, so ``render`` must be a
+    module-level function and ``data`` plain picklable values.
+    """
+    __slots__ = ('key', 'period', 'data', 'render')
+
+    def __init__(self, key, period, data, render):
+        self.key = key
+        self.period = period
+        self.data = data
+        self.render = render
+
+
+class EventSink:
+    """
+    Logs analyzer events through ``emit(level, message)``.
+
+    Reports are held until all ``sources`` analyzers sent theirs for a
+    period, every source has moved on to a later period, or ``max_delay``
+    seconds have passed (a worker that sees no traffic sends nothing), then
+    merged and rendered.
+    """
+
+    def __init__(self, emit=logging.log, sources=1, max_delay=30.0):
+        self.emit = emit
+        self.sources = sources
+        self.max_delay = max_delay
+        self._pending = {}  # (key, period) -> (render, [data, ...], first arrival)
+        self._latest = {}   # key -> {source: latest period reported}
+
+    def put(self, events, source=None):
+        added = False
+        for event in events:
+            if isinstance(event, Report):
+                slot = self._pending.get((event.key, event.period))
+                if slot is None:
+                    slot = self._pending[event.key, event.period] = (event.render, [], time.monotonic())
+                slot[1].append(event.data)
+                latest = self._latest.setdefault(event.key, {})
+                latest[source] = max(latest.get(source, event.period), event.period)
+                added = True
+            else:
+                self.emit(*event)
+        if added:
+            self.release()
+
+    def release(self):
+        """Renders every held period that is complete or has waited ``max_delay``."""
+        now = time.monotonic()
+        for key, period in sorted(self._pending, key=lambda item: item[1]):
+            _render, datas, since = self._pending[key, period]
+            latest = self._latest.get(key, {})
+            moved_on = len(latest) >= self.sources and all(p > period for p in latest.values())
+            if len(datas) >= self.sources or moved_on or now - since >= self.max_delay:
+                self._render(key, period)
+
+    def _render(self, key, period):
+        render, datas, _since = self._pending.pop((key, period))
+        self.put(render(period, datas))
+
+    def flush(self):
+        for key, period in sorted(self._pending, key=lambda item: item[1]):
+            self._render(key, period)
+
+
+class PacketClock:
+    """
+    Time as seen in packet timestamps, split into report periods aligned to
+    multiples of ``interval``. A replayed capture is therefore reported in
+    the same periods it would have been live.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.now = None
+        self.period = None
+        self._wall = None
+
+    def advance(self, ts):
+        """Moves the clock to ``ts`` (never backwards). Returns the start of the period that just ended, or None."""
+        if self.now is None or ts > self.now:
+            self.now = ts
+        self._wall = time.monotonic()
+        period = self.now - self.now % self.interval
+        if self.period is None:
+            self.period = period
+        elif period > self.period:
+            ended, self.period = self.period, period
+            return ended
+        return None
+
+    def idle_time(self):
+        """Estimated packet time while idle: last packet time plus wall time since it arrived."""
+        if self.now is None:
+            return None
+        return self.now + (time.monotonic() - self._wall)
+
+
+class PacketLogStage:
+    """Analysis stage that turns every DNS packet into its log lines."""
+
+    def handle(self, pkt):
+        return list(packet_events(pkt))
+
+
+# --- Per-worker analysis ---
+
+class DNSAnalyzer:
+    """
+    Decodes frames and runs each DNS packet through a list of stages.
+
+    A stage implements handle(pkt) and may implement tick(now) and close();
+    all three return a list of events, each a (level, message) pair or a
+    Report. tick() is called about once a second, also when no traffic arrives.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = list(stages) if stages is not None else [PacketLogStage()]
+        self.frames = 0
+        self.dns_packets = 0
+        self.malformed = 0
+
+    def handle_frame(self, frame, linktype=dnswire.LINKTYPE_ETHERNET, ts=None):
+        self.frames += 1
+        try:
+            pkt = dnswire.parse_frame(frame, linktype, ts)
+        except dnswire.DNSError as e:
+            self.malformed += 1
+            return [(logging.ERROR, f"Error parsing DNS packet from {e.src} to {e.dst}: {e}")]
+        if pkt is None:
+            return []
+        self.dns_packets += 1
+        events = []
+        for stage in self.stages:
+            events.extend(stage.handle(pkt))
+        return events
+
+    def tick(self, now):
+        return self._call_all('tick', now)
+
+    def close(self):
+        return self._call_all('close')
+
+    def _call_all(self, name, *args):
+        events = []
+        for stage in self.stages:
+            method = getattr(stage, name, None)
+            if method is not None:
+                events.extend(method(*args))
+        return events
+
+    def stats(self):
+        return {'frames': self.frames, 'dns_packets': self.dns_packets, 'malformed': self.malformed}
+
+
+def build_analyzer(log_packets=True, track_transactions=True, transaction_timeout=5.0,
+                   transaction_table_size=100000, report_interval=60.0, heavy_hitters=True,
+                   sketch_width=2048, sketch_depth=4, top_capacity=200, top_n=20, score_names=True,
+                   score_batch_size=512, store_dir=None, store_segment_rows=262144, store_segment_seconds=300.0):
+    """Builds the DNSAnalyzer configured by dnsanalyzer.py; used as the worker factory."""
+    import dnsscore  # these import Report and PacketClock from this module
+    import dnssketch
+    import dnsstore
+    import dnstracker
+
+    stages = []
+    if log_packets:
+        stages.append(PacketLogStage())
+    if track_transactions:
+        stages.append(dnstracker.TransactionTable(transaction_timeout, transaction_table_size, report_interval))
+    if heavy_hitters:
+        stages.append(dnssketch.HeavyHitters(report_interval, sketch_width, sketch_depth, top_capacity, top_n))
+    if score_names:
+        stages.append(dnsscore.TunnelScorer(score_batch_size, report_interval))
+    if store_dir:
+        stages.append(dnsstore.EventStoreWriter(store_dir, store_segment_rows, store_segment_seconds))
+    return DNSAnalyzer(stages)
+
+
+def analyzer_factory(**options):
+    """Picklable zero-argument factory for build_analyzer(**options)."""
+    return functools.partial(build_analyzer, **options)
+
+
+class InlineAnalysis:
+    """Runs a DNSAnalyzer on the calling thread; the single-process counterpart of AnalysisPool."""
+
+    def __init__(self, emit=logging.log, analyzer_factory=DNSAnalyzer, tick_interval=1.0):
+        self.analyzer = analyzer_factory()
+        self.sink = EventSink(emit)
+        self.tick_interval = tick_interval
+        self._next_tick = time.monotonic() + tick_interval
+
+    def submit(self, frame, linktype=dnswire.LINKTYPE_ETHERNET, ts=None):
+        """Analyzes one frame. Returns True for DNS frames, including malformed ones."""
+        analyzer = self.analyzer
+        before = analyzer.dns_packets + analyzer.malformed
+        self.sink.put(analyzer.handle_frame(frame, linktype, ts))
+        now = time.monotonic()
+        if now >= self._next_tick:
+            self.sink.put(analyzer.tick(time.time()))
+            self._next_tick = now + self.tick_interval
+        return analyzer.dns_packets + analyzer.malformed > before
+
+    def close(self):
+        self.sink.put(self.analyzer.close())
+        self.sink.flush()
+
+
+# --- Capture -> dispatch ring buffer ---
+
+class FrameRing:
+    """
+    Bounded FIFO of (ts, frame, linktype) between the capture loop and the
+    dispatcher. put() drops the new frame when full unless ``block`` is set.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.pushed = 0
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item, block=False):
+        with self._cond:
+            while len(self._items) >= self.capacity:
+                if not block or self._closed:
+                    self.dropped += 1
+                    return False
+                self._cond.wait()
+            if not self._items:
+                self._cond.notify()
+            self._items.append(item)
+            self.pushed += 1
+            return True
+
+    def get_batch(self, max_items, timeout=None):
+        """Returns up to ``max_items`` frames, waiting up to ``timeout`` for the first."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            batch = []
+            items = self._items
+            while items and len(batch) < max_items:
+                batch.append(items.popleft())
+            if batch:
+                self._cond.notify()
+            return batch
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def finished(self):
+        with self._cond:
+            return self._closed and not self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+def flow_key(frame, linktype=dnswire.LINKTYPE_ETHERNET):
+    """
+    Direction-independent flow key: (proto, lower endpoint, higher endpoint).
+    Returns None for frames that are not UDP/TCP to or from port 53.
+    """
+    located = dnswire.transport(frame, linktype)
+    if located is None:
+        return None
+    src, dst, proto, pos = located
+    sport, dport = _ports(frame, pos)
+    a, b = (src, sport), (dst, dport)
+    return (proto,) + (a + b if a <= b else b + a)
+
+
+# --- Worker processes ---
+
+def _worker_main(index, inbox, results, analyzer_factory, tick_interval):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the main process decides when to stop
+    analyzer = analyzer_factory()
+    next_tick = time.monotonic() + tick_interval
+    while True:
+        try:
+            batch = inbox.get(timeout=tick_interval)
+        except queue.Empty:
+            batch = ()
+        if batch is None:
+            break
+        events = []
+        for ts, frame, linktype in batch:
+            events.extend(analyzer.handle_frame(frame, linktype, ts))
+        if time.monotonic() >= next_tick:
+            events.extend(analyzer.tick(time.time()))
+            next_tick = time.monotonic() + tick_interval
+        if events or batch:
+            results.put(('events', index, events, analyzer.stats()))
+    results.put(('done', index, analyzer.close(), analyzer.stats()))
+
+
+class AnalysisPool:
+    """
+    Runs DNSAnalyzer instances in ``workers`` processes behind a FrameRing.
+
+    submit() is called from the capture loop and never blocks unless
+    ``lossless`` is set (used for pcap replay, where nothing should be lost).
+    ``emit(level, message)`` receives the workers' events in the main process.
+    ``analyzer_factory`` is called once in each worker and must be picklable.
+    close() terminates a worker that has not finished ``stop_timeout``
+    seconds after its last frames were queued.
+    """
+
+    def __init__(self, workers, emit=logging.log, analyzer_factory=DNSAnalyzer, ring_capacity=65536,
+                 queue_batches=64, batch_size=256, lossless=False, tick_interval=1.0, stats_interval=60.0,
+                 stop_timeout=10.0):
+        if workers < 1:
+            raise ValueError("AnalysisPool needs at least one worker")
+        self.emit = emit
+        self.sink = EventSink(emit, sources=workers)
+        self.batch_size = batch_size
+        self.lossless = lossless
+        self.stats_interval = stats_interval
+        self.stop_timeout = stop_timeout
+        self.ring = FrameRing(ring_capacity)
+        self.filtered = 0
+        self.queue_dropped = [0] * workers
+        self.worker_stats = [{} for _ in range(workers)]
+        context = multiprocessing.get_context()
+        self._inboxes = [context.Queue(queue_batches) for _ in range(workers)]
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(target=_worker_main, name=f"dns-worker-{index}",
+                            args=(index, inbox, self._results, analyzer_factory, tick_interval), daemon=True)
+            for index, inbox in enumerate(self._inboxes)
+        ]
+        for process in self._processes:
+            process.start()
+        self._dispatcher = threading.Thread(target=self._dispatch, name='dns-dispatcher', daemon=True)
+        self._collector = threading.Thread(target=self._collect, name='dns-collector', daemon=True)
+        self._dispatcher.start()
+        self._collector.start()
+
+    def submit(self, frame, linktype=dnswire.LINKTYPE_ETHERNET, ts=None):
+        """Copies a frame into the ring buffer. Returns False if it was dropped."""
+        return self.ring.put((ts, bytes(frame), linktype), block=self.lossless)
+
+    def _dispatch(self):
+        shards = len(self._inboxes)
+        pending = [[] for _ in range(shards)]
+        while not self.ring.finished():
+            batch = self.ring.get_batch(self.batch_size, timeout=0.1)
+            for item in batch:
+                key = flow_key(item[1], item[2])
+                if key is None:
+                    self.filtered += 1
+                    continue
+                shard = hash(key) % shards
+                pending[shard].append(item)
+                if len(pending[shard]) >= self.batch_size:
+                    self._send(shard, pending[shard])
+                    pending[shard] = []
+            if len(batch) < self.batch_size:  # caught up: don't hold frames back
+                for shard, items in enumerate(pending):
+                    if items:
+                        self._send(shard, items)
+                        pending[shard] = []
+        for shard, items in enumerate(pending):
+            if items:
+                self._send(shard, items)
+        for shard in range(shards):
+            self._put(shard, None)
+
+    def _send(self, shard, items):
+        if self.lossless:
+            if not self._put(shard, items):
+                self.queue_dropped[shard] += len(items)
+            return
+        try:
+            self._inboxes[shard].put_nowait(items)
+        except queue.Full:
+            self.queue_dropped[shard] += len(items)
+
+    def _put(self, shard, item):
+        """Waits for room in a worker's queue while the worker is alive. Returns False if it died."""
+        while True:
+            try:
+                self._inboxes[shard].put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if not self._processes[shard].is_alive():
+                    return False
+
+    def _collect(self):
+        running = set(range(len(self._processes)))
+        next_stats = time.monotonic() + self.stats_interval
+        while running:
+            try:
+                kind, index, events, stats = self._results.get(timeout=0.5)
+            except queue.Empty:
+                self.sink.release()
+                for index in list(running):
+                    if not self._processes[index].is_alive():
+                        running.discard(index)
+                        self.emit(logging.ERROR, f"DNS worker {index} exited unexpectedly")
+                continue
+            self.worker_stats[index] = stats
+            self.sink.put(events, source=index)
+            if kind == 'done':
+                running.discard(index)
+            if self.stats_interval and time.monotonic() >= next_stats:
+                self.emit(logging.INFO, self.stats_line())
+                next_stats = time.monotonic() + self.stats_interval
+
+    def stats(self):
+        """Per-stage counters: ring, dispatcher, worker queues and workers."""
+        totals = collections.Counter()
+        for stats in self.worker_stats:
+            totals.update(stats)
+        return {
+            'ring_pushed': self.ring.pushed,
+            'ring_dropped': self.ring.dropped,
+            'ring_depth': len(self.ring),
+            'filtered': self.filtered,
+            'queue_dropped': sum(self.queue_dropped),
+            'queue_dropped_per_worker': list(self.queue_dropped),
+            'frames': totals['frames'],
+            'dns_packets': totals['dns_packets'],
+            'malformed': totals['malformed'],
+        }
+
+    def stats_line(self):
+        s = self.stats()
+        return (
+            f"Pipeline: {s['ring_pushed']} frames queued, {s['ring_dropped']} dropped at ring buffer, "
+            f"{s['filtered']} non-DNS filtered, {s['queue_dropped']} dropped at worker queues "
+            f"{s['queue_dropped_per_worker']}, {s['dns_packets']} DNS packets analyzed, {s['malformed']} malformed"
+        )
+
+    def close(self):
+        """Drains everything already submitted, stops the workers and logs the final counters."""
+        self.ring.close()
+        self._dispatcher.join()
+        for process in self._processes:
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                self.emit(logging.ERROR, f"{process.name} did not stop, terminating it")
+                process.terminate()
+                process.join()
+        self._collector.join()
+        self.sink.flush()
+        self.emit(logging.INFO, self.stats_line())
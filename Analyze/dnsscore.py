@@ -0,0 +1,343 @@
+"""
+Batch scoring of query names for DNS tunneling and DGA traffic.
+
+TunnelScorer is a DNSAnalyzer stage that collects query names into batches
+of ``batch_size``. For each batch it computes, over the name minus its
+public suffix:
+
+    entropy      Shannon entropy of the characters, in bits
+    max_label    longest label
+    mean_label   mean label length
+    labels       number of labels
+    digit_ratio  share of digits among the characters
+    bigram       mean log-probability of adjacent character pairs under a
+                 model of ordinary hostnames (random strings score low)
+
+With NumPy installed, a batch is encoded into one padded uint8 matrix and
+every feature is computed with whole-array operations. Without it, the same
+features are computed per name in pure Python. Per apex it counts distinct
+subdomains per report period in a table bounded by ``max_apexes`` (least
+recently seen apex evicted). When the period ends, or its apex is evicted,
+every apex with a suspicious name or ``subdomain_threshold`` distinct
+subdomains produces one "[DNS ALERT]" JSON record carrying the counts of the
+whole period.
+
+With dnsanalyzer.py --workers, frames are sharded by flow, so each worker
+counts only the queries of its own flows: the subdomains of one apex queried
+from several clients or ports are spread over the workers, and
+``subdomain_threshold`` applies to each worker's share.
+"""
+import collections
+import json
+import logging
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # pure-Python scoring
+
+from dnspipeline import PacketClock
+
+# Registrable suffixes spanning two labels; everything else is treated as a one-label TLD.
+MULTI_LABEL_SUFFIXES = frozenset((
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'com.au', 'net.au', 'org.au', 'co.nz', 'co.jp', 'ne.jp',
+    'or.jp', 'com.br', 'com.cn', 'net.cn', 'org.cn', 'co.in', 'co.kr', 'com.mx', 'com.tr', 'co.za',
+))
+
+# Words that make up ordinary hostnames; the bigram model is trained on them.
+_HOSTNAME_CORPUS = '''
+www mail smtp imap pop webmail login account accounts auth api apis cdn static assets images img media
+video videos news blog shop store cart checkout pay payment payments secure support help docs developer
+developers dev test staging prod production app apps mobile web server servers cloud host hosting service
+services portal admin dashboard status search maps drive calendar photos music play games game update
+updates download downloads mirror files file share sync backup data analytics metrics tracking ads ad
+advertising marketing email newsletter social community forum forums wiki chat message messages connect
+network internet online global local office microsoft google apple amazon facebook twitter github gitlab
+windows linux ubuntu debian android firefox mozilla chrome safari outlook teams zoom slack office live
+akamai cloudflare fastly edge gateway proxy router remote vpn time clock weather sports finance bank
+banking health music stream streaming content delivery origin frontend backend internal corp company
+university school library research science north south east west europe america asia central primary
+secondary master slave node cluster region zone public private telemetry events event push notify
+notifications client clients user users profile profiles identity signin signup register config
+'''
+
+_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789-_'
+_OTHER = len(_ALPHABET)
+_SYMBOLS = _OTHER + 1
+
+
+def _char_code(char):
+    index = _ALPHABET.find(char)
+    return index if index >= 0 else _OTHER
+
+
+def _train_bigrams():
+    counts = [[1.0] * _SYMBOLS for _ in range(_SYMBOLS)]  # add-one smoothing
+    for word in _HOSTNAME_CORPUS.split():
+        for a, b in zip(word, word[1:]):
+            counts[_char_code(a)][_char_code(b)] += 1
+    table = []
+    for row in counts:
+        total = sum(row)
+        table.append([math.log(count / total) for count in row])
+    return table
+
+
+_BIGRAM_LOGP = _train_bigrams()
+if np is not None:
+    _CODE_LUT = np.full(256, _OTHER, dtype=np.intp)
+    for _index, _char in enumerate(_ALPHABET):
+        _CODE_LUT[ord(_char)] = _index
+    _BIGRAM_TABLE = np.array(_BIGRAM_LOGP, dtype=np.float64).ravel()
+
+
+def split_name(qname):
+    """Returns (apex, subdomain, body) for a query name; body is the name without its public suffix."""
+    labels = qname.lower().rstrip('.').split('.')
+    suffix = 2 if len(labels) > 2 and '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    if len(labels) <= suffix:
+        return qname.lower(), '', ''
+    apex = '.'.join(labels[-(suffix + 1):])
+    return apex, '.'.join(labels[:-(suffix + 1)]), '.'.join(labels[:-suffix])
+
+
+# --- Feature extraction ---
+
+FEATURES = ('entropy', 'max_label', 'mean_label', 'labels', 'digit_ratio', 'bigram')
+
+
+def name_features(bodies, use_numpy=None):
+    """
+    Computes FEATURES for a list of name bodies (see split_name).
+    Returns a dict mapping each feature to a list of floats, one per body.
+    """
+    bodies = [body.encode('ascii', 'replace').decode('ascii') for body in bodies]
+    if use_numpy is None:
+        use_numpy = np is not None
+    if not bodies:
+        return {name: [] for name in FEATURES}
+    return _features_numpy(bodies) if use_numpy else _features_python(bodies)
+
+
+def _features_numpy(bodies):
+    n = len(bodies)
+    width = max(1, max(len(body) for body in bodies))
+    lengths = np.fromiter((len(body) for body in bodies), dtype=np.intp, count=n)
+    raw = np.frombuffer(''.join(body.ljust(width, '\0') for body in bodies).encode('ascii'), dtype=np.uint8)
+    raw = raw.reshape(n, width)
+    positions = np.arange(width)
+    valid = positions < lengths[:, None]
+    chars = valid & (raw != ord('.'))
+    nchars = chars.sum(axis=1)
+    safe_nchars = np.maximum(nchars, 1)
+
+    # Character entropy, H = log2(N) - sum(c * log2(c)) / N, from one bincount
+    # over (row, byte) pairs of the whole batch; only nonzero counts are summed.
+    rows = np.broadcast_to(np.arange(n)[:, None], raw.shape)
+    counts = np.bincount(rows[chars] * 256 + raw[chars], minlength=n * 256)
+    present = np.flatnonzero(counts)
+    c = counts[present].astype(np.float64)
+    clogc = np.bincount(present // 256, weights=c * np.log2(c), minlength=n)
+    entropy = np.where(nchars > 0, np.log2(safe_nchars) - clogc / safe_nchars, 0.0)
+
+    # Label lengths: distance to the last separator (or the start) at every position.
+    resets = np.where(chars, -1, positions)
+    last_reset = np.maximum.accumulate(resets, axis=1)
+    run = np.where(chars, positions - last_reset, 0)
+    max_label = run.max(axis=1)
+    labels = np.where(lengths > 0, (valid & ~chars).sum(axis=1) + 1, 0)
+    mean_label = nchars / np.maximum(labels, 1)
+
+    digits = chars & (raw >= ord('0')) & (raw <= ord('9'))
+    digit_ratio = digits.sum(axis=1) / safe_nchars
+
+    codes = _CODE_LUT[raw]
+    pairs = chars[:, :-1] & chars[:, 1:]
+    logp = _BIGRAM_TABLE[codes[:, :-1] * _SYMBOLS + codes[:, 1:]]
+    pair_counts = pairs.sum(axis=1)
+    bigram = np.where(pair_counts > 0, (logp * pairs).sum(axis=1) / np.maximum(pair_counts, 1), 0.0)
+
+    return {
+        'entropy': entropy.tolist(),
+        'max_label': max_label.astype(float).tolist(),
+        'mean_label': mean_label.tolist(),
+        'labels': labels.astype(float).tolist(),
+        'digit_ratio': digit_ratio.tolist(),
+        'bigram': bigram.tolist(),
+    }
+
+
+def _features_python(bodies):
+    result = {name: [] for name in FEATURES}
+    for body in bodies:
+        labels = body.split('.') if body else []
+        text = body.replace('.', '')
+        size = len(text)
+        entropy = 0.0
+        for count in collections.Counter(text).values():
+            p = count / size
+            entropy -= p * math.log2(p)
+        pairs = [(a, b) for label in labels for a, b in zip(label, label[1:])]
+        bigram = sum(_BIGRAM_LOGP[_char_code(a)][_char_code(b)] for a, b in pairs) / len(pairs) if pairs else 0.0
+        result['entropy'].append(entropy)
+        result['max_label'].append(float(max((len(label) for label in labels), default=0)))
+        result['mean_label'].append(size / len(labels) if labels else 0.0)
+        result['labels'].append(float(len(labels)))
+        result['digit_ratio'].append(sum(char.isdigit() for char in text) / size if size else 0.0)
+        result['bigram'].append(bigram)
+    return result
+
+
+# --- Stage ---
+
+class _ApexState:
+    __slots__ = ('subdomains', 'queries', 'suspicious', 'reasons', 'sample', 'last')
+
+    def __init__(self):
+        self.subdomains = set()
+        self.queries = 0
+        self.suspicious = 0
+        self.reasons = []
+        self.sample = None  # first suspicious name: (ts, client, qname, values)
+        self.last = None    # latest name, reported when only the subdomain count trips
+
+
+class TunnelScorer:
+    """
+    DNSAnalyzer stage flagging query names that look like tunneling or DGA output.
+
+    batch_size         names scored together
+    report_interval    seconds per apex counting window; alerts are emitted when it ends
+    max_apexes         apexes tracked at once
+    max_subdomains     distinct subdomains remembered per apex
+    entropy_threshold  bits; applied to names of at least ``min_length`` characters
+    label_threshold    longest label length considered suspicious
+    bigram_threshold   mean bigram log-probability below which a name looks random;
+                       applied to names of at least ``bigram_min_length`` characters
+    subdomain_threshold  distinct subdomains of one apex within a window
+    """
+
+    def __init__(self, batch_size=512, report_interval=60.0, max_apexes=10000, max_subdomains=1024,
+                 entropy_threshold=4.0, min_length=16, label_threshold=40, bigram_threshold=-3.5,
+                 bigram_min_length=10, subdomain_threshold=200, use_numpy=None):
+        self.batch_size = batch_size
+        self.max_apexes = max_apexes
+        self.max_subdomains = max_subdomains
+        self.entropy_threshold = entropy_threshold
+        self.min_length = min_length
+        self.label_threshold = label_threshold
+        self.bigram_threshold = bigram_threshold
+        self.bigram_min_length = bigram_min_length
+        self.subdomain_threshold = subdomain_threshold
+        self.use_numpy = use_numpy
+        self.scored = 0
+        self.alerts = 0
+        self._clock = PacketClock(report_interval)
+        self._apexes = collections.OrderedDict()
+        self._batch = []   # (ts, client, qname, apex, subdomain)
+        self._bodies = []
+
+    # --- Stage interface ---
+
+    def handle(self, pkt):
+        events = []
+        ts = pkt.ts if pkt.ts is not None else time.time()
+        if self._clock.advance(ts) is not None:
+            events.extend(self._end_period())
+        dns = pkt.dns
+        if dns.qr or not dns.qname:
+            return events
+        apex, subdomain, body = split_name(dns.qname)
+        self._batch.append((ts, pkt.src, dns.qname, apex, subdomain))
+        self._bodies.append(body)
+        if len(self._batch) >= self.batch_size:
+            events.extend(self._flush())
+        return events
+
+    def tick(self, now):
+        events = self._flush()
+        ts = self._clock.idle_time()
+        if ts is not None and self._clock.advance(ts) is not None:
+            events.extend(self._end_period())
+        return events
+
+    def close(self):
+        return self._end_period()
+
+    # --- Scoring ---
+
+    def _flush(self):
+        if not self._batch:
+            return []
+        batch, bodies = self._batch, self._bodies
+        self._batch, self._bodies = [], []
+        features = name_features(bodies, self.use_numpy)
+        self.scored += len(batch)
+        events = []
+        for index, (ts, client, qname, apex, subdomain) in enumerate(batch):
+            state = self._apex(apex, events)
+            state.queries += 1
+            if subdomain and len(state.subdomains) < self.max_subdomains:
+                state.subdomains.add(subdomain)
+            values = {name: features[name][index] for name in FEATURES}
+            state.last = (ts, client, qname, values)
+            reasons = self._reasons(len(bodies[index]), values)
+            if reasons:
+                state.suspicious += 1
+                state.reasons.extend(reason for reason in reasons if reason not in state.reasons)
+                if state.sample is None:
+                    state.sample = state.last
+        return events
+
+    def _end_period(self):
+        events = self._flush()
+        for apex, state in self._apexes.items():
+            self._alert(apex, state, events)
+        self._apexes.clear()
+        return events
+
+    def _apex(self, apex, events):
+        apexes = self._apexes
+        state = apexes.get(apex)
+        if state is None:
+            state = apexes[apex] = _ApexState()
+            if len(apexes) > self.max_apexes:
+                self._alert(*apexes.popitem(last=False), events)
+        else:
+            apexes.move_to_end(apex)
+        return state
+
+    def _reasons(self, length, values):
+        """Name-level reasons; the subdomain count is judged per apex in _alert."""
+        reasons = []
+        if length >= self.min_length and values['entropy'] >= self.entropy_threshold:
+            reasons.append('high_entropy')
+        if values['max_label'] >= self.label_threshold:
+            reasons.append('long_label')
+        if length >= self.bigram_min_length and values['bigram'] <= self.bigram_threshold:
+            reasons.append('unlikely_bigrams')
+        return reasons
+
+    def _alert(self, apex, state, events):
+        """Appends the alert for an apex leaving the table, if it tripped any threshold."""
+        reasons = list(state.reasons)
+        if len(state.subdomains) >= self.subdomain_threshold:
+            reasons.append('many_subdomains')
+        if not reasons:
+            return
+        ts, client, qname, values = state.sample or state.last
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(ts)),
+            'client': client,
+            'qname': qname,
+            'apex': apex,
+            'reasons': reasons,
+            'apex_queries': state.queries,
+            'apex_suspicious': state.suspicious,
+            'apex_subdomains': len(state.subdomains),
+        }
+        record.update((name, round(value, 3)) for name, value in values.items())
+        self.alerts += 1
+        events.append((logging.WARNING, f"[DNS ALERT] {json.dumps(record)}"))
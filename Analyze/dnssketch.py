@@ -0,0 +1,248 @@
+"""
+Fixed-memory heavy-hitter aggregation for dnsanalyzer.py.
+
+HeavyHitters is a DNSAnalyzer stage that tracks the busiest query names,
+query types, clients and NXDOMAIN receivers with a count-min sketch plus a
+space-saving top-K summary per dimension. Memory is
+``sketch_width * sketch_depth`` counters plus ``top_capacity`` entries per
+dimension, however much traffic passes. Once per report period it emits a
+single structured "[DNS TOP]" record. Both structures merge by addition, so
+per-worker snapshots combine into one record.
+
+Each reported key has ``count``, the smaller of its space-saving count and
+its count-min estimate (both can only overestimate), and ``at_least``, the
+space-saving guaranteed lower bound.
+"""
+import array
+import hashlib
+import heapq
+import json
+import logging
+import time
+
+from dnspipeline import PacketClock, Report
+from dnswire import QTYPE_NAMES
+
+DIMENSIONS = ('domains', 'qtypes', 'clients', 'nxdomain_clients')
+NXDOMAIN = 3  # RCODE_NAMES[3]
+
+
+class CountMinSketch:
+    """
+    Count-min sketch with ``depth`` rows of ``width`` counters.
+
+    Row indexes come from one 64-bit BLAKE2b hash split in two (double
+    hashing), so sketches built in different processes are compatible.
+    """
+
+    def __init__(self, width=2048, depth=4, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array.array('q', bytes(8 * width * depth))
+
+    def _indexes(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+        h1, h2 = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        table = self.table
+        for index in self._indexes(key):
+            table[index] += count
+
+    def estimate(self, key):
+        table = self.table
+        return min(table[index] for index in self._indexes(key))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("cannot merge count-min sketches of different shapes")
+        table = self.table
+        for index, value in enumerate(other.table):
+            if value:
+                table[index] += value
+
+
+class SpaceSaving:
+    """
+    Space-saving top-K summary (Metwally et al.) over at most ``capacity`` keys.
+
+    Monitored keys are counted in a dict. The minimum is found through a heap
+    whose entries may be stale: an entry only ever understates its key's
+    count, so a popped entry that is current is the true minimum. Updates
+    to monitored keys are O(1); displacing the minimum is O(log capacity).
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def add(self, key, count=1):
+        counts = self.counts
+        current = counts.get(key)
+        if current is not None:
+            counts[key] = current + count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (count, key))
+            return
+        heap = self._heap
+        while True:
+            low, victim = heap[0]
+            actual = counts[victim]
+            if actual == low:
+                break
+            heapq.heapreplace(heap, (actual, victim))
+        heapq.heapreplace(heap, (low + count, key))
+        del counts[victim]
+        del self.errors[victim]
+        counts[key] = low + count
+        self.errors[key] = low
+
+
+def merge_summaries(summaries, capacity):
+    """
+    Merges space-saving snapshots given as (capacity, {key: [count, error]})
+    pairs. A key missing from a full summary may still have been counted
+    there up to that summary's floor, which is added to its count and error.
+    """
+    floors = []
+    keys = set()
+    for summary_capacity, entries in summaries:
+        floors.append(min(c for c, _e in entries.values()) if len(entries) >= summary_capacity else 0)
+        keys.update(entries)
+    merged = {}
+    for key in keys:
+        count = error = 0
+        for (_capacity, entries), floor in zip(summaries, floors):
+            entry = entries.get(key)
+            if entry is None:
+                count += floor
+                error += floor
+            else:
+                count += entry[0]
+                error += entry[1]
+        merged[key] = (count, error)
+    top = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[:capacity]
+    return dict(top)
+
+
+class HeavyHitters:
+    """
+    DNSAnalyzer stage keeping per-period top-K counts of query names, query
+    types, clients and clients receiving NXDOMAIN.
+
+    report_interval  seconds per snapshot
+    sketch_width     counters per count-min row
+    sketch_depth     count-min rows
+    top_capacity     keys monitored per dimension by space-saving
+    top_n            keys listed per dimension in each snapshot
+    """
+
+    def __init__(self, report_interval=60.0, sketch_width=2048, sketch_depth=4, top_capacity=200, top_n=20):
+        self.report_interval = report_interval
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.top_capacity = top_capacity
+        self.top_n = top_n
+        self._clock = PacketClock(report_interval)
+        self._reset()
+
+    def _reset(self):
+        self._sketches = {name: CountMinSketch(self.sketch_width, self.sketch_depth) for name in DIMENSIONS}
+        self._tops = {name: SpaceSaving(self.top_capacity) for name in DIMENSIONS}
+        self._queries = 0
+        self._responses = 0
+
+    def _count(self, dimension, key):
+        self._sketches[dimension].add(key)
+        self._tops[dimension].add(key)
+
+    # --- Stage interface ---
+
+    def handle(self, pkt):
+        events = self._advance(pkt.ts if pkt.ts is not None else time.time())
+        dns = pkt.dns
+        if not dns.qr:
+            self._queries += 1
+            if dns.qname is not None:
+                self._count('domains', dns.qname.lower())
+                self._count('qtypes', QTYPE_NAMES.get(dns.qtype, str(dns.qtype)))
+            self._count('clients', pkt.src)
+        else:
+            self._responses += 1
+            if dns.rcode == NXDOMAIN:
+                self._count('nxdomain_clients', pkt.dst)
+        return events
+
+    def tick(self, now):
+        ts = self._clock.idle_time()
+        return self._advance(ts) if ts is not None else []
+
+    def close(self):
+        if self._clock.period is None:
+            return []
+        return [self._snapshot(self._clock.period)]
+
+    def _advance(self, ts):
+        ended = self._clock.advance(ts)
+        if ended is None:
+            return []
+        events = [self._snapshot(ended)]
+        self._reset()
+        return events
+
+    def _snapshot(self, period):
+        data = {
+            'interval': self.report_interval,
+            'top_n': self.top_n,
+            'queries': self._queries,
+            'responses': self._responses,
+            'dimensions': {
+                name: {
+                    'width': self.sketch_width,
+                    'depth': self.sketch_depth,
+                    'table': self._sketches[name].table.tobytes(),
+                    'capacity': self.top_capacity,
+                    'top': {key: [count, self._tops[name].errors[key]]
+                            for key, count in self._tops[name].counts.items()},
+                }
+                for name in DIMENSIONS
+            },
+        }
+        return Report('dns-top', period, data, render_top_report)
+
+
+def render_top_report(period, datas):
+    """Merges HeavyHitters snapshots for one period into a single JSON record."""
+    first = datas[0]
+    record = {
+        'window_start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(period)),
+        'interval': first['interval'],
+        'queries': sum(data['queries'] for data in datas),
+        'responses': sum(data['responses'] for data in datas),
+    }
+    for name in DIMENSIONS:
+        parts = [data['dimensions'][name] for data in datas]
+        sketch = None
+        for part in parts:
+            table = array.array('q')
+            table.frombytes(part['table'])
+            piece = CountMinSketch(part['width'], part['depth'], table)
+            if sketch is None:
+                sketch = piece
+            else:
+                sketch.merge(piece)
+        top = merge_summaries([(part['capacity'], part['top']) for part in parts], first['dimensions'][name]['capacity'])
+        ranked = sorted(
+            ((key, min(count, sketch.estimate(key)), max(0, count - error)) for key, (count, error) in top.items()),
+            key=lambda item: (-item[1], item[0]),
+        )[:first['top_n']]
+        record[name] = [{'key': key, 'count': count, 'at_least': floor} for key, count, floor in ranked]
+    return [(logging.INFO, f"[DNS TOP] {json.dumps(record)}")]
+
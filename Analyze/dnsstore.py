@@ -0,0 +1,340 @@
+"""
+Append-only columnar store of DNS events, read through mmap.
+
+Layout under the store directory:
+
+    shard-<pid>-<start>/           one per writing process (inline analyzer or worker)
+        seg-<first ts>-<seq>/      one sealed segment, immutable once renamed into place
+            meta.json              rows, time range, format version
+            ts.f8                  float64 packet timestamps, sorted ascending
+            client.ip server.ip    16-byte addresses (IPv4 as ::ffff:a.b.c.d)
+            qtype.u2 rcode.u1 flags.u1
+            domain.u4              ids into the segment's domain dictionary
+            dict.bin dict.off      sorted lowercase domain names and their offsets
+            post.rows post.off     postings: row numbers of each domain id, ascending
+
+Rows are buffered by EventStoreWriter and written as a segment every
+``segment_rows`` rows or ``segment_seconds`` seconds. A segment becomes
+visible only when its directory is renamed into place, so readers never see
+partial data. EventStore maps only the columns a query touches. A lookup
+filters segments by meta.json's time range, binary-searches the sorted
+dictionary, reads the domain's postings and bisects them by timestamp.
+"""
+import array
+import bisect
+import collections
+import json
+import mmap
+import os
+import socket
+import time
+
+FORMAT_VERSION = 1
+FLAG_RESPONSE = 0x01
+FLAG_TCP = 0x02
+_V4_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+StoredEvent = collections.namedtuple(
+    'StoredEvent', 'ts client server domain qtype rcode response protocol')
+
+
+def pack_ip(text):
+    if ':' in text:
+        return socket.inet_pton(socket.AF_INET6, text)
+    return _V4_PREFIX + socket.inet_aton(text)
+
+
+def unpack_ip(packed):
+    packed = bytes(packed)
+    if packed.startswith(_V4_PREFIX):
+        return socket.inet_ntoa(packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+# --- Writing ---
+
+class EventStoreWriter:
+    """
+    DNSAnalyzer stage appending one row per query and per response to a
+    shard of the store at ``directory``.
+    """
+
+    def __init__(self, directory, segment_rows=262144, segment_seconds=300.0):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.shard = os.path.join(directory, f"shard-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}")
+        os.makedirs(self.shard, exist_ok=True)
+        self.rows_written = 0
+        self.segments_written = 0
+        self._sequence = 0
+        self._reset()
+
+    def _reset(self):
+        self._ts = array.array('d')
+        self._client = bytearray()
+        self._server = bytearray()
+        self._qtype = array.array('H')
+        self._rcode = bytearray()
+        self._flags = bytearray()
+        self._domain = array.array('I')
+        self._ids = {}
+        self._opened = time.monotonic()
+
+    # --- Stage interface ---
+
+    def handle(self, pkt):
+        dns = pkt.dns
+        name = (dns.qname or '').lower()
+        domain_id = self._ids.get(name)
+        if domain_id is None:
+            domain_id = self._ids[name] = len(self._ids)
+        if dns.qr:
+            client, server = pkt.dst, pkt.src
+        else:
+            client, server = pkt.src, pkt.dst
+        self._ts.append(pkt.ts if pkt.ts is not None else time.time())
+        self._client += pack_ip(client)
+        self._server += pack_ip(server)
+        self._qtype.append(dns.qtype or 0)
+        self._rcode.append(dns.rcode if dns.qr else 0)
+        self._flags.append((FLAG_RESPONSE if dns.qr else 0) | (FLAG_TCP if pkt.protocol == "TCP" else 0))
+        self._domain.append(domain_id)
+        if len(self._ts) >= self.segment_rows:
+            self.seal()
+        return []
+
+    def tick(self, now):
+        if self._ts and time.monotonic() - self._opened >= self.segment_seconds:
+            self.seal()
+        return []
+
+    def close(self):
+        self.seal()
+        return []
+
+    # --- Sealing ---
+
+    def seal(self):
+        """Writes the buffered rows as a new segment. Returns its path, or None if nothing was buffered."""
+        rows = len(self._ts)
+        if not rows:
+            self._opened = time.monotonic()
+            return None
+        ts = self._ts
+        order = sorted(range(rows), key=ts.__getitem__)  # nearly sorted input: close to linear
+
+        names = sorted(self._ids, key=lambda name: name.encode('utf-8', 'surrogatepass'))
+        remap = array.array('I', bytes(4 * len(names)))
+        for new_id, name in enumerate(names):
+            remap[self._ids[name]] = new_id
+
+        columns = {
+            'ts.f8': array.array('d', (ts[i] for i in order)),
+            'client.ip': _gather(self._client, order, 16),
+            'server.ip': _gather(self._server, order, 16),
+            'qtype.u2': array.array('H', (self._qtype[i] for i in order)),
+            'rcode.u1': bytes(self._rcode[i] for i in order),
+            'flags.u1': bytes(self._flags[i] for i in order),
+        }
+        domain = array.array('I', (remap[self._domain[i]] for i in order))
+        columns['domain.u4'] = domain
+
+        encoded = [name.encode('utf-8', 'surrogatepass') for name in names]
+        dict_off = array.array('I', [0])
+        for raw in encoded:
+            dict_off.append(dict_off[-1] + len(raw))
+        columns['dict.bin'] = b''.join(encoded)
+        columns['dict.off'] = dict_off
+
+        counts = array.array('I', bytes(4 * len(names)))
+        for domain_id in domain:
+            counts[domain_id] += 1
+        post_off = array.array('I', [0])
+        for count in counts:
+            post_off.append(post_off[-1] + count)
+        fill = array.array('I', post_off[:-1])
+        post_rows = array.array('I', bytes(4 * rows))
+        for row, domain_id in enumerate(domain):
+            post_rows[fill[domain_id]] = row
+            fill[domain_id] += 1
+        columns['post.rows'] = post_rows
+        columns['post.off'] = post_off
+
+        first, last = columns['ts.f8'][0], columns['ts.f8'][-1]
+        self._sequence += 1
+        name = f"seg-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(first))}-{self._sequence:06d}"
+        final = os.path.join(self.shard, name)
+        tmp = os.path.join(self.shard, '.' + name + '.tmp')
+        os.makedirs(tmp)
+        for filename, data in columns.items():
+            with open(os.path.join(tmp, filename), 'wb') as f:
+                f.write(data)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': FORMAT_VERSION, 'rows': rows, 'domains': len(names),
+                       'min_ts': first, 'max_ts': last}, f)
+        os.rename(tmp, final)
+        self.rows_written += rows
+        self.segments_written += 1
+        self._reset()
+        return final
+
+
+def _gather(buffer, order, width):
+    out = bytearray(len(order) * width)
+    view = memoryview(buffer)
+    pos = 0
+    for i in order:
+        out[pos:pos + width] = view[i * width:(i + 1) * width]
+        pos += width
+    return out
+
+
+# --- Reading ---
+
+class Segment:
+    """A sealed segment; columns are mapped on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported segment format {meta.get('version')}")
+        self.rows = meta['rows']
+        self.domains = meta['domains']
+        self.min_ts = meta['min_ts']
+        self.max_ts = meta['max_ts']
+        self._maps = {}
+
+    def column(self, filename, typecode=None):
+        """Returns the column as a memoryview over the mapped file (cast to ``typecode``)."""
+        entry = self._maps.get(filename)
+        if entry is None:
+            with open(os.path.join(self.path, filename), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    entry = (None, memoryview(b''))
+                else:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    entry = (mapped, memoryview(mapped))
+            self._maps[filename] = entry
+        view = entry[1]
+        return view.cast(typecode) if typecode else view
+
+    def close(self):
+        maps, self._maps = self._maps, {}
+        for mapped, view in maps.values():
+            view.release()
+            if mapped is not None:
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # a caller still holds a slice; closed when it is released
+
+    def domain_id(self, domain):
+        """Binary-searches the sorted dictionary; returns the id or None."""
+        target = domain.lower().encode('utf-8', 'surrogatepass')
+        names = self.column('dict.bin')
+        offsets = self.column('dict.off', 'I')
+        lo, hi = 0, self.domains
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = names[offsets[mid]:offsets[mid + 1]].tobytes()
+            if name < target:
+                lo = mid + 1
+            elif name > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def rows_for(self, domain, start=None, end=None):
+        """Row numbers holding ``domain`` with start <= ts <= end, ascending."""
+        domain_id = self.domain_id(domain)
+        if domain_id is None:
+            return []
+        offsets = self.column('post.off', 'I')
+        rows = self.column('post.rows', 'I')[offsets[domain_id]:offsets[domain_id + 1]]
+        ts = self.column('ts.f8', 'd')
+        key = ts.__getitem__
+        lo = 0 if start is None else bisect.bisect_left(_KeyedView(rows, key), start)
+        hi = len(rows) if end is None else bisect.bisect_right(_KeyedView(rows, key), end)
+        return rows[lo:hi].tolist()
+
+    def event(self, row):
+        client = self.column('client.ip')[row * 16:(row + 1) * 16]
+        server = self.column('server.ip')[row * 16:(row + 1) * 16]
+        domain_id = self.column('domain.u4', 'I')[row]
+        offsets = self.column('dict.off', 'I')
+        flags = self.column('flags.u1')[row]
+        return StoredEvent(
+            ts=self.column('ts.f8', 'd')[row],
+            client=unpack_ip(client),
+            server=unpack_ip(server),
+            domain=self.column('dict.bin')[offsets[domain_id]:offsets[domain_id + 1]].tobytes().decode('utf-8', 'surrogatepass'),
+            qtype=self.column('qtype.u2', 'H')[row],
+            rcode=self.column('rcode.u1')[row],
+            response=bool(flags & FLAG_RESPONSE),
+            protocol="TCP" if flags & FLAG_TCP else "UDP",
+        )
+
+
+class _KeyedView:
+    """Sequence view applying ``key`` to each item, for bisect on Python < 3.10."""
+    __slots__ = ('items', 'key')
+
+    def __init__(self, items, key):
+        self.items = items
+        self.key = key
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.key(self.items[index])
+
+
+class EventStore:
+    """Read access to every sealed segment under ``directory``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._segments = {}
+
+    def segments(self, start=None, end=None):
+        """Sealed segments overlapping [start, end], oldest first. New segments are picked up on each call."""
+        found = []
+        for shard in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else ():
+            shard_path = os.path.join(self.directory, shard)
+            if not shard.startswith('shard-') or not os.path.isdir(shard_path):
+                continue
+            for name in sorted(os.listdir(shard_path)):
+                if not name.startswith('seg-'):
+                    continue
+                path = os.path.join(shard_path, name)
+                segment = self._segments.get(path)
+                if segment is None:
+                    segment = self._segments[path] = Segment(path)
+                if (start is None or segment.max_ts >= start) and (end is None or segment.min_ts <= end):
+                    found.append(segment)
+        found.sort(key=lambda segment: segment.min_ts)
+        return found
+
+    def find(self, domain, start=None, end=None):
+        """Yields StoredEvents for ``domain`` (queries and responses) with start <= ts <= end."""
+        for segment in self.segments(start, end):
+            for row in segment.rows_for(domain, start, end):
+                yield segment.event(row)
+
+    def who_resolved(self, domain, start=None, end=None):
+        """Returns {client: number of queries} for ``domain`` in the time range."""
+        clients = collections.Counter()
+        for event in self.find(domain, start, end):
+            if not event.response:
+                clients[event.client] += 1
+        return clients
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
@@ -0,0 +1,248 @@
+"""
+DNS query/response correlation for dnsanalyzer.py.
+
+TransactionTable is a DNSAnalyzer stage that matches each response to its
+query by (txid, client, server, client port, qname). For every resolver it
+produces a latency histogram, timeout counts and an rcode breakdown. Open
+transactions are kept in insertion order, so expiring the oldest is O(1).
+The table is capped at ``max_entries``: once it is full the oldest query
+is evicted and counted, not silently forgotten.
+
+Time is taken from packet timestamps, so a replayed capture yields the same
+latencies it would have had live. Reports cover fixed periods aligned to
+multiples of ``report_interval`` and merge across worker processes (see
+dnspipeline.Report).
+"""
+import collections
+import logging
+import time
+
+from dnspipeline import PacketClock, Report
+from dnswire import QTYPE_NAMES, RCODE_NAMES
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, mergeable by adding counts."""
+    __slots__ = ('counts', 'total', 'sum_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def add(self, latency_ms):
+        index = 0
+        for bound in LATENCY_BUCKETS_MS:
+            if latency_ms <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_ms += latency_ms
+
+    def merge(self, counts, sum_ms):
+        for index, count in enumerate(counts):
+            self.counts[index] += count
+        self.total += sum(counts)
+        self.sum_ms += sum_ms
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (None when empty, inf past the last bound)."""
+        if not self.total:
+            return None
+        rank = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float('inf')
+        return float('inf')
+
+
+class ResolverStats:
+    """Per-resolver counters for one report period."""
+    __slots__ = ('queries', 'answered', 'retransmits', 'timeouts', 'histogram', 'rcodes', 'timeout_qtypes')
+
+    def __init__(self):
+        self.queries = 0
+        self.answered = 0
+        self.retransmits = 0
+        self.timeouts = 0
+        self.histogram = LatencyHistogram()
+        self.rcodes = collections.Counter()
+        self.timeout_qtypes = collections.Counter()
+
+    def to_dict(self):
+        return {
+            'queries': self.queries, 'answered': self.answered, 'retransmits': self.retransmits,
+            'timeouts': self.timeouts, 'buckets': list(self.histogram.counts), 'sum_ms': self.histogram.sum_ms,
+            'rcodes': dict(self.rcodes), 'timeout_qtypes': dict(self.timeout_qtypes),
+        }
+
+
+class TransactionTable:
+    """
+    DNSAnalyzer stage correlating queries with responses.
+
+    timeout          seconds after which an unanswered query counts as a timeout
+    max_entries      open transactions kept; the oldest is evicted beyond this
+    report_interval  seconds per latency report
+    """
+
+    def __init__(self, timeout=5.0, max_entries=100000, report_interval=60.0):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.report_interval = report_interval
+        self._open = collections.OrderedDict()  # key -> (sent ts, qname, qtype)
+        self._clock = PacketClock(report_interval)
+        self._reset()
+
+    def _reset(self):
+        self._resolvers = collections.defaultdict(ResolverStats)
+        self._unmatched = 0
+        self._evicted = 0
+
+    # --- Stage interface ---
+
+    def handle(self, pkt):
+        ts = pkt.ts if pkt.ts is not None else time.time()
+        events = self._advance(ts)
+        dns = pkt.dns
+        if not dns.qr:
+            key = (dns.txid, pkt.src, pkt.dst, pkt.sport, dns.qname)
+            stats = self._resolvers[pkt.dst]
+            if key in self._open:
+                stats.retransmits += 1
+                return events
+            stats.queries += 1
+            self._open[key] = (ts, dns.qname, dns.qtype)
+            if len(self._open) > self.max_entries:
+                self._open.popitem(last=False)
+                self._evicted += 1
+        else:
+            entry = self._open.pop((dns.txid, pkt.dst, pkt.src, pkt.dport, dns.qname), None)
+            if entry is None:
+                self._unmatched += 1
+                return events
+            stats = self._resolvers[pkt.src]
+            stats.answered += 1
+            stats.histogram.add(max(0.0, ts - entry[0]) * 1000.0)
+            stats.rcodes[RCODE_NAMES.get(dns.rcode, f"Unknown Error {dns.rcode}")] += 1
+        return events
+
+    def tick(self, now):
+        # Queries must still time out while the network is idle.
+        ts = self._clock.idle_time()
+        return self._advance(ts) if ts is not None else []
+
+    def close(self):
+        if self._clock.period is None:
+            return []
+        self._expire(self._clock.now)
+        report = self._report(self._clock.period, pending=len(self._open))
+        self._open.clear()
+        return [report]
+
+    # --- Internals ---
+
+    def _advance(self, ts):
+        events = []
+        ended = self._clock.advance(ts)
+        if ended is not None:
+            self._expire(ended + self.report_interval)
+            events.append(self._report(ended))
+            self._reset()
+        self._expire(self._clock.now)
+        return events
+
+    def _expire(self, now):
+        cutoff = now - self.timeout
+        open_ = self._open
+        while open_:
+            key, (sent, _qname, qtype) = next(iter(open_.items()))
+            if sent > cutoff:
+                break
+            del open_[key]
+            stats = self._resolvers[key[2]]
+            stats.timeouts += 1
+            stats.timeout_qtypes[QTYPE_NAMES.get(qtype, str(qtype))] += 1
+
+    def _report(self, period, pending=0):
+        data = {
+            'interval': self.report_interval,
+            'resolvers': {server: stats.to_dict() for server, stats in self._resolvers.items()},
+            'unmatched': self._unmatched,
+            'evicted': self._evicted,
+            'pending': pending,
+        }
+        return Report('dns-latency', period, data, render_latency_report)
+
+
+def render_latency_report(period, datas):
+    """Merges TransactionTable reports for one period and renders one line per resolver."""
+    resolvers = {}
+    totals = collections.Counter()
+    interval = datas[0]['interval']
+    for data in datas:
+        for key in ('unmatched', 'evicted', 'pending'):
+            totals[key] += data[key]
+        for server, part in data['resolvers'].items():
+            stats = resolvers.setdefault(server, ResolverStats())
+            stats.queries += part['queries']
+            stats.answered += part['answered']
+            stats.retransmits += part['retransmits']
+            stats.timeouts += part['timeouts']
+            stats.histogram.merge(part['buckets'], part['sum_ms'])
+            stats.rcodes.update(part['rcodes'])
+            stats.timeout_qtypes.update(part['timeout_qtypes'])
+
+    window = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(period))
+    events = []
+    for server in sorted(resolvers):
+        stats = resolvers[server]
+        if not (stats.queries or stats.answered or stats.timeouts):
+            continue
+        histogram = stats.histogram
+        mean = f"{histogram.sum_ms / histogram.total:.1f}" if histogram.total else "-"
+        line = (
+            f"[DNS LATENCY] Resolver: {server}, Window: {window} +{interval:g}s, "
+            f"Queries: {stats.queries}, Answered: {stats.answered}, Timeouts: {stats.timeouts}, "
+            f"Retransmits: {stats.retransmits}, Mean: {mean} ms, "
+            f"p50: {_bound(histogram.quantile(0.5))}, p90: {_bound(histogram.quantile(0.9))}, "
+            f"p99: {_bound(histogram.quantile(0.99))}, "
+            f"Histogram: {_histogram_text(histogram.counts)}, "
+            f"Rcodes: {_counter_text(stats.rcodes)}"
+        )
+        if stats.timeout_qtypes:
+            line += f", Timeouts by type: {_counter_text(stats.timeout_qtypes)}"
+        events.append((logging.WARNING if stats.timeouts else logging.INFO, line))
+    if any(totals.values()):
+        events.append((logging.INFO, (
+            f"[DNS LATENCY] Window: {window} +{interval:g}s, Unmatched responses: {totals['unmatched']}, "
+            f"Evicted queries: {totals['evicted']}, Pending at exit: {totals['pending']}"
+        )))
+    return events
+
+
+def _bound(value):
+    if value is None:
+        return "-"
+    if value == float('inf'):
+        return f">{LATENCY_BUCKETS_MS[-1]} ms"
+    return f"<={value} ms"
+
+
+def _histogram_text(counts):
+    parts = []
+    for index, count in enumerate(counts):
+        if count:
+            label = f"<={LATENCY_BUCKETS_MS[index]}" if index < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"
+            parts.append(f"{label}:{count}")
+    return ' '.join(parts) if parts else "-"
+
+
+def _counter_text(counter):
+    return ' '.join(f"{name}={count}" for name, count in counter.most_common()) or "-"
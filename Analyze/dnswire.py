@@ -0,0 +1,316 @@
+"""
+Minimal DNS wire-format decoder used by dnsanalyzer.py.
+
+Parses link, IP, UDP/TCP and DNS headers straight out of a raw frame with
+struct.unpack_from over a memoryview, so the only copies made are the small
+name labels and rdata that end up in the result. Unlike scapy it does not
+build a layer object per protocol; non-DNS frames are rejected after a few
+header reads.
+"""
+import socket
+import struct
+
+# --- Decoding tables (shared with dnsanalyzer.py) ---
+QTYPE_NAMES = {1: 'A', 2: 'NS', 5: 'CNAME', 6: 'SOA', 12: 'PTR', 15: 'MX', 16: 'TXT', 28: 'AAAA', 255: 'ANY'}
+RCODE_NAMES = {
+    0: "NoError", 1: "FormErr", 2: "ServFail", 3: "NXDomain",
+    4: "NotImp", 5: "Refused", 6: "YXDomain", 7: "YXRRSet",
+    8: "NXRRSet", 9: "NotAuth", 10: "NotZone"
+}
+
+# --- Link types (pcap LINKTYPE_* values) ---
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+DNS_PORT = 53
+MAX_POINTER_JUMPS = 64
+
+_u16 = struct.Struct('!H').unpack_from
+_header = struct.Struct('!HHHHHH').unpack_from
+_rr_fixed = struct.Struct('!HHIH').unpack_from
+_udp_ports = struct.Struct('!HH').unpack_from
+_u32_le = struct.Struct('<I').unpack_from
+_u32_be = struct.Struct('!I').unpack_from
+
+
+class DNSError(ValueError):
+    """Raised for truncated or malformed DNS messages."""
+    src = None
+    dst = None
+
+
+class ResourceRecord:
+    __slots__ = ('name', 'rtype', 'rclass', 'ttl', 'data')
+
+    def __init__(self, name, rtype, rclass, ttl, data):
+        self.name = name
+        self.rtype = rtype
+        self.rclass = rclass
+        self.ttl = ttl
+        self.data = data
+
+    def __repr__(self):
+        return f"ResourceRecord({self.name!r}, {self.rtype}, {self.data!r})"
+
+
+class DNSMessage:
+    __slots__ = ('txid', 'qr', 'opcode', 'rcode', 'flags', 'qdcount', 'ancount',
+                 'qname', 'qtype', 'answers')
+
+    def __init__(self, txid, flags, qdcount, ancount, qname, qtype, answers):
+        self.txid = txid
+        self.flags = flags
+        self.qr = flags >> 15
+        self.opcode = (flags >> 11) & 0xF
+        self.rcode = flags & 0xF
+        self.qdcount = qdcount
+        self.ancount = ancount
+        self.qname = qname
+        self.qtype = qtype
+        self.answers = answers
+
+    def __repr__(self):
+        kind = 'response' if self.qr else 'query'
+        return f"DNSMessage({kind} id={self.txid} {self.qname!r} qtype={self.qtype} rcode={self.rcode})"
+
+
+class DNSPacket:
+    """A DNS message plus the addressing it arrived with."""
+    __slots__ = ('ts', 'src', 'dst', 'sport', 'dport', 'protocol', 'dns')
+
+    def __init__(self, ts, src, dst, sport, dport, protocol, dns):
+        self.ts = ts
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.protocol = protocol
+        self.dns = dns
+
+    def __repr__(self):
+        return f"DNSPacket({self.protocol} {self.src}:{self.sport} -> {self.dst}:{self.dport} {self.dns!r})"
+
+
+# --- DNS message ---
+
+def read_name(buf, offset):
+    """
+    Decodes a (possibly compressed) domain name starting at ``offset``.
+    Returns (name without trailing dot, offset just past the name).
+    """
+    labels = []
+    end = None
+    jumps = 0
+    size = len(buf)
+    while True:
+        if offset >= size:
+            raise DNSError("name runs past end of message")
+        length = buf[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= size:
+                raise DNSError("truncated compression pointer")
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > MAX_POINTER_JUMPS:
+                raise DNSError("compression pointer loop")
+            offset = ((length & 0x3F) << 8) | buf[offset + 1]
+            continue
+        if length & 0xC0:
+            raise DNSError(f"unsupported label type 0x{length:02x}")
+        offset += 1
+        if offset + length > size:
+            raise DNSError("label runs past end of message")
+        labels.append(bytes(buf[offset:offset + length]).decode('utf-8', 'backslashreplace'))
+        offset += length
+    return '.'.join(labels), (end if end is not None else offset)
+
+
+def render_rdata(rtype, buf, offset, length):
+    """Human-readable rdata, in the same form dnsanalyzer.py logged from scapy."""
+    if rtype == 1 and length == 4:
+        return socket.inet_ntop(socket.AF_INET, bytes(buf[offset:offset + 4]))
+    if rtype == 28 and length == 16:
+        return socket.inet_ntop(socket.AF_INET6, bytes(buf[offset:offset + 16]))
+    if rtype in (2, 5, 12):  # NS, CNAME, PTR
+        return read_name(buf, offset)[0]
+    if rtype == 15 and length >= 3:  # MX
+        preference = _u16(buf, offset)[0]
+        exchange = read_name(buf, offset + 2)[0]
+        return f"Preference:{preference} MailExchanger:{exchange}"
+    if rtype == 16:  # TXT: list of character-strings
+        strings = []
+        pos, end = offset, offset + length
+        while pos < end:
+            size = buf[pos]
+            if pos + 1 + size > end:
+                raise DNSError("TXT string runs past end of rdata")
+            strings.append(bytes(buf[pos + 1:pos + 1 + size]))
+            pos += 1 + size
+        return str(strings)
+    if rtype == 6:  # SOA
+        mname, pos = read_name(buf, offset)
+        rname, pos = read_name(buf, pos)
+        serial, refresh, retry, expire, minimum = struct.unpack_from('!IIIII', buf, pos)
+        return f"{mname} {rname} {serial} {refresh} {retry} {expire} {minimum}"
+    return str(bytes(buf[offset:offset + length]))
+
+
+def parse_message(buf, offset=0):
+    """Parses the header, first question and answer section of a DNS message."""
+    buf = memoryview(buf)[offset:]
+    if len(buf) < 12:
+        raise DNSError("message shorter than DNS header")
+    txid, flags, qdcount, ancount, _nscount, _arcount = _header(buf, 0)
+    pos = 12
+    qname, qtype = None, None
+    for index in range(qdcount):
+        name, pos = read_name(buf, pos)
+        if pos + 4 > len(buf):
+            raise DNSError("truncated question")
+        if index == 0:
+            qname, qtype = name, _u16(buf, pos)[0]
+        pos += 4
+    answers = []
+    for _ in range(ancount):
+        name, pos = read_name(buf, pos)
+        if pos + 10 > len(buf):
+            raise DNSError("truncated resource record")
+        rtype, rclass, ttl, rdlength = _rr_fixed(buf, pos)
+        pos += 10
+        if pos + rdlength > len(buf):
+            raise DNSError("rdata runs past end of message")
+        try:
+            data = render_rdata(rtype, buf, pos, rdlength)
+        except (struct.error, IndexError):
+            raise DNSError(f"malformed rdata for type {rtype}") from None
+        answers.append(ResourceRecord(name, rtype, rclass, ttl, data))
+        pos += rdlength
+    return DNSMessage(txid, flags, qdcount, ancount, qname, qtype, answers)
+
+
+# --- Link, network and transport layers ---
+
+def _network_offset(frame, linktype):
+    """Returns (ethertype, offset of the network header) for a frame, or (None, None)."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None, None
+        ethertype = _u16(frame, 12)[0]
+        offset = 14
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= offset + 4:  # 802.1Q / QinQ
+            ethertype = _u16(frame, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not len(frame):
+            return None, None
+        version = frame[0] >> 4
+        return (0x0800 if version == 4 else 0x86DD if version == 6 else None), 0
+    if linktype == LINKTYPE_LINUX_SLL:
+        return (_u16(frame, 14)[0], 16) if len(frame) >= 16 else (None, None)
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return (_u16(frame, 0)[0], 20) if len(frame) >= 20 else (None, None)
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(frame) < 4:
+            return None, None
+        family = _u32_le(frame, 0)[0]
+        if family > 0xFFFF:
+            family = _u32_be(frame, 0)[0]
+        if family == 2:
+            return 0x0800, 4
+        if family in (10, 24, 28, 30):  # AF_INET6 on Linux / BSDs / macOS
+            return 0x86DD, 4
+    return None, None
+
+
+_IPV6_EXTENSIONS = (0, 43, 60)  # hop-by-hop, routing, destination options
+
+
+def transport(frame, linktype=LINKTYPE_ETHERNET):
+    """
+    Locates the transport header of a UDP or TCP frame to or from port 53.
+    Returns (src, dst, proto number, transport offset) or None; the ports
+    are checked before the addresses are formatted, so other traffic costs
+    no inet_ntop calls.
+    """
+    ethertype, offset = _network_offset(frame, linktype)
+    if ethertype == 0x0800:
+        if len(frame) < offset + 20:
+            return None
+        ihl = (frame[offset] & 0x0F) * 4
+        if _u16(frame, offset + 6)[0] & 0x1FFF:
+            return None  # non-first fragment: no transport header
+        proto, pos = frame[offset + 9], offset + ihl
+        family, addr, size = socket.AF_INET, offset + 12, 4
+    elif ethertype == 0x86DD:
+        if len(frame) < offset + 40:
+            return None
+        proto, pos = frame[offset + 6], offset + 40
+        while proto in _IPV6_EXTENSIONS or proto == 44:
+            if len(frame) < pos + 8:
+                return None
+            if proto == 44:  # fragment header
+                if _u16(frame, pos + 2)[0] & 0xFFF8:
+                    return None
+                proto, pos = frame[pos], pos + 8
+            else:
+                proto, pos = frame[pos], pos + (frame[pos + 1] + 1) * 8
+        family, addr, size = socket.AF_INET6, offset + 8, 16
+    else:
+        return None
+    if proto not in (6, 17) or len(frame) < pos + 4:
+        return None
+    sport, dport = _udp_ports(frame, pos)
+    if sport != DNS_PORT and dport != DNS_PORT:
+        return None
+    src = socket.inet_ntop(family, bytes(frame[addr:addr + size]))
+    dst = socket.inet_ntop(family, bytes(frame[addr + size:addr + 2 * size]))
+    return src, dst, proto, pos
+
+
+def parse_frame(frame, linktype=LINKTYPE_ETHERNET, ts=None):
+    """
+    Decodes a captured frame into a DNSPacket.
+
+    Returns None for frames that are not UDP/TCP port 53 or that carry no
+    complete DNS message (e.g. a TCP segment without the full message).
+    Raises DNSError for DNS payloads that are malformed.
+    """
+    frame = memoryview(frame)
+    located = transport(frame, linktype)
+    if located is None:
+        return None
+    src, dst, proto, pos = located
+    if proto == 17:
+        if len(frame) < pos + 8:
+            return None
+        sport, dport = _udp_ports(frame, pos)
+        payload = frame[pos + 8:pos + _u16(frame, pos + 4)[0]]
+        protocol = "UDP"
+    elif proto == 6:
+        if len(frame) < pos + 20:
+            return None
+        sport, dport = _udp_ports(frame, pos)
+        payload = frame[pos + (frame[pos + 12] >> 4) * 4:]
+        if len(payload) < 2 or _u16(payload, 0)[0] > len(payload) - 2:
+            return None  # handshake, ACK or a message split across segments
+        payload = payload[2:2 + _u16(payload, 0)[0]]
+        protocol = "TCP"
+    else:
+        return None
+    try:
+        message = parse_message(payload)
+    except DNSError as e:
+        e.src, e.dst = src, dst
+        raise
+    return DNSPacket(ts, src, dst, sport, dport, protocol, message)
@@ -0,0 +1,52 @@
+"""Builders for the DNS messages and link-layer frames the tests decode."""
+import socket
+import struct
+
+
+def encode_name(name):
+    return b''.join(bytes([len(label)]) + label.encode() for label in name.split('.') if label) + b'\0'
+
+
+def query(name, qtype=1, txid=0x1234):
+    return struct.pack('!HHHHHH', txid, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack('!HH', qtype, 1)
+
+
+def response(name, address=None, txid=0x1234, rcode=0, qtype=1):
+    """A response whose answer (if ``address`` is given) names the question through a compression pointer."""
+    answers = 1 if address is not None else 0
+    message = struct.pack('!HHHHHH', txid, 0x8180 | rcode, 1, answers, 0, 0)
+    message += encode_name(name) + struct.pack('!HH', qtype, 1)
+    if address is not None:
+        family, rtype = (socket.AF_INET6, 28) if ':' in address else (socket.AF_INET, 1)
+        rdata = socket.inet_pton(family, address)
+        message += b'\xc0\x0c' + struct.pack('!HHIH', rtype, 1, 300, len(rdata)) + rdata
+    return message
+
+
+def udp(payload, sport, dport):
+    return struct.pack('!HHHH', sport, dport, 8 + len(payload), 0) + payload
+
+
+def tcp(payload, sport, dport, framed=True):
+    if framed:
+        payload = struct.pack('!H', len(payload)) + payload
+    return struct.pack('!HHIIBBHHH', sport, dport, 1, 1, 5 << 4, 0x18, 65535, 0, 0) + payload
+
+
+def ipv4(src, dst, proto, segment, fragment=0):
+    header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(segment), 1, fragment, 64, proto, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return header + segment
+
+
+def ipv6(src, dst, next_header, segment):
+    return (struct.pack('!IHBB', 6 << 28, len(segment), next_header, 64)
+            + socket.inet_pton(socket.AF_INET6, src) + socket.inet_pton(socket.AF_INET6, dst) + segment)
+
+
+def ethernet(packet, ethertype=0x0800):
+    return b'\x02' * 6 + b'\x04' * 6 + struct.pack('!H', ethertype) + packet
+
+
+def udp4_frame(message, src='10.0.0.2', dst='10.0.0.1', sport=40000, dport=53):
+    return ethernet(ipv4(src, dst, 17, udp(message, sport, dport)))
@@ -0,0 +1,79 @@
+import struct
+import pytest
+import dnspcap
+import dnswire
+from frames import query, udp4_frame
+
+FRAME = udp4_frame(query('pcap.test'))
+
+
+def pcap_bytes(frames, order='<', nanoseconds=False, linktype=1):
+    magic = 0xA1B23C4D if nanoseconds else 0xA1B2C3D4
+    data = struct.pack(order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, linktype)
+    for seconds, fraction, frame in frames:
+        data += struct.pack(order + 'IIII', seconds, fraction, len(frame), len(frame)) + frame
+    return data
+
+def block(block_type, body, order='<'):
+    body += b'\0' * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack(order + 'II', block_type, length) + body + struct.pack(order + 'I', length)
+
+def pcapng_bytes(frames, tsresol=None, order='<'):
+    data = block(0x0A0D0D0A, struct.pack(order + 'IHHq', 0x1A2B3C4D, 1, 0, -1), order)
+    options = b''
+    if tsresol is not None:
+        options = struct.pack(order + 'HH', 9, 1) + bytes([tsresol]) + b'\0' * 3 + struct.pack(order + 'HH', 0, 0)
+    data += block(1, struct.pack(order + 'HHI', dnswire.LINKTYPE_RAW, 0, 65535) + options, order)
+    for units, frame in frames:
+        data += block(6, struct.pack(order + 'IIIII', 0, units >> 32, units & 0xFFFFFFFF, len(frame), len(frame)) + frame, order)
+    return data
+
+def read(path):
+    return [(ts, bytes(frame), linktype) for ts, frame, linktype in dnspcap.iter_frames(str(path))]
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_classic_pcap_both_byte_orders(tmp_path, order):
+    path = tmp_path / 'cap.pcap'
+    path.write_bytes(pcap_bytes([(100, 250000, FRAME), (101, 0, FRAME)], order))
+    assert read(path) == [(100.25, FRAME, 1), (101.0, FRAME, 1)]
+
+def test_nanosecond_pcap_and_truncated_tail(tmp_path):
+    path = tmp_path / 'cap.pcap'
+    path.write_bytes(pcap_bytes([(7, 500000000, FRAME), (8, 0, FRAME)], nanoseconds=True)[:-10])
+    assert read(path) == [(7.5, FRAME, 1)]
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_pcapng_enhanced_packets_and_resolution(tmp_path, order):
+    packet = FRAME[14:]
+    path = tmp_path / 'cap.pcapng'
+    path.write_bytes(pcapng_bytes([(1500, packet)], tsresol=3, order=order))
+    [(ts, frame, linktype)] = read(path)
+    assert (ts, frame, linktype) == (1.5, packet, dnswire.LINKTYPE_RAW)
+    assert dnswire.parse_frame(frame, linktype).dns.qname == 'pcap.test'
+
+def test_pcapng_defaults_to_microseconds(tmp_path):
+    path = tmp_path / 'cap.pcapng'
+    path.write_bytes(pcapng_bytes([(2000000, FRAME[14:])]))
+    assert read(path)[0][0] == 2.0
+
+@pytest.mark.parametrize('block_type, header', [(6, '<IIIII'), (2, '<HHIIII')])
+def test_pcapng_caplen_past_the_block_is_rejected(tmp_path, block_type, header):
+    # Enhanced: interface, timestamp, caplen, origlen. Obsolete: interface, drops, timestamp, caplen, origlen.
+    packet = FRAME[14:]
+    caplen = len(packet) + 64
+    fields = (0, 0, 0, caplen, caplen) if block_type == 6 else (0, 0, 0, 0, caplen, caplen)
+    data = pcapng_bytes([]) + block(block_type, struct.pack(header, *fields) + packet) + pcapng_bytes([(1, packet)])
+    path = tmp_path / 'cap.pcapng'
+    path.write_bytes(data)
+    with pytest.raises(dnspcap.PcapError, match='exceeds block length'):
+        read(path)
+
+def test_empty_and_foreign_files(tmp_path):
+    empty = tmp_path / 'empty.pcap'
+    empty.write_bytes(b'')
+    assert read(empty) == []
+    text = tmp_path / 'notes.txt'
+    text.write_bytes(b'not a capture at all')
+    with pytest.raises(dnspcap.PcapError):
+        read(text)
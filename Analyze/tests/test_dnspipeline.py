@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+from dnspipeline import AnalysisPool, DNSAnalyzer, EventSink, FrameRing, Report, flow_key
+from frames import ethernet, ipv6, query, response, tcp, udp4_frame
+
+
+class CountingStage:
+    """Reports the number of DNS packets it saw in period 0 when closed."""
+
+    def __init__(self):
+        self.packets = 0
+
+    def handle(self, pkt):
+        self.packets += 1
+        return []
+
+    def close(self):
+        return [Report('count', 0, self.packets, render_count)]
+
+
+def render_count(period, datas):
+    return [(logging.INFO, f"{len(datas)} reports, {sum(datas)} packets")]
+
+
+def counting_analyzer():
+    return DNSAnalyzer([CountingStage()])
+
+
+class CrashingAnalyzer(DNSAnalyzer):
+
+    def handle_frame(self, frame, linktype=None, ts=None):
+        os._exit(3)
+
+
+def collect():
+    lines = []
+
+    def emit(level, message):
+        lines.append(message)
+    return lines, emit
+
+def test_frame_ring_drops_when_full_and_counts():
+    ring = FrameRing(capacity=2)
+    assert ring.put(1) and ring.put(2)
+    assert not ring.put(3)
+    assert (ring.pushed, ring.dropped, len(ring)) == (2, 1, 2)
+    assert ring.get_batch(10) == [1, 2]
+    assert ring.put(4)
+    ring.close()
+    assert not ring.finished()
+    assert ring.get_batch(10) == [4]
+    assert ring.finished()
+
+def test_frame_ring_blocking_put_waits_for_room():
+    ring = FrameRing(capacity=1)
+    ring.put('first')
+    writer = threading.Thread(target=ring.put, args=('second', True))
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+    assert ring.get_batch(1) == ['first']
+    writer.join(5)
+    assert ring.get_batch(1, timeout=1) == ['second']
+    assert ring.dropped == 0
+
+def test_flow_key_is_the_same_in_both_directions():
+    forward = udp4_frame(query('flow.test'), src='10.0.0.2', dst='10.0.0.1', sport=40000, dport=53)
+    backward = udp4_frame(response('flow.test', '192.0.2.1'), src='10.0.0.1', dst='10.0.0.2', sport=53, dport=40000)
+    assert flow_key(forward) == flow_key(backward) is not None
+    other_port = udp4_frame(query('flow.test'), sport=40001)
+    assert flow_key(other_port) != flow_key(forward)
+    v6 = ethernet(ipv6('2001:db8::2', '2001:db8::1', 6, tcp(query('flow.test'), 40000, 53)), 0x86DD)
+    v6_back = ethernet(ipv6('2001:db8::1', '2001:db8::2', 6, tcp(response('flow.test'), 53, 40000)), 0x86DD)
+    assert flow_key(v6) == flow_key(v6_back) is not None
+    assert flow_key(udp4_frame(query('flow.test'), dport=5353)) is None
+
+def test_event_sink_merges_reports_from_all_sources():
+    lines, emit = collect()
+    sink = EventSink(emit, sources=2)
+    sink.put([Report('count', 0, 3, render_count), (logging.INFO, 'passed through')], source=0)
+    assert lines == ['passed through']
+    sink.put([Report('count', 0, 4, render_count)], source=1)
+    assert lines == ['passed through', '2 reports, 7 packets']
+
+def test_event_sink_releases_a_period_once_every_source_moved_on():
+    lines, emit = collect()
+    sink = EventSink(emit, sources=2)
+    sink.put([Report('count', 0, 1, render_count)], source=0)
+    sink.put([Report('count', 60, 1, render_count)], source=0)
+    assert lines == []
+    sink.put([Report('count', 60, 2, render_count)], source=1)
+    assert lines == ['1 reports, 1 packets', '2 reports, 3 packets']
+
+def test_event_sink_flush_renders_incomplete_periods():
+    lines, emit = collect()
+    sink = EventSink(emit, sources=3)
+    sink.put([Report('count', 0, 5, render_count)], source=0)
+    sink.flush()
+    assert lines == ['1 reports, 5 packets']
+
+def test_pool_merges_reports_from_every_worker():
+    lines, emit = collect()
+    pool = AnalysisPool(2, emit=emit, analyzer_factory=counting_analyzer, lossless=True, stats_interval=0)
+    for port in range(40000, 40040):
+        pool.submit(udp4_frame(query('pool.test'), sport=port))
+        pool.submit(udp4_frame(response('pool.test', '192.0.2.1'), src='10.0.0.1', dst='10.0.0.2', sport=53, dport=port))
+    pool.submit(udp4_frame(query('pool.test'), dport=5353))
+    pool.close()
+    assert '2 reports, 80 packets' in lines
+    stats = pool.stats()
+    assert (stats['ring_pushed'], stats['filtered'], stats['dns_packets']) == (81, 1, 80)
+
+def test_pool_close_does_not_hang_on_a_dead_worker():
+    lines, emit = collect()
+    pool = AnalysisPool(1, emit=emit, analyzer_factory=CrashingAnalyzer, queue_batches=1, batch_size=1,
+                        lossless=True, stats_interval=0)
+    for port in range(40000, 40010):
+        pool.submit(udp4_frame(query('crash.test'), sport=port))
+    closing = threading.Thread(target=pool.close, daemon=True)
+    closing.start()
+    closing.join(30)
+    assert not closing.is_alive()
+    assert 'DNS worker 0 exited unexpectedly' in lines
+    assert pool.stats()['queue_dropped'] > 0
@@ -0,0 +1,106 @@
+import json
+import pytest
+import dnsscore
+from dnsscore import FEATURES, TunnelScorer, name_features, split_name
+from dnswire import parse_frame
+from frames import query, udp4_frame
+
+BASE = 6000.0  # start of a report period
+NAMES = [
+    'www', 'mail.example', 'a1b2c3d4e5f6a7b8c9d0.tunnel', 'login.microsoft',
+    'x' * 63 + '.y', '', '9', 'cdn-assets_01.static.example', 'mq3vz8xk2jtq7w0p.evil',
+]
+
+
+def packet(name, ts, client='10.0.0.2'):
+    return parse_frame(udp4_frame(query(name), src=client), ts=ts)
+
+def alerts(events):
+    return [json.loads(message.split(' ', 2)[2]) for _level, message in events]
+
+def scorer(**options):
+    options.setdefault('batch_size', 1)
+    return TunnelScorer(use_numpy=False, **options)
+
+def test_split_name():
+    assert split_name('A.B.Example.COM.') == ('example.com', 'a.b', 'a.b.example')
+    assert split_name('www.bbc.co.uk') == ('bbc.co.uk', 'www', 'www.bbc')
+    assert split_name('com') == ('com', '', '')
+
+@pytest.mark.skipif(dnsscore.np is None, reason='NumPy is not installed')
+def test_numpy_and_python_features_agree():
+    vectorized = name_features(NAMES, use_numpy=True)
+    plain = name_features(NAMES, use_numpy=False)
+    for name in FEATURES:
+        assert vectorized[name] == pytest.approx(plain[name]), name
+
+def test_features_of_a_name():
+    features = name_features(['ab.a1'], use_numpy=False)
+    assert features['entropy'] == [pytest.approx(1.5)]
+    assert (features['max_label'], features['mean_label'], features['labels']) == ([2.0], [2.0], [2.0])
+    assert features['digit_ratio'] == [0.25]
+    assert name_features([]) == {name: [] for name in FEATURES}
+
+@pytest.mark.parametrize('body, reasons', [
+    ('q8zk3x7vj2m9w4tb1ny6', ['high_entropy', 'unlikely_bigrams']),
+    ('q8zk3x7vj2m9w4t', ['unlikely_bigrams']),  # below min_length for entropy
+    ('a' * 40, ['long_label', 'unlikely_bigrams']),
+    ('xqzjvkwqzx', ['unlikely_bigrams']),
+    ('xqzjvkwq', []),  # below bigram_min_length
+    ('mail.server', []),
+])
+def test_each_name_threshold(body, reasons):
+    values = {name: column[0] for name, column in name_features([body], use_numpy=False).items()}
+    assert scorer()._reasons(len(body), values) == reasons
+
+def test_subdomain_threshold_counts_the_whole_period():
+    stage = scorer(subdomain_threshold=5)
+    events = []
+    for i in range(6):
+        events += stage.handle(packet(f"host{i}.many.test", BASE + i))
+    assert events == []
+    [alert] = alerts(stage.close())
+    assert alert['apex'] == 'many.test'
+    assert alert['reasons'] == ['many_subdomains']
+    assert (alert['apex_queries'], alert['apex_subdomains'], alert['apex_suspicious']) == (6, 6, 0)
+
+def test_one_alert_per_apex_per_period_with_every_reason():
+    stage = scorer(subdomain_threshold=3)
+    names = ['q8zk3x7vj2m9w4tb1ny6.evil.test', 'm4xq9z7k2vj8w3tb6ny1.evil.test', 'www.evil.test', 'www.ok.test']
+    events = []
+    for i, name in enumerate(names):
+        events += stage.handle(packet(name, BASE + i))
+    events += stage.handle(packet('p2jq7xz4kw9v3mb8tn5c.evil.test', BASE + 61))  # next period
+    [first] = alerts(events)
+    assert first['qname'] == names[0]
+    assert first['reasons'] == ['high_entropy', 'unlikely_bigrams', 'many_subdomains']
+    assert (first['apex_queries'], first['apex_suspicious'], first['apex_subdomains']) == (3, 2, 3)
+    [second] = alerts(stage.close())
+    assert (second['qname'], second['apex_queries']) == ('p2jq7xz4kw9v3mb8tn5c.evil.test', 1)
+    assert stage.alerts == 2
+
+def test_alerts_are_released_by_tick_when_idle():
+    stage = scorer(batch_size=100)
+    stage.handle(packet('q8zk3x7vj2m9w4tb1ny6.idle.test', BASE + 59.9))
+    stage._clock._wall -= 1.0  # the period ended while no packets arrived
+    assert [alert['apex'] for alert in alerts(stage.tick(None))] == ['idle.test']
+    assert stage.close() == []
+
+def test_evicted_apex_alerts_before_it_is_forgotten():
+    stage = scorer(max_apexes=2)
+    events = stage.handle(packet('q8zk3x7vj2m9w4tb1ny6.first.test', BASE))
+    events += stage.handle(packet('www.second.test', BASE + 1))
+    events += stage.handle(packet('www.third.test', BASE + 2))
+    assert [alert['apex'] for alert in alerts(events)] == ['first.test']
+    assert list(stage._apexes) == ['second.test', 'third.test']
+    events = stage.handle(packet('www.second.test', BASE + 3))
+    events += stage.handle(packet('www.fourth.test', BASE + 4))
+    assert events == [] and list(stage._apexes) == ['second.test', 'fourth.test']
+
+def test_batches_are_scored_together():
+    stage = scorer(batch_size=3)
+    for i in range(2):
+        stage.handle(packet(f"www{i}.batch.test", BASE))
+    assert stage.scored == 0
+    stage.handle(packet('www2.batch.test', BASE))
+    assert stage.scored == 3
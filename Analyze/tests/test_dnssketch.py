@@ -0,0 +1,55 @@
+import collections
+import json
+from dnssketch import CountMinSketch, HeavyHitters, SpaceSaving, merge_summaries, render_top_report
+from dnswire import parse_frame
+from frames import query, response, udp4_frame
+
+
+def test_count_min_never_underestimates_and_merges():
+    counts = collections.Counter({f"key{i}": i % 7 + 1 for i in range(500)})
+    sketch = CountMinSketch(width=64, depth=4)
+    for key, count in counts.items():
+        sketch.add(key, count)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+    other = CountMinSketch(width=64, depth=4)
+    other.add('key1', 10)
+    before = sketch.estimate('key1')
+    sketch.merge(other)
+    assert sketch.estimate('key1') >= before + 10
+
+def test_space_saving_keeps_heavy_hitters_with_error_bounds():
+    summary = SpaceSaving(capacity=5)
+    stream = ['hot'] * 50 + [f"cold{i}" for i in range(100)] + ['warm'] * 20
+    for key in stream:
+        summary.add(key)
+    assert 'hot' in summary.counts and 'warm' in summary.counts
+    assert summary.counts['hot'] - summary.errors['hot'] <= 50 <= summary.counts['hot']
+    assert len(summary.counts) == 5
+
+def test_merge_summaries_adds_floor_of_full_summaries():
+    full = (2, {'a': [10, 0], 'b': [4, 1]})
+    partial = (5, {'a': [3, 0], 'c': [7, 0]})
+    merged = merge_summaries([full, partial], capacity=3)
+    assert merged == {'a': (13, 0), 'c': (11, 4), 'b': (4, 1)}
+
+def packet(frame, ts):
+    return parse_frame(frame, ts=ts)
+
+def test_heavy_hitters_reports_each_period():
+    stage = HeavyHitters(report_interval=60.0, sketch_width=128, top_capacity=10, top_n=2)
+    for i in range(6):
+        stage.handle(packet(udp4_frame(query('Busy.example'), src=f"10.0.0.{i % 2 + 2}"), 1000.0 + i))
+    stage.handle(packet(udp4_frame(query('rare.example', qtype=28)), 1010.0))
+    nx = udp4_frame(response('gone.example', rcode=3), src='10.0.0.1', dst='10.0.0.9', sport=53, dport=40000)
+    stage.handle(packet(nx, 1011.0))
+    [report] = stage.handle(packet(udp4_frame(query('next.example')), 1090.0))
+    assert report.period == 960.0
+    [(_level, message)] = render_top_report(report.period, [report.data, report.data])
+    record = json.loads(message[len("[DNS TOP] "):])
+    assert (record['queries'], record['responses']) == (14, 2)
+    assert record['domains'][0] == {'key': 'busy.example', 'count': 12, 'at_least': 12}
+    assert len(record['domains']) == 2
+    assert record['qtypes'][0]['key'] == 'A'
+    assert record['nxdomain_clients'] == [{'key': '10.0.0.9', 'count': 2, 'at_least': 2}]
+    [last] = stage.close()
+    assert last.period == 1080.0 and last.data['queries'] == 1
@@ -0,0 +1,72 @@
+import os
+from dnsstore import EventStore, EventStoreWriter, Segment, pack_ip, unpack_ip
+from dnswire import parse_frame
+from frames import ethernet, ipv6, query, response, tcp, udp4_frame
+
+
+def test_ip_round_trip():
+    for address in ('192.0.2.7', '2001:db8::1', '::ffff:0:1'):
+        assert len(pack_ip(address)) == 16
+    assert unpack_ip(pack_ip('192.0.2.7')) == '192.0.2.7'
+    assert unpack_ip(pack_ip('2001:db8::1')) == '2001:db8::1'
+
+def write_events(directory, segment_rows):
+    writer = EventStoreWriter(str(directory), segment_rows=segment_rows)
+    frames = [
+        (udp4_frame(query('Example.com'), src='10.0.0.2'), 30.0),
+        (udp4_frame(query('other.org'), src='10.0.0.3'), 10.0),
+        (udp4_frame(response('example.com', '192.0.2.1', rcode=0), src='10.0.0.1', dst='10.0.0.2',
+                    sport=53, dport=40000), 31.0),
+        (ethernet(ipv6('2001:db8::5', '2001:db8::1', 6, tcp(query('example.com', qtype=28), 40000, 53)), 0x86DD), 20.0),
+        (udp4_frame(query('example.com'), src='10.0.0.2'), 100.0),
+    ]
+    for frame, ts in frames:
+        writer.handle(parse_frame(frame, ts=ts))
+    writer.close()
+    return writer
+
+def test_segments_are_sorted_and_queryable(tmp_path):
+    writer = write_events(tmp_path, segment_rows=4)
+    assert (writer.rows_written, writer.segments_written) == (5, 2)
+    store = EventStore(str(tmp_path))
+    try:
+        first, second = store.segments()
+        assert (first.rows, first.min_ts, first.max_ts) == (4, 10.0, 31.0)
+        assert list(first.column('ts.f8', 'd')) == [10.0, 20.0, 30.0, 31.0]
+        events = list(store.find('EXAMPLE.COM'))
+        assert [event.ts for event in events] == [20.0, 30.0, 31.0, 100.0]
+        v6, query_event, answer, _late = events
+        assert (v6.client, v6.protocol, v6.qtype) == ('2001:db8::5', 'TCP', 28)
+        assert (query_event.client, query_event.server, query_event.response) == ('10.0.0.2', '10.0.0.1', False)
+        assert (answer.client, answer.server, answer.response, answer.rcode) == ('10.0.0.2', '10.0.0.1', True, 0)
+        assert [event.ts for event in store.find('example.com', start=30.0, end=31.0)] == [30.0, 31.0]
+        assert store.segments(start=32.0, end=99.0) == []
+        assert dict(store.who_resolved('example.com', end=50.0)) == {'10.0.0.2': 1, '2001:db8::5': 1}
+        assert list(store.find('missing.example')) == []
+    finally:
+        store.close()
+
+def test_unsealed_segments_are_invisible(tmp_path):
+    writer = EventStoreWriter(str(tmp_path), segment_rows=100)
+    writer.handle(parse_frame(udp4_frame(query('pending.example')), ts=1.0))
+    store = EventStore(str(tmp_path))
+    assert store.segments() == []
+    path = writer.seal()
+    assert os.path.basename(path).startswith('seg-19700101T000001-')
+    assert [event.domain for event in store.find('pending.example')] == ['pending.example']
+    assert writer.seal() is None
+    store.close()
+
+def test_domain_dictionary_lookup(tmp_path):
+    write_events(tmp_path, segment_rows=100)
+    [segment_path] = [os.path.join(root, name) for root, dirs, _files in os.walk(str(tmp_path))
+                      for name in dirs if name.startswith('seg-')]
+    segment = Segment(segment_path)
+    try:
+        assert segment.domains == 2
+        assert segment.domain_id('example.com') == 0
+        assert segment.domain_id('other.org') == 1
+        assert segment.domain_id('zzz.example') is None
+        assert segment.rows_for('example.com', start=25.0) == [2, 3, 4]
+    finally:
+        segment.close()
@@ -0,0 +1,110 @@
+import logging
+from dnstracker import LATENCY_BUCKETS_MS, LatencyHistogram, TransactionTable, render_latency_report
+from dnswire import parse_frame
+from frames import query, response, udp4_frame
+
+BASE = 6000.0  # start of a report period
+
+
+def sent(name, ts, txid=0x1234, sport=40000, client='10.0.0.2', server='10.0.0.1'):
+    return parse_frame(udp4_frame(query(name, txid=txid), src=client, dst=server, sport=sport), ts=ts)
+
+def answered(name, ts, txid=0x1234, dport=40000, client='10.0.0.2', server='10.0.0.1', rcode=0):
+    frame = udp4_frame(response(name, '192.0.2.1', txid=txid, rcode=rcode), src=server, dst=client, sport=53, dport=dport)
+    return parse_frame(frame, ts=ts)
+
+def report(table):
+    [result] = table.close()
+    return result.data
+
+def test_response_matches_its_query():
+    table = TransactionTable(timeout=5.0)
+    table.handle(sent('a.test', BASE))
+    table.handle(sent('b.test', BASE, txid=7))
+    table.handle(answered('a.test', BASE + 0.004))
+    table.handle(answered('b.test', BASE + 0.030, txid=7, rcode=3))
+    data = report(table)
+    stats = data['resolvers']['10.0.0.1']
+    assert (stats['queries'], stats['answered'], stats['timeouts']) == (2, 2, 0)
+    assert stats['rcodes'] == {'NoError': 1, 'NXDomain': 1}
+    assert stats['buckets'][LATENCY_BUCKETS_MS.index(5)] == 1
+    assert stats['buckets'][LATENCY_BUCKETS_MS.index(50)] == 1
+    assert (data['unmatched'], data['pending']) == (0, 0)
+
+def test_response_must_match_client_server_txid_port_and_name():
+    table = TransactionTable(timeout=5.0)
+    table.handle(sent('a.test', BASE))
+    table.handle(answered('other.test', BASE + 0.01))
+    table.handle(answered('a.test', BASE + 0.01, txid=0x9999))
+    table.handle(answered('a.test', BASE + 0.01, dport=40001))
+    table.handle(answered('a.test', BASE + 0.01, server='10.0.0.9'))
+    table.handle(answered('a.test', BASE + 0.01, client='10.0.0.3'))
+    data = report(table)
+    assert data['unmatched'] == 5
+    assert data['resolvers']['10.0.0.1']['answered'] == 0
+    assert data['pending'] == 1
+
+def test_retransmitted_query_is_counted_once():
+    table = TransactionTable(timeout=5.0)
+    table.handle(sent('a.test', BASE))
+    table.handle(sent('a.test', BASE + 1))
+    stats = report(table)['resolvers']['10.0.0.1']
+    assert (stats['queries'], stats['retransmits']) == (1, 1)
+
+def test_unanswered_queries_time_out():
+    table = TransactionTable(timeout=5.0)
+    table.handle(sent('lost.test', BASE, txid=1))
+    table.handle(sent('late.test', BASE + 2, txid=2))
+    table.handle(sent('x.test', BASE + 6, txid=3))
+    table.handle(answered('late.test', BASE + 7.5, txid=2))
+    data = report(table)
+    stats = data['resolvers']['10.0.0.1']
+    assert (stats['timeouts'], stats['answered']) == (2, 0)
+    assert stats['timeout_qtypes'] == {'A': 2}
+    assert data['unmatched'] == 1  # late.test expired before its answer arrived
+    assert data['pending'] == 1
+
+def test_queries_time_out_while_idle():
+    table = TransactionTable(timeout=0.05)
+    table.handle(sent('idle.test', BASE))
+    table._clock._wall -= 1.0  # a second of wall time without packets
+    table.tick(None)
+    assert report(table)['resolvers']['10.0.0.1']['timeouts'] == 1
+
+def test_oldest_query_is_evicted_at_capacity():
+    table = TransactionTable(timeout=5.0, max_entries=2)
+    for txid in range(3):
+        table.handle(sent('full.test', BASE, txid=txid))
+    table.handle(answered('full.test', BASE + 0.001, txid=0))
+    data = report(table)
+    assert (data['evicted'], data['unmatched'], data['pending']) == (1, 1, 2)
+
+def test_report_is_emitted_when_the_period_ends():
+    table = TransactionTable(timeout=5.0, report_interval=60.0)
+    table.handle(sent('a.test', BASE + 59))
+    events = table.handle(sent('b.test', BASE + 61, txid=2))
+    assert [(event.key, event.period) for event in events] == [('dns-latency', BASE)]
+    assert events[0].data['resolvers']['10.0.0.1']['timeouts'] == 0
+    assert report(table)['resolvers']['10.0.0.1']['queries'] == 1
+
+def test_histogram_quantiles_and_merge():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    for latency in [0.5] * 50 + [15] * 40 + [400] * 9 + [9000]:
+        histogram.add(latency)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.9) == 20
+    assert histogram.quantile(0.99) == 500
+    assert histogram.quantile(1.0) == float('inf')
+    other = LatencyHistogram()
+    other.merge(histogram.counts, histogram.sum_ms)
+    assert (other.counts, other.total) == (histogram.counts, 100)
+
+def test_render_merges_reports_from_workers():
+    tables = [TransactionTable(timeout=5.0) for _ in range(2)]
+    for index, table in enumerate(tables):
+        table.handle(sent('a.test', BASE, txid=index))
+        table.handle(answered('a.test', BASE + 0.003, txid=index))
+    [(level, line)] = render_latency_report(BASE, [report(table) for table in tables])
+    assert level == logging.INFO
+    assert 'Resolver: 10.0.0.1' in line and 'Queries: 2, Answered: 2' in line and 'p50: <=5 ms' in line
@@ -0,0 +1,74 @@
+import struct
+import pytest
+import dnswire
+from dnswire import DNSError, parse_frame, parse_message, read_name, transport
+from frames import encode_name, ethernet, ipv4, ipv6, query, response, tcp, udp, udp4_frame
+
+
+def test_query_over_udp_ipv4():
+    pkt = parse_frame(udp4_frame(query('Example.COM', qtype=28)), ts=5.0)
+    assert (pkt.src, pkt.dst, pkt.sport, pkt.dport, pkt.protocol, pkt.ts) == ('10.0.0.2', '10.0.0.1', 40000, 53, 'UDP', 5.0)
+    assert (pkt.dns.qr, pkt.dns.txid, pkt.dns.qname, pkt.dns.qtype) == (0, 0x1234, 'Example.COM', 28)
+
+def test_response_answers_follow_compression_pointers():
+    frame = udp4_frame(response('example.com', '93.184.216.34'), src='10.0.0.1', dst='10.0.0.2', sport=53, dport=40000)
+    dns = parse_frame(frame).dns
+    assert dns.qr == 1 and dns.rcode == 0
+    [answer] = dns.answers
+    assert (answer.name, answer.rtype, answer.ttl, answer.data) == ('example.com', 1, 300, '93.184.216.34')
+
+def test_ipv6_and_tcp_framing():
+    frame = ethernet(ipv6('2001:db8::2', '2001:db8::1', 6, tcp(query('v6.test'), 40000, 53)), 0x86DD)
+    pkt = parse_frame(frame)
+    assert (pkt.src, pkt.dst, pkt.protocol, pkt.dns.qname) == ('2001:db8::2', '2001:db8::1', 'TCP', 'v6.test')
+
+def test_incomplete_tcp_message_is_skipped():
+    message = query('split.test')
+    frame = ethernet(ipv4('10.0.0.2', '10.0.0.1', 6, tcp(struct.pack('!H', 100) + message, 40000, 53, framed=False)))
+    assert parse_frame(frame) is None
+
+def test_raw_ip_and_vlan_link_types():
+    packet = ipv4('10.0.0.2', '10.0.0.1', 17, udp(query('raw.test'), 40000, 53))
+    assert parse_frame(packet, dnswire.LINKTYPE_RAW).dns.qname == 'raw.test'
+    tagged = ethernet(struct.pack('!HH', 7, 0x0800) + packet, 0x8100)
+    assert parse_frame(tagged).dns.qname == 'raw.test'
+
+def test_transport_ignores_other_ports_and_fragments():
+    assert transport(udp4_frame(query('x.test'), sport=40000, dport=5353)) is None
+    assert transport(ethernet(ipv4('10.0.0.2', '10.0.0.1', 1, b'\x08\x00' + b'\0' * 6))) is None
+    fragment = ethernet(ipv4('10.0.0.2', '10.0.0.1', 17, udp(query('x.test'), 40000, 53), fragment=10))
+    assert transport(fragment) is None
+    assert transport(udp4_frame(query('x.test'))) == ('10.0.0.2', '10.0.0.1', 17, 34)
+
+def test_compression_loop_is_rejected():
+    message = struct.pack('!HHHHHH', 1, 0x0100, 1, 0, 0, 0) + b'\xc0\x0c' + struct.pack('!HH', 1, 1)
+    with pytest.raises(DNSError, match='loop'):
+        parse_message(message)
+
+@pytest.mark.parametrize('message', [
+    b'\x00' * 11,
+    query('cut.test')[:-3],
+    response('example.com', '192.0.2.1')[:-2],
+])
+def test_truncated_messages_raise(message):
+    with pytest.raises(DNSError):
+        parse_message(message)
+
+def test_malformed_frame_error_carries_addresses():
+    frame = udp4_frame(b'\x00' * 5 + b'\x01' + b'\x00' * 6 + b'\x05abc')
+    with pytest.raises(DNSError) as info:
+        parse_frame(frame)
+    assert (info.value.src, info.value.dst) == ('10.0.0.2', '10.0.0.1')
+
+def test_read_name_returns_offset_after_pointer():
+    buf = b'\0' * 12 + encode_name('a.example') + b'\x03www\xc0\x0c'
+    pointer = 12 + len(encode_name('a.example'))
+    assert read_name(buf, pointer) == ('www.a.example', len(buf))
+
+def test_txt_strings_must_fit_the_rdata():
+    rdata = b'\x02hi\x03abc'
+    assert dnswire.render_rdata(16, rdata, 0, len(rdata)) == str([b'hi', b'abc'])
+    with pytest.raises(DNSError, match='TXT'):
+        dnswire.render_rdata(16, rdata + b'\x05xy', 0, len(rdata) + 3)
+    with pytest.raises(DNSError, match='TXT'):
+        dnswire.render_rdata(16, rdata + b'tail', 0, len(rdata) - 1)
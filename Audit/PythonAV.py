@@ -1,94 +1,442 @@
+import array
 import os
+import queue
+import socket
+import struct
 import subprocess
+import tempfile
+import threading
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def audit_files_with_clamav(start_path):
+# --- Configuration ---
+# clamd keeps the signature database loaded, so scanning through it avoids reloading
+# the database for every file. Set CLAMD_ADDRESS to the UNIX socket path from
+# clamd.conf (LocalSocket) or to a ("host", port) tuple (TCPSocket/TCPAddr).
+CLAMD_ADDRESS = "/var/run/clamav/clamd.ctl"
+# How files are handed to clamd:
+#   'INSTREAM'  file contents are streamed over the socket; clamd needs no access to the files
+#   'FILDES'    the open file descriptor is passed over the UNIX socket; nothing is copied
+#   'MULTISCAN' clamd walks the directory itself with its own threads; it needs read access
+SCAN_MODE = "INSTREAM"
+CONCURRENCY = 4 # Connections to clamd, each scanning one file at a time
+STREAM_MAX_LENGTH = 25 * 1024 * 1024 # clamd's StreamMaxLength; larger files are passed with FILDES if possible
+CLAMD_TIMEOUT = 300 # Seconds to wait for one reply from clamd
+CLAMSCAN_BATCH_SIZE = 1000 # Files per clamscan run when falling back to clamscan --file-list
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+SMALL_FILE_SIZE = 64 * 1024 # Files up to this size are sent with their command in a single write
+
+
+class ClamdError(Exception):
+    """clamd could not be reached or broke the protocol."""
+
+
+def parse_clamd_reply(reply):
     """
-    Audits each file in the given path and its subdirectories using ClamAV.
+    Splits a clamd reply such as "stream: Eicar-Test-Signature FOUND" into its parts.
 
-    Args:
-        start_path (str): The starting directory to scan.
-                          BE CAREFUL: Setting this to '/' will scan your entire system.
+    Returns:
+        tuple: (name, status, detail) where status is 'CLEAN', 'INFECTED' or 'ERROR'
+               and detail is the signature or error message.
     """
-    if not os.path.isdir(start_path):
-        logging.error(f"Error: The provided path '{start_path}' is not a valid directory.")
-        return
+    name, _, result = reply.rpartition(': ')
+    if result == "OK":
+        return name, "CLEAN", ""
+    if result.endswith(" FOUND"):
+        return name, "INFECTED", result[:-len(" FOUND")]
+    if result.endswith(" ERROR"):
+        return name, "ERROR", result[:-len(" ERROR")]
+    return name, "ERROR", result
 
-    logging.info(f"Starting ClamAV audit of: {start_path}")
 
+class ClamdConnection:
+    """
+    One persistent connection to clamd, kept open with IDSESSION so that many
+    files are scanned over it. Not thread-safe: each scanning thread has its own.
+    """
+
+    def __init__(self, address=CLAMD_ADDRESS, timeout=CLAMD_TIMEOUT, stream_max_length=STREAM_MAX_LENGTH):
+        self.address = address
+        self.timeout = timeout
+        self.stream_max_length = stream_max_length
+        self.is_unix = isinstance(address, str)
+        self._sock = None
+        self._buffer = b""
+        self._next_id = 1
+
+    def _connect(self):
+        family = socket.AF_UNIX if self.is_unix else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        if not self.is_unix:
+            # Requests are small writes followed by a wait for the reply; don't let Nagle hold them back.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            sock.connect(self.address)
+        except OSError as e:
+            sock.close()
+            raise ClamdError(f"cannot connect to clamd at {self.address}: {e}")
+        return sock
+
+    @property
+    def is_open(self):
+        return self._sock is not None
+
+    def open(self):
+        self._sock = self._connect()
+        self._buffer = b""
+        self._next_id = 1
+        self._sock.sendall(b"zIDSESSION\0")
+
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendall(b"zEND\0")
+        except OSError:
+            pass
+        self._sock.close()
+        self._sock = None
+
+    def ping(self):
+        """Returns True if clamd answers PING (on a separate, short-lived connection)."""
+        try:
+            sock = self._connect()
+        except ClamdError:
+            return False
+        try:
+            sock.sendall(b"zPING\0")
+            return sock.recv(16).rstrip(b"\0\n") == b"PONG"
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def _read_reply(self):
+        while b"\0" not in self._buffer:
+            data = self._sock.recv(4096)
+            if not data:
+                raise ClamdError("clamd closed the connection")
+            self._buffer += data
+        reply, _, self._buffer = self._buffer.partition(b"\0")
+        return reply.decode('utf-8', 'replace')
+
+    def _session_reply(self):
+        # Replies inside a session are prefixed with the request's number: "3: stream: OK"
+        expected = self._next_id
+        self._next_id += 1
+        number, _, reply = self._read_reply().partition(": ")
+        if number != str(expected):
+            raise ClamdError(f"unexpected reply to request {expected}: {number}: {reply}")
+        return reply
+
+    def scan_stream(self, path):
+        """Streams the file's contents with INSTREAM; returns (status, detail)."""
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= SMALL_FILE_SIZE:
+                data = f.read(size)
+                header = struct.pack("!I", len(data)) if data else b""
+                self._sock.sendall(b"zINSTREAM\0" + header + data + struct.pack("!I", 0))
+                _name, status, detail = parse_clamd_reply(self._session_reply())
+                return status, detail
+            self._sock.sendall(b"zINSTREAM\0")
+            offset = 0
+            while offset < size:
+                # Each chunk is a 4-byte big-endian length followed by the data (sent with sendfile, not copied).
+                length = min(STREAM_CHUNK_SIZE, size - offset)
+                self._sock.sendall(struct.pack("!I", length))
+                if self._sock.sendfile(f, offset, length) != length:
+                    raise ClamdError(f"{path} shrank while it was being scanned")
+                offset += length
+            self._sock.sendall(struct.pack("!I", 0))
+        _name, status, detail = parse_clamd_reply(self._session_reply())
+        return status, detail
+
+    def scan_fildes(self, path):
+        """Passes the open file descriptor with FILDES (UNIX socket only); returns (status, detail)."""
+        if not self.is_unix:
+            raise ClamdError("FILDES needs a UNIX socket connection to clamd")
+        with open(path, 'rb') as f:
+            self._sock.sendall(b"zFILDES\0")
+            self._sock.sendmsg([b"\0"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [f.fileno()]))])
+            _name, status, detail = parse_clamd_reply(self._session_reply())
+        return status, detail
+
+    def multiscan(self, directory):
+        """
+        Has clamd walk the directory itself with MULTISCAN, on a connection of its own.
+        Yields (name, status, detail) for each reply; clamd reports infected files and
+        errors, or a single OK for the directory when nothing was found.
+        """
+        sock = self._connect()
+        sock.settimeout(None) # a whole tree can take a long time
+        buffer = b""
+        try:
+            sock.sendall(b"zMULTISCAN " + os.path.abspath(directory).encode() + b"\0")
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break # clamd closes the connection when the scan is done
+                buffer += data
+                while b"\0" in buffer:
+                    reply, _, buffer = buffer.partition(b"\0")
+                    yield parse_clamd_reply(reply.decode('utf-8', 'replace'))
+        finally:
+            sock.close()
+
+    def scan(self, path, mode=SCAN_MODE):
+        """Scans one file; returns (status, detail)."""
+        if mode == "FILDES" or (self.is_unix and os.path.getsize(path) > self.stream_max_length):
+            return self.scan_fildes(path)
+        if os.path.getsize(path) > self.stream_max_length:
+            return "ERROR", f"larger than StreamMaxLength ({self.stream_max_length} bytes)"
+        return self.scan_stream(path)
+
+
+def iter_files(start_path):
+    """
+    Yields the path of every regular file under start_path.
+
+    Args:
+        start_path (str): The starting directory to walk.
+    """
     # Use a set to keep track of directories that are inaccessible,
     # to avoid repeated permission errors.
     inaccessible_dirs = set()
 
-    for root, dirs, files in os.walk(start_path):
+    def on_error(error):
+        if isinstance(error, PermissionError):
+            logging.warning(f"Permission denied to access directory: {error.filename}. Skipping this directory.")
+            inaccessible_dirs.add(error.filename)
+        else:
+            logging.error(f"An error occurred during directory traversal in {error.filename}: {error}")
+
+    for root, dirs, files in os.walk(start_path, onerror=on_error):
         # Skip directories we know are inaccessible
         if root in inaccessible_dirs:
             dirs[:] = [] # Don't traverse into this directory or its subdirectories
             continue
 
-        try:
-            # Modify dirs in-place to prune search
-            # For example, you might want to skip system directories like /proc, /sys, /dev
-            # if 'proc' in dirs: dirs.remove('proc')
-            # if 'sys' in dirs: dirs.remove('sys')
-            # if 'dev' in dirs: dirs.remove('dev')
+        # Modify dirs in-place to prune search
+        # For example, you might want to skip system directories like /proc, /sys, /dev
+        # if 'proc' in dirs: dirs.remove('proc')
+        # if 'sys' in dirs: dirs.remove('sys')
+        # if 'dev' in dirs: dirs.remove('dev')
 
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
 
-                # Basic check if the file is a regular file (not a symlink, pipe, etc.)
-                if not os.path.isfile(file_path):
-                    continue
+            # Basic check if the file is a regular file (not a symlink, pipe, etc.)
+            if not os.path.isfile(file_path):
+                continue
+            yield file_path
 
-                logging.debug(f"Scanning: {file_path}")
-                try:
-                    # Construct the clamscan command
-                    # -v for verbose output (optional)
-                    # --no-summary to avoid the final summary line from clamscan
-                    command = ['clamscan', '--no-summary', file_path]
-
-                    # Execute the command
-                    # capture_output=True captures stdout and stderr
-                    # text=True decodes stdout/stderr as text
-                    # check=False prevents an exception for non-zero exit codes (e.g., infected files)
-                    process = subprocess.run(
-                        command,
-                        capture_output=True,
-                        text=True,
-                        check=False
-                    )
-
-                    # Check the return code
-                    # 0: No virus found
-                    # 1: Virus found
-                    # 2: Some other error
-                    if process.returncode == 0:
-                        logging.info(f"CLEAN: {file_path}")
-                    elif process.returncode == 1:
-                        logging.warning(f"INFECTED: {file_path}")
-                        # You can parse process.stdout to get more details about the infection
-                        logging.warning(f"  ClamAV Output: {process.stdout.strip()}")
-                    else:
-                        logging.error(f"ERROR scanning {file_path} (Return Code: {process.returncode})")
-                        logging.error(f"  ClamAV Stderr: {process.stderr.strip()}")
-
-                except FileNotFoundError:
-                    logging.error("ClamAV (clamscan) not found. Please ensure ClamAV is installed and in your system's PATH.")
+
+def log_result(file_path, status, detail):
+    if status == "CLEAN":
+        logging.info(f"CLEAN: {file_path}")
+    elif status == "INFECTED":
+        logging.warning(f"INFECTED: {file_path}")
+        logging.warning(f"  ClamAV Output: {detail}")
+    else:
+        logging.error(f"ERROR scanning {file_path}")
+        logging.error(f"  ClamAV Error: {detail}")
+
+
+class ClamdScanner:
+    """
+    Scans files over a pool of persistent clamd connections, one thread per
+    connection. Paths are handed out through a bounded queue, so walking a
+    large tree never holds more than a few thousand paths in memory.
+
+    Args:
+        address: UNIX socket path or (host, port) of clamd.
+        mode (str): 'INSTREAM' or 'FILDES'.
+        concurrency (int): Number of connections, i.e. files scanned at the same time.
+    """
+
+    def __init__(self, address=CLAMD_ADDRESS, mode=SCAN_MODE, concurrency=CONCURRENCY, timeout=CLAMD_TIMEOUT,
+                 stream_max_length=STREAM_MAX_LENGTH):
+        if mode not in ("INSTREAM", "FILDES", "MULTISCAN"):
+            raise ValueError(f"unknown scan mode {mode!r}")
+        if mode == "FILDES" and not isinstance(address, str):
+            raise ValueError("FILDES needs clamd's UNIX socket, not a TCP address")
+        self.address = address
+        self.mode = mode
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stream_max_length = stream_max_length
+
+    def available(self):
+        return ClamdConnection(self.address, timeout=5).ping()
+
+    def scan_files(self, paths, report=log_result):
+        """Scans every path from the iterable, calling report(path, status, detail) from the worker threads."""
+        work = queue.Queue(maxsize=self.concurrency * 256)
+        counts = {"CLEAN": 0, "INFECTED": 0, "ERROR": 0}
+        lock = threading.Lock()
+        workers = [threading.Thread(target=self._worker, args=(work, report, counts, lock), daemon=True)
+                   for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        try:
+            for path in paths:
+                work.put(path)
+        finally:
+            for _ in workers:
+                work.put(None)
+            for worker in workers:
+                worker.join()
+        return counts
+
+    def _worker(self, work, report, counts, lock):
+        connection = ClamdConnection(self.address, timeout=self.timeout, stream_max_length=self.stream_max_length)
+        try:
+            while True:
+                path = work.get()
+                if path is None:
                     return
+                try:
+                    status, detail = self._scan_one(connection, path)
                 except Exception as e:
-                    logging.error(f"An unexpected error occurred while scanning {file_path}: {e}")
+                    # A worker that died would leave scan_files() waiting on a full queue.
+                    connection.close()
+                    status, detail = "ERROR", f"{type(e).__name__}: {e}"
+                with lock:
+                    counts[status] += 1
+                try:
+                    report(path, status, detail)
+                except Exception:
+                    logging.exception(f"Reporting the result for {path} failed")
+        finally:
+            connection.close()
+
+    def _scan_one(self, connection, path):
+        # A broken connection is reopened once; a file that still fails is reported as an error.
+        for attempt in (1, 2):
+            try:
+                if not connection.is_open:
+                    connection.open()
+                return connection.scan(path, self.mode)
+            except OSError as e:
+                if isinstance(e, (FileNotFoundError, PermissionError, IsADirectoryError)):
+                    return "ERROR", str(e)
+                connection.close()
+                error = e
+            except ClamdError as e:
+                connection.close()
+                error = e
+        return "ERROR", str(error)
+
+    def multiscan(self, start_path, report=log_result):
+        """
+        Has clamd walk start_path itself with MULTISCAN. clamd reports only
+        infected files and errors, so clean files are not logged one by one.
+        """
+        counts = {"CLEAN": 0, "INFECTED": 0, "ERROR": 0}
+        for name, status, detail in ClamdConnection(self.address, timeout=self.timeout).multiscan(start_path):
+            if status == "CLEAN":
+                continue # "<start_path>: OK" when nothing was found
+            counts[status] += 1
+            report(name, status, detail)
+        return counts
+
+
+def clamscan_file_list(paths, report=log_result, batch_size=CLAMSCAN_BATCH_SIZE):
+    """
+    Fallback when no clamd is running: scans the files in batches with
+    `clamscan --file-list`, so the signature database is loaded once per batch
+    instead of once per file.
+    """
+    counts = {"CLEAN": 0, "INFECTED": 0, "ERROR": 0}
+    batch = []
 
-        except PermissionError:
-            logging.warning(f"Permission denied to access directory: {root}. Skipping this directory.")
-            inaccessible_dirs.add(root)
-            dirs[:] = [] # Stop os.walk from entering this directory's subdirectories
-        except Exception as e:
-            logging.error(f"An error occurred during directory traversal in {root}: {e}")
+    def run_batch():
+        with tempfile.NamedTemporaryFile('w', prefix='clamscan-', suffix='.lst') as file_list:
+            file_list.write("\n".join(batch) + "\n")
+            file_list.flush()
+            process = subprocess.run(
+                ['clamscan', '--no-summary', f'--file-list={file_list.name}'],
+                capture_output=True,
+                text=True,
+                check=False
+            )
+        # 0: No virus found, 1: Virus found, 2: Some other error
+        reported = set()
+        for line in process.stdout.splitlines():
+            name, status, detail = parse_clamd_reply(line)
+            if not name:
+                continue
+            reported.add(name)
+            counts[status] += 1
+            report(name, status, detail)
+        if process.returncode not in (0, 1):
+            logging.error(f"clamscan exited with return code {process.returncode}")
+            if process.stderr.strip():
+                logging.error(f"  ClamAV Stderr: {process.stderr.strip()}")
+            for name in batch:
+                if name not in reported:
+                    counts["ERROR"] += 1
+                    report(name, "ERROR", "not scanned")
+        batch.clear()
+
+    for path in paths:
+        if "\n" in path:
+            counts["ERROR"] += 1
+            report(path, "ERROR", "a file list cannot hold names containing newlines")
+            continue
+        batch.append(path)
+        if len(batch) >= batch_size:
+            run_batch()
+    if batch:
+        run_batch()
+    return counts
+
+
+def audit_files_with_clamav(start_path, address=CLAMD_ADDRESS, mode=SCAN_MODE, concurrency=CONCURRENCY):
+    """
+    Audits each file in the given path and its subdirectories using ClamAV.
+
+    Files are scanned through clamd when it is running, otherwise with batched
+    clamscan runs.
+
+    Args:
+        start_path (str): The starting directory to scan.
+                          BE CAREFUL: Setting this to '/' will scan your entire system.
+        address: clamd's UNIX socket path or (host, port).
+        mode (str): 'INSTREAM', 'FILDES' or 'MULTISCAN' (see SCAN_MODE).
+        concurrency (int): Files scanned at the same time through clamd.
+    """
+    if not os.path.isdir(start_path):
+        logging.error(f"Error: The provided path '{start_path}' is not a valid directory.")
+        return
+
+    logging.info(f"Starting ClamAV audit of: {start_path}")
+
+    try:
+        scanner = ClamdScanner(address, mode=mode, concurrency=concurrency)
+    except ValueError as e:
+        logging.error(f"Error: {e}")
+        return
+    if scanner.available():
+        logging.info(f"Scanning through clamd at {address} ({mode}, {concurrency} connections)")
+        if mode == "MULTISCAN":
+            counts = scanner.multiscan(start_path)
+        else:
+            counts = scanner.scan_files(iter_files(start_path))
+    else:
+        logging.warning(f"clamd is not answering at {address}; falling back to clamscan --file-list")
+        try:
+            counts = clamscan_file_list(iter_files(start_path))
+        except FileNotFoundError:
+            logging.error("ClamAV (clamscan) not found. Please ensure ClamAV is installed and in your system's PATH.")
+            return
 
-    logging.info("ClamAV audit completed.")
+    logging.info(f"ClamAV audit completed. Clean: {counts['CLEAN']}, Infected: {counts['INFECTED']}, Errors: {counts['ERROR']}")
 
 if __name__ == "__main__":
     # !!! IMPORTANT: CHANGE THIS PATH CAREFULLY !!!
@@ -0,0 +1,134 @@
+"""
+A small stand-in for clamd, enough for PythonAV's client: PING, IDSESSION
+with INSTREAM and FILDES, and MULTISCAN, served on a UNIX socket and on TCP.
+Anything containing EICAR_MARK is reported as infected.
+"""
+import array
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+EICAR_MARK = b"X5O!P%@AP"
+SIGNATURE = "Eicar-Test-Signature"
+
+
+def verdict(data):
+    return f"{SIGNATURE} FOUND" if EICAR_MARK in data else "OK"
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def _command(self):
+        command = b""
+        while not command.endswith(b"\0"):
+            byte = self.request.recv(1)
+            if not byte:
+                return None
+            command += byte
+        return command[:-1].decode()
+
+    def _exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _reply(self, text):
+        self.request.sendall(text.encode() + b"\0")
+
+    def handle(self):
+        clamd = self.server.clamd
+        with clamd.lock:
+            clamd.connections += 1
+        command = self._command()
+        if command == "zPING":
+            self._reply("PONG")
+        elif command is not None and command.startswith("zMULTISCAN "):
+            self._multiscan(command[len("zMULTISCAN "):])
+        elif command == "zIDSESSION":
+            self._session(clamd)
+
+    def _multiscan(self, directory):
+        found = False
+        for root, _dirs, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    result = verdict(f.read())
+                if result != "OK":
+                    found = True
+                    self._reply(f"{path}: {result}")
+        if not found:
+            self._reply(f"{directory}: OK")
+
+    def _session(self, clamd):
+        number = 0
+        while True:
+            command = self._command()
+            if command is None or command == "zEND":
+                return
+            number += 1
+            with clamd.lock:
+                clamd.commands.append(command)
+            if command == "zINSTREAM":
+                data = b""
+                while True:
+                    (length,) = struct.unpack("!I", self._exactly(4))
+                    if not length:
+                        break
+                    data += self._exactly(length)
+                if len(data) > clamd.stream_max_length:
+                    self._reply(f"{number}: INSTREAM size limit exceeded. ERROR")
+                    return
+                self._reply(f"{number}: stream: {verdict(data)}")
+            elif command == "zFILDES":
+                _data, ancillary, _flags, _address = self.request.recvmsg(1, socket.CMSG_SPACE(4))
+                fds = array.array('i')
+                fds.frombytes(ancillary[0][2][:fds.itemsize])
+                with os.fdopen(fds[0], 'rb') as f:
+                    self._reply(f"{number}: fd[{fds[0]}]: {verdict(f.read())}")
+            else:
+                self._reply(f"{number}: UNKNOWN COMMAND")
+            if clamd.drop_after and number >= clamd.drop_after:
+                return  # hang up mid-session, like a clamd that was restarted
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeClamd:
+    """
+    Serves on ``socket_path`` and on an ephemeral TCP port on 127.0.0.1
+    (``tcp_address``). ``drop_after`` closes each session after that many
+    scans. ``commands`` records every command received inside a session.
+    """
+
+    def __init__(self, socket_path, stream_max_length=25 * 1024 * 1024, drop_after=None):
+        self.stream_max_length = stream_max_length
+        self.drop_after = drop_after
+        self.connections = 0
+        self.commands = []
+        self.lock = threading.Lock()
+        self.socket_path = socket_path
+        self._servers = [_UnixServer(socket_path, _Handler), _TCPServer(("127.0.0.1", 0), _Handler)]
+        self.tcp_address = self._servers[1].server_address
+        for server in self._servers:
+            server.clamd = self
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        os.unlink(self.socket_path)
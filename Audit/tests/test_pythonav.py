@@ -0,0 +1,176 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import pytest
+import PythonAV
+from PythonAV import ClamdConnection, ClamdScanner, clamscan_file_list, iter_files, parse_clamd_reply
+from fakeclamd import EICAR_MARK, SIGNATURE, FakeClamd
+
+EICAR = EICAR_MARK + b"ZP4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+
+
+@pytest.fixture
+def socket_dir():
+    # AF_UNIX paths are limited to ~108 bytes, which pytest's tmp_path can exceed.
+    directory = tempfile.mkdtemp(prefix='clamd-')
+    yield directory
+    shutil.rmtree(directory)
+
+@pytest.fixture
+def clamd(socket_dir):
+    server = FakeClamd(os.path.join(socket_dir, 'clamd.ctl'))
+    yield server
+    server.close()
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'tree'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a.txt').write_bytes(b'hello')
+    (root / 'empty').write_bytes(b'')
+    (root / 'sub' / 'eicar.com').write_bytes(EICAR)
+    (root / 'sub' / 'big.bin').write_bytes(b'x' * (3 * 1024 * 1024) + EICAR)
+    return root
+
+def collect():
+    results = {}
+
+    def report(path, status, detail):
+        results[os.path.basename(path)] = (status, detail)
+    return results, report
+
+def test_parse_clamd_reply():
+    assert parse_clamd_reply("stream: OK") == ("stream", "CLEAN", "")
+    assert parse_clamd_reply("/x: Eicar FOUND") == ("/x", "INFECTED", "Eicar")
+    assert parse_clamd_reply("/x: Can't open file ERROR") == ("/x", "ERROR", "Can't open file")
+    assert parse_clamd_reply("a: b: OK") == ("a: b", "CLEAN", "")
+
+def test_ping(clamd):
+    assert ClamdConnection(clamd.socket_path).ping()
+    assert ClamdConnection(clamd.tcp_address).ping()
+    assert not ClamdConnection(clamd.socket_path + '.missing').ping()
+
+@pytest.mark.parametrize('address', ['unix', 'tcp'])
+@pytest.mark.parametrize('mode', ['INSTREAM', 'FILDES'])
+def test_scan_files(clamd, tree, address, mode):
+    address = clamd.socket_path if address == 'unix' else clamd.tcp_address
+    if mode == 'FILDES' and not isinstance(address, str):
+        with pytest.raises(ValueError):
+            ClamdScanner(address, mode=mode)
+        return
+    results, report = collect()
+    counts = ClamdScanner(address, mode=mode, concurrency=2).scan_files(iter_files(str(tree)), report)
+    assert counts == {"CLEAN": 2, "INFECTED": 2, "ERROR": 0}
+    assert results['eicar.com'] == ("INFECTED", SIGNATURE)
+    assert results['big.bin'] == ("INFECTED", SIGNATURE)
+    assert results['a.txt'] == results['empty'] == ("CLEAN", "")
+    assert set(clamd.commands) == {'z' + mode}
+    assert clamd.connections == 2  # one session per worker, reused for every file
+
+def test_files_over_stream_max_length_use_fildes(socket_dir, tree):
+    clamd = FakeClamd(os.path.join(socket_dir, 'clamd.ctl'), stream_max_length=1024)
+    try:
+        results, report = collect()
+        scanner = ClamdScanner(clamd.socket_path, concurrency=1, stream_max_length=1024)
+        counts = scanner.scan_files([str(tree / 'a.txt'), str(tree / 'sub' / 'big.bin')], report)
+        assert counts == {"CLEAN": 1, "INFECTED": 1, "ERROR": 0}
+        assert clamd.commands == ['zINSTREAM', 'zFILDES']
+
+        results, report = collect()
+        scanner = ClamdScanner(clamd.tcp_address, concurrency=1, stream_max_length=1024)
+        counts = scanner.scan_files([str(tree / 'sub' / 'big.bin')], report)
+        assert counts == {"CLEAN": 0, "INFECTED": 0, "ERROR": 1}
+        assert 'StreamMaxLength' in results['big.bin'][1]
+    finally:
+        clamd.close()
+
+def test_scan_one_reconnects_after_clamd_hangs_up(socket_dir, tree):
+    clamd = FakeClamd(os.path.join(socket_dir, 'clamd.ctl'), drop_after=1)
+    try:
+        results, report = collect()
+        paths = [str(tree / 'a.txt'), str(tree / 'sub' / 'eicar.com'), str(tree / 'empty')]
+        counts = ClamdScanner(clamd.socket_path, concurrency=1).scan_files(paths, report)
+        assert counts == {"CLEAN": 2, "INFECTED": 1, "ERROR": 0}
+        assert clamd.connections == 3
+    finally:
+        clamd.close()
+
+def test_scan_errors_do_not_stop_the_scan(clamd, tree):
+    results, report = collect()
+    paths = [str(tree / 'missing'), str(tree / 'a.txt')]
+    counts = ClamdScanner(clamd.socket_path, concurrency=1).scan_files(paths, report)
+    assert counts == {"CLEAN": 1, "INFECTED": 0, "ERROR": 1}
+    assert results['missing'][0] == "ERROR"
+
+def test_failing_report_does_not_stop_the_scan(clamd, tree):
+    def report(path, status, detail):
+        raise RuntimeError("log handler broke")
+    # More paths than the work queue holds, so a dead worker would block scan_files().
+    paths = [str(tree / 'a.txt')] * 600
+    result = {}
+    scan = threading.Thread(target=lambda: result.update(ClamdScanner(clamd.socket_path, concurrency=1).scan_files(paths, report)),
+                            daemon=True)
+    scan.start()
+    scan.join(30)
+    assert not scan.is_alive()
+    assert result == {"CLEAN": 600, "INFECTED": 0, "ERROR": 0}
+
+def test_unreachable_clamd_reports_errors(socket_dir, tree):
+    results, report = collect()
+    scanner = ClamdScanner(os.path.join(socket_dir, 'nothing.ctl'), concurrency=1)
+    assert not scanner.available()
+    counts = scanner.scan_files([str(tree / 'a.txt')], report)
+    assert counts == {"CLEAN": 0, "INFECTED": 0, "ERROR": 1}
+    assert 'cannot connect' in results['a.txt'][1]
+
+def test_multiscan_reports_only_infected_files(clamd, tree):
+    results, report = collect()
+    counts = ClamdScanner(clamd.socket_path, mode='MULTISCAN').multiscan(str(tree), report)
+    assert counts == {"CLEAN": 0, "INFECTED": 2, "ERROR": 0}
+    assert set(results) == {'eicar.com', 'big.bin'}
+
+@pytest.fixture
+def clamscan(tmp_path, monkeypatch):
+    """Puts a stub clamscan on PATH; it stops with return code 2 after the line in STOP_AFTER."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    script = bin_dir / 'clamscan'
+    script.write_text(
+        '#!/bin/sh\n'
+        'list="${2#--file-list=}"\n'
+        'echo "$(wc -l < "$list")" >> "$(dirname "$0")/batches"\n'
+        'n=0\n'
+        'while IFS= read -r f; do\n'
+        '  n=$((n + 1))\n'
+        '  if [ -n "$STOP_AFTER" ] && [ $n -gt "$STOP_AFTER" ]; then echo "out of memory" >&2; exit 2; fi\n'
+        '  if grep -q \'X5O!P%@AP\' "$f"; then echo "$f: Eicar-Test-Signature FOUND"; else echo "$f: OK"; fi\n'
+        'done < "$list"\n'
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return bin_dir / 'batches'
+
+def test_clamscan_file_list_batches(clamscan, tree):
+    results, report = collect()
+    paths = sorted(iter_files(str(tree)))
+    counts = clamscan_file_list(paths + ['bad\nname'], report, batch_size=3)
+    assert counts == {"CLEAN": 2, "INFECTED": 2, "ERROR": 1}
+    assert clamscan.read_text().split() == ['3', '1']
+    assert results['eicar.com'] == ("INFECTED", SIGNATURE)
+
+def test_clamscan_return_code_2_reports_unscanned_files(clamscan, tree, monkeypatch):
+    monkeypatch.setenv('STOP_AFTER', '1')
+    results, report = collect()
+    paths = [str(tree / 'a.txt'), str(tree / 'sub' / 'eicar.com'), str(tree / 'empty')]
+    counts = clamscan_file_list(paths, report)
+    assert counts == {"CLEAN": 1, "INFECTED": 0, "ERROR": 2}
+    assert results['a.txt'] == ("CLEAN", "")
+    assert results['eicar.com'] == results['empty'] == ("ERROR", "not scanned")
+
+def test_audit_falls_back_to_clamscan(clamscan, tree, socket_dir, caplog):
+    caplog.set_level('INFO')
+    PythonAV.audit_files_with_clamav(str(tree), address=os.path.join(socket_dir, 'nothing.ctl'))
+    assert 'falling back to clamscan' in caplog.text
+    assert 'Clean: 2, Infected: 2, Errors: 0' in caplog.text
@@ -1,70 +1,1018 @@
-import subprocess
+import argparse
+import asyncio
+import collections
+import ctypes
+import heapq
+import json
+import signal
+import socket
+import threading
 import time
 import datetime
 import os
+import pwd
+import re
+import struct
 
 # --- Configuration ---
 LOG_DIR = "/var/log/system_monitoring_agent" # Directory for logs
 # Ensure this directory exists and is writable by the user running the script (e.g., root if using sudo)
-# Log files will be created as: process_monitor.log, ufw_log_monitor.log, etc.
+# Results are stored per task as JSON lines: <LOG_DIR>/<task name>/<UTC start time>.jsonl
+RESULT_FLUSH_SECONDS = 5 # Buffered results reach the log files at least this often
+RESULT_FSYNC_SECONDS = 60 # ...and are forced to disk at least this often
+RESULT_ROTATE_BYTES = 16 * 1024 * 1024 # Start a new file for a task after this many bytes
+RESULT_ROTATE_SECONDS = 24 * 3600 # ...or after this long
+RESULT_RETENTION_DAYS = 14 # Files holding only older results are deleted
 
 MONITOR_INTERVAL_SECONDS = 5 # General interval for most monitors
+TOP_N_PROCESSES = 10 # Rows shown by the top_memory / top_cpu collectors
 UFW_LOG_INTERVAL_SECONDS = 2 # Specific interval for ufw log monitor
 IOTOP_INTERVAL_SECONDS = 2 # Specific interval for iotop monitor
+UFW_LOG_PATH = "/var/log/ufw.log"
+UFW_MAX_SOURCES = 1024 # Sources kept in the blocked-source counts; the least active are dropped beyond this
+TASK_TIMEOUT_SECONDS = 30 # Default per-task time limit; a task may set its own 'timeout'
+MAX_CONCURRENT_TASKS = 4 # Tasks allowed to run at the same time
+METRICS_PORT = None # Set (e.g. 9464) to serve the agent's own metrics at http://127.0.0.1:<port>/metrics
+# The same metrics are printed when the agent receives SIGUSR1: sudo kill -USR1 <pid>
 
 # --- Monitoring Tasks ---
 # Each task is a dictionary:
 # 'name': A unique name for the task (used for log file names)
 # 'command': The bash command to execute
-# 'interval': How often to run this specific command
+# 'collector': Instead of 'command', the name of a built-in collector (see COLLECTORS below)
+#              that gathers the data in-process; extra keys such as 'top_n' or 'pattern'
+#              are passed to it through the task
+# 'interval': How often to run this specific command. Runs are scheduled at a fixed rate
+#             (start, start + interval, start + 2*interval, ...) and do not drift; a run that
+#             is due while the previous one is still going, or that the agent woke up too late
+#             for, is skipped and counted as missed
+# 'timeout': Optional time limit in seconds for one run (default TASK_TIMEOUT_SECONDS)
 # 'requires_sudo': True if the command needs sudo (the script itself should be run with sudo)
 # 'enabled': True to run this task, False to disable it
 monitoring_tasks = [
     {
         'name': 'top_mem_processes',
-        'command': "ps aux --sort=-%mem | head -n 11",
+        'collector': 'top_memory', # was: ps aux --sort=-%mem | head -n 11
+        'top_n': TOP_N_PROCESSES,
         'interval': MONITOR_INTERVAL_SECONDS,
         'requires_sudo': False,
         'enabled': True
     },
     {
         'name': 'top_cpu_processes',
-        'command': "ps aux --sort=-%cpu | head -n 11",
+        'collector': 'top_cpu', # was: ps aux --sort=-%cpu | head -n 11
+        'top_n': TOP_N_PROCESSES,
         'interval': MONITOR_INTERVAL_SECONDS,
         'requires_sudo': False,
         'enabled': True
     },
     {
         'name': 'specific_process_monitor', # You need to define 'your_process_name' here
-        'command': "ps aux | grep -i 'your_process_name' | grep -v grep",
+        'collector': 'process_watch', # was: ps aux | grep -i 'your_process_name' | grep -v grep
+        'pattern': 'your_process_name', # Regular expression, matched case-insensitively against name and command line
         'interval': MONITOR_INTERVAL_SECONDS,
         'requires_sudo': False,
         'enabled': True # Set to False if you don't have a specific process to watch
     },
     {
         'name': 'ufw_log_monitor',
-        'command': "tail /var/log/ufw.log | grep -i 'deny\\|reject'",
+        'collector': 'ufw_log', # was: tail /var/log/ufw.log | grep -i 'deny\\|reject'
+        'path': UFW_LOG_PATH,
         'interval': UFW_LOG_INTERVAL_SECONDS,
         'requires_sudo': True, # tailing ufw.log usually requires root
         'enabled': True
     },
     {
         'name': 'iotop_monitor',
-        'command': "iotop -o -b -n 1", # Assuming iotop is installed
+        'collector': 'disk_io', # was: iotop -o -b -n 1
+        'top_n': TOP_N_PROCESSES,
         'interval': IOTOP_INTERVAL_SECONDS,
-        'requires_sudo': True, # iotop needs root
+        'requires_sudo': True, # reading other users' /proc/[pid]/io requires root
         'enabled': True
     },
     {
         'name': 'network_connections',
-        'command': "ss -tulpn", # Using ss, as it's modern
-        # If ss gives an error, use: "netstat -tulpn"
+        'collector': 'sockets', # was: ss -tulpn (or netstat -tulpn)
+        'connections': True, # Also report established connections, not only listeners
         'interval': MONITOR_INTERVAL_SECONDS,
-        'requires_sudo': True, # ss -p requires root
+        'requires_sudo': True, # reading other users' /proc/[pid]/fd requires root
         'enabled': True
     }
 ]
 
+# --- /proc Process Sampling ---
+# One scan of /proc/[pid]/stat per tick serves every process collector. CPU% is
+# computed from the jiffies used since the previous scan (like top), not averaged
+# over the process lifetime (like ps); a process seen for the first time falls back
+# to its lifetime average. Per-pid static data (user, command line) is cached
+# across ticks, keyed by the process start time so reused pids are detected.
+
+PROC = "/proc"
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class ProcessInfo:
+    __slots__ = ('pid', 'start', 'ppid', 'user', 'name', 'cmdline', 'state', 'threads',
+                 'vsz_kb', 'rss_kb', 'cpu_percent', 'mem_percent')
+
+    def __init__(self, pid, start, ppid, user, name, cmdline, state, threads, vsz_kb, rss_kb, cpu_percent, mem_percent):
+        self.pid = pid
+        self.start = start  # clock ticks after boot; (pid, start) identifies a process
+        self.ppid = ppid
+        self.user = user
+        self.name = name
+        self.cmdline = cmdline
+        self.state = state
+        self.threads = threads
+        self.vsz_kb = vsz_kb
+        self.rss_kb = rss_kb
+        self.cpu_percent = cpu_percent
+        self.mem_percent = mem_percent
+
+
+class ProcessSnapshot:
+    """Every process seen by one /proc scan."""
+
+    def __init__(self, taken, processes):
+        self.taken = taken
+        self.processes = processes
+
+    @property
+    def pids(self):
+        return [process.pid for process in self.processes]
+
+
+class ProcSampler:
+    """
+    Scans /proc at most once per ``max_age`` seconds; collectors running in
+    the same tick share the snapshot.
+    """
+
+    def __init__(self, proc=PROC, max_age=1.0):
+        self.proc = proc
+        self.max_age = max_age
+        self.mem_total_kb = self._mem_total()
+        self._snapshot = None
+        self._previous = {}  # pid -> (start time, cpu jiffies)
+        self._previous_time = None
+        self._static = {}    # pid -> (start time, user, cmdline)
+        self._users = {}
+        self._lock = threading.Lock()  # collectors run in worker threads
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is None or now - self._snapshot.taken >= self.max_age:
+                self._snapshot = ProcessSnapshot(now, self._scan(now))
+            return self._snapshot
+
+    def _mem_total(self):
+        try:
+            with open(os.path.join(self.proc, 'meminfo')) as f:
+                for line in f:
+                    if line.startswith('MemTotal:'):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def _uptime(self):
+        with open(os.path.join(self.proc, 'uptime')) as f:
+            return float(f.read().split()[0])
+
+    def _scan(self, now):
+        elapsed = now - self._previous_time if self._previous_time is not None else None
+        uptime = self._uptime()
+        current = {}
+        processes = []
+        for entry in os.listdir(self.proc):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            try:
+                with open(f"{self.proc}/{entry}/stat", 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue  # exited between listdir and open
+            # The command name is in parentheses and may itself contain spaces or ')'.
+            close = data.rfind(b')')
+            name = data[data.find(b'(') + 1:close].decode('utf-8', 'replace')
+            fields = data[close + 2:].split()
+            jiffies = int(fields[11]) + int(fields[12])
+            start = int(fields[19])
+            current[pid] = (start, jiffies)
+
+            previous = self._previous.get(pid)
+            if previous is not None and previous[0] == start and elapsed:
+                cpu = (jiffies - previous[1]) / CLK_TCK / elapsed * 100
+            else:
+                lifetime = uptime - start / CLK_TCK
+                cpu = jiffies / CLK_TCK / lifetime * 100 if lifetime > 0 else 0.0
+
+            static = self._static.get(pid)
+            if static is None or static[0] != start:
+                static = self._static[pid] = (start, self._user(entry), self._cmdline(entry, name))
+            rss_kb = int(fields[21]) * PAGE_SIZE // 1024
+            processes.append(ProcessInfo(
+                pid=pid, start=start, ppid=int(fields[1]), user=static[1], name=name, cmdline=static[2],
+                state=fields[0].decode('ascii', 'replace'), threads=int(fields[17]),
+                vsz_kb=int(fields[20]) // 1024, rss_kb=rss_kb, cpu_percent=cpu,
+                mem_percent=rss_kb * 100.0 / self.mem_total_kb if self.mem_total_kb else 0.0,
+            ))
+        self._previous = current
+        self._previous_time = now
+        for pid in [pid for pid in self._static if pid not in current]:
+            del self._static[pid]
+        return processes
+
+    def _user(self, entry):
+        try:
+            uid = os.stat(f"{self.proc}/{entry}").st_uid
+        except OSError:
+            return '?'
+        user = self._users.get(uid)
+        if user is None:
+            try:
+                user = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                user = str(uid)
+            self._users[uid] = user
+        return user
+
+    def _cmdline(self, entry, name):
+        try:
+            with open(f"{self.proc}/{entry}/cmdline", 'rb') as f:
+                raw = f.read()
+        except OSError:
+            raw = b''
+        cmdline = raw.rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace')
+        return cmdline or f"[{name}]"  # kernel threads have no command line
+
+
+PROC_SAMPLER = ProcSampler()
+
+
+def process_record(p):
+    """The `ps aux` columns of a process."""
+    return {
+        'user': p.user, 'pid': p.pid, 'cpu_percent': round(p.cpu_percent, 1), 'mem_percent': round(p.mem_percent, 1),
+        'vsz_kb': p.vsz_kb, 'rss_kb': p.rss_kb, 'threads': p.threads, 'state': p.state, 'command': p.cmdline,
+    }
+
+
+def collect_top_memory(task):
+    processes = PROC_SAMPLER.snapshot().processes
+    top = sorted(processes, key=lambda p: p.rss_kb, reverse=True)[:task.get('top_n', TOP_N_PROCESSES)]
+    return {'processes': [process_record(p) for p in top]}
+
+
+def collect_top_cpu(task):
+    processes = PROC_SAMPLER.snapshot().processes
+    top = sorted(processes, key=lambda p: p.cpu_percent, reverse=True)[:task.get('top_n', TOP_N_PROCESSES)]
+    return {'processes': [process_record(p) for p in top]}
+
+
+def collect_process_watch(task):
+    pattern = re.compile(task['pattern'], re.IGNORECASE)
+    own_pid = os.getpid()
+    matches = [p for p in PROC_SAMPLER.snapshot().processes
+               if p.pid != own_pid and (pattern.search(p.name) or pattern.search(p.cmdline))]
+    return {'pattern': task['pattern'], 'processes': [process_record(p) for p in matches]}
+
+
+# --- UFW Log Following ---
+# The follower keeps its place in the log (inode and offset, saved next to the task's
+# log so a restart resumes where it stopped) and each run reads only what was appended.
+# Rotation is detected by the inode changing, truncation by the size dropping below
+# the offset. With inotify the log's directory is watched and a run with no change
+# does no file I/O at all; without it every run stats the file.
+
+UFW_ACTION_PATTERN = re.compile(r"\[UFW ((?:LIMIT )?(?:BLOCK|DENY|REJECT))\]")
+UFW_FIELD_PATTERN = re.compile(r"\b(SRC|DST|PROTO|SPT|DPT|IN)=(\S*)")
+
+IN_MODIFY = 0x002
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class FirewallEvent:
+    __slots__ = ('time', 'action', 'src', 'dst', 'proto', 'spt', 'dpt', 'interface')
+
+    def __init__(self, time, action, src, dst, proto, spt, dpt, interface):
+        self.time = time
+        self.action = action
+        self.src = src
+        self.dst = dst
+        self.proto = proto
+        self.spt = spt
+        self.dpt = dpt
+        self.interface = interface
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def parse_ufw_line(line):
+    """Returns a FirewallEvent for a blocked/denied/rejected packet line, else None."""
+    action = UFW_ACTION_PATTERN.search(line)
+    if action is None:
+        return None
+    fields = dict(UFW_FIELD_PATTERN.findall(line, action.end()))
+    # "<syslog time> <host> kernel: ..." -> "<syslog time>"
+    prefix = line.split(" kernel:", 1)[0]
+    stamp = prefix.rsplit(" ", 1)[0] if " " in prefix else prefix
+    return FirewallEvent(
+        time=stamp, action=action.group(1), src=fields.get('SRC', '?'), dst=fields.get('DST', '?'),
+        proto=fields.get('PROTO', '?'), spt=fields.get('SPT'), dpt=fields.get('DPT'),
+        interface=fields.get('IN', ''),
+    )
+
+
+class DirectoryWatch:
+    """Non-blocking inotify watch on a directory, for names of interest; None-safe when unsupported."""
+
+    def __init__(self, fd, name):
+        self.fd = fd
+        self.name = name.encode()
+
+    @classmethod
+    def create(cls, path):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, os.path.dirname(os.path.abspath(path)).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return cls(fd, os.path.basename(path))
+
+    def changed(self):
+        """Drains pending events; True if any concerned the file (or events were lost)."""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if name == self.name or mask & (IN_Q_OVERFLOW | IN_IGNORED):
+                    changed = True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class UfwLogFollower:
+    """
+    Reads new lines from the UFW log on each call to poll().
+
+    max_bytes    most bytes read per poll; the rest is read on the next one
+    max_sources  sources kept in the per-source block counts
+    """
+
+    def __init__(self, path, state_path=None, max_bytes=4 * 1024 * 1024, max_sources=UFW_MAX_SOURCES):
+        self.path = path
+        self.state_path = state_path
+        self.max_bytes = max_bytes
+        self.max_sources = max_sources
+        self.blocked_by_source = collections.Counter()
+        self.dropped_sources = 0
+        self.rotations = 0
+        self.truncations = 0
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        self._watch = DirectoryWatch.create(path)
+        self._started = False
+        self._pending = True  # read even without an inotify event
+
+    def _load_state(self):
+        if self.state_path is None:
+            return None
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            return state['inode'], state['offset']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_state(self):
+        if self.state_path is None or self._inode is None:
+            return
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({'inode': self._inode, 'offset': self._offset}, f)
+        os.replace(tmp, self.state_path)
+
+    def _open(self, st, offset):
+        self._file = open(self.path, "rb")
+        self._inode = st.st_ino
+        self._offset = offset
+        self._partial = b""
+        self._file.seek(offset)
+
+    def poll(self):
+        """Returns the FirewallEvents appended since the previous poll."""
+        if self._watch is not None and not self._watch.changed() and not self._pending:
+            return []
+        events = []
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None  # rotated away and not recreated yet; keep reading the old file
+        if self._file is None:
+            if st is None:
+                self._started = True  # whatever the file holds once it appears is new
+                return events
+            saved = self._load_state() if not self._started else None
+            if saved is not None and saved[0] == st.st_ino and saved[1] <= st.st_size:
+                self._open(st, saved[1])
+            else:
+                # No usable saved position: start from the end, as there is nothing to compare against.
+                self._open(st, 0 if self._started else st.st_size)
+        elif st is not None and st.st_ino != self._inode:
+            # Rotated: finish the old file, then continue from the start of the new one.
+            events += self._read(self.max_bytes)
+            self._file.close()
+            self.rotations += 1
+            self._open(st, 0)
+        elif st is not None and st.st_size < self._offset:
+            self.truncations += 1
+            self._file.seek(0)
+            self._offset = 0
+            self._partial = b""
+        self._started = True
+        events += self._read(self.max_bytes)
+        # More than max_bytes may be waiting, and no new event will announce it.
+        self._pending = self._file.tell() < os.fstat(self._file.fileno()).st_size
+        self._save_state()
+        return events
+
+    def _read(self, limit):
+        data = self._file.read(limit)
+        if not data:
+            return []
+        self._offset += len(data)
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > 65536:
+            self._partial = b""  # not a log line; do not let it grow
+        events = []
+        for raw in lines:
+            event = parse_ufw_line(raw.decode('utf-8', 'replace'))
+            if event is not None:
+                events.append(event)
+                self._count(event.src)
+        return events
+
+    def _count(self, source):
+        counts = self.blocked_by_source
+        counts[source] += 1
+        if len(counts) > self.max_sources:
+            # Drop the least active quarter; the counts that remain are exact.
+            keep = counts.most_common(self.max_sources * 3 // 4)
+            self.dropped_sources += len(counts) - len(keep)
+            self.blocked_by_source = collections.Counter(dict(keep))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._watch is not None:
+            self._watch.close()
+            self._watch = None
+
+
+UFW_FOLLOWERS = {}  # task name -> UfwLogFollower
+UFW_MAX_EVENTS = 200 # Events stored per run; the rest are only counted
+
+
+def collect_ufw_log(task):
+    follower = UFW_FOLLOWERS.get(task['name'])
+    if follower is None:
+        follower = UFW_FOLLOWERS[task['name']] = UfwLogFollower(
+            task.get('path', UFW_LOG_PATH),
+            state_path=os.path.join(LOG_DIR, f"{task['name']}.state"),
+            max_sources=task.get('max_sources', UFW_MAX_SOURCES),
+        )
+    events = follower.poll()
+    if not events:
+        return None
+    return {
+        'events': [event.to_dict() for event in events[:UFW_MAX_EVENTS]],
+        'total_events': len(events),
+        'top_sources': dict(follower.blocked_by_source.most_common(10)),
+    }
+
+
+# --- Socket Tables ---
+# Sockets are read straight from /proc/net/{tcp,tcp6,udp,udp6}. Finding the owning
+# process means reading /proc/[pid]/fd links, which is what makes `ss -p` expensive;
+# here the socket inode -> process index is kept between runs and only socket inodes
+# not seen before trigger fd scans. Processes not scanned yet are tried first, then
+# the others by CPU use, stopping as soon as every new inode is accounted for. Each run reports
+# the sockets opened and closed since the previous one. Addresses stay in their hex
+# form until a socket is reported.
+
+PROC_NET_TABLES = (('tcp', 'tcp'), ('tcp6', 'tcp'), ('udp', 'udp'), ('udp6', 'udp'))
+TCP_LISTEN = '0A'
+TCP_ESTABLISHED = '01'
+UDP_CONNECTED = '01'
+
+
+def decode_proc_net_address(text):
+    """'0100007F:0035' -> '127.0.0.1:53'; IPv6 addresses are bracketed."""
+    address, port = text.split(':')
+    raw = bytes.fromhex(address)
+    if len(raw) == 4:
+        return f"{socket.inet_ntop(socket.AF_INET, raw[::-1])}:{int(port, 16)}"
+    # Four 32-bit words, each in host (little-endian) order.
+    raw = b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+    return f"[{socket.inet_ntop(socket.AF_INET6, raw)}]:{int(port, 16)}"
+
+
+class SocketTable:
+    """
+    Diffs the kernel's TCP/UDP socket tables between calls to poll().
+
+    connections  also track established TCP and connected UDP sockets, not only listeners
+    """
+
+    def __init__(self, proc=PROC, sampler=None, connections=True):
+        self.proc = proc
+        self.sampler = sampler if sampler is not None else PROC_SAMPLER
+        self.connections = connections
+        self.fd_scans = 0
+        self._sockets = None   # (table, state, local, remote, inode) -> owner
+        self._owners = {}      # socket inode -> (pid, name), or None if no visible process holds it
+        self._scanned = set()  # (pid, start) of processes whose fds were read
+
+    def _read_tables(self):
+        sockets = {}
+        for table, protocol in PROC_NET_TABLES:
+            try:
+                with open(f"{self.proc}/net/{table}") as f:
+                    next(f, None)  # header
+                    for line in f:
+                        fields = line.split(None, 10)
+                        inode = fields[9]
+                        if inode == '0':
+                            continue  # TIME_WAIT and other sockets no process holds
+                        state = fields[3]
+                        remote = fields[2]
+                        if protocol == 'tcp':
+                            if state != TCP_LISTEN and not (self.connections and state == TCP_ESTABLISHED):
+                                continue
+                        elif state == UDP_CONNECTED:
+                            if not self.connections:
+                                continue
+                        else:
+                            state = TCP_LISTEN  # unconnected UDP socket: a listener, as in `ss -l`
+                        sockets[(table, state, fields[1], remote, inode)] = None
+            except FileNotFoundError:
+                continue  # e.g. no IPv6
+        return sockets
+
+    def _socket_inodes(self, pid):
+        inodes = set()
+        fd_dir = f"{self.proc}/{pid}/fd"
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            return inodes
+        for fd in fds:
+            try:
+                link = os.readlink(f"{fd_dir}/{fd}")
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                inodes.add(link[8:-1])
+        return inodes
+
+    def _resolve(self, inodes):
+        owners = self._owners
+        for inode in [inode for inode in owners if inode not in inodes]:
+            del owners[inode]
+        unknown = {inode for inode in inodes if inode not in owners}
+        if not unknown:
+            return
+        processes = self.sampler.snapshot().processes
+        alive = {(p.pid, p.start) for p in processes}
+        self._scanned &= alive
+        # A process opening sockets is usually busy: after unscanned ones, try the busiest first.
+        ordered = sorted(processes, key=lambda p: ((p.pid, p.start) in self._scanned, -p.cpu_percent))
+        for process in ordered:
+            self.fd_scans += 1
+            held = self._socket_inodes(process.pid)
+            self._scanned.add((process.pid, process.start))
+            for inode in held & unknown:
+                owners[inode] = (process.pid, process.name)
+            unknown -= held
+            if not unknown:
+                break
+        for inode in unknown:
+            owners[inode] = None
+
+    def poll(self):
+        """Returns (opened, closed) lists of (table, state, local, remote, inode, owner); everything on the first call."""
+        current = self._read_tables()
+        self._resolve({key[4] for key in current})
+        for key in current:
+            current[key] = self._owners.get(key[4])
+        previous, self._sockets = self._sockets or {}, current
+        opened = [key + (owner,) for key, owner in current.items() if key not in previous]
+        closed = [key + (owner,) for key, owner in previous.items() if key not in current]
+        return opened, closed
+
+
+def socket_record(entry):
+    table, state, local, remote, _inode, owner = entry
+    listening = state == TCP_LISTEN
+    return {
+        'table': table,
+        'state': 'LISTEN' if listening else 'ESTAB',
+        'local': decode_proc_net_address(local),
+        'remote': None if listening else decode_proc_net_address(remote),
+        'pid': owner[0] if owner is not None else None,
+        'process': owner[1] if owner is not None else None,
+    }
+
+
+SOCKET_TABLES = {}  # task name -> SocketTable
+
+
+def collect_sockets(task):
+    table = SOCKET_TABLES.get(task['name'])
+    first = table is None
+    if first:
+        table = SOCKET_TABLES[task['name']] = SocketTable(connections=task.get('connections', True))
+    opened, closed = table.poll()
+    if first:
+        return {'sockets': [socket_record(entry) for entry in opened]}
+    if not opened and not closed:
+        return None
+    return {'opened': [socket_record(entry) for entry in opened], 'closed': [socket_record(entry) for entry in closed]}
+
+
+# --- Disk I/O Sampling ---
+# Per-process storage I/O from /proc/[pid]/io, over the processes of the shared /proc
+# scan. Rates are the change in read_bytes / write_bytes (what iotop reports as DISK
+# READ / DISK WRITE) divided by the time between the two scans. A process missing from
+# the previous scan started since, so all of its I/O counts towards this interval.
+
+class IoSampler:
+    def __init__(self, proc=PROC, sampler=None):
+        self.proc = proc
+        self.sampler = sampler if sampler is not None else PROC_SAMPLER
+        self._previous = {}  # (pid, start) -> (read_bytes, write_bytes)
+        self._previous_time = None
+        self._rates = []
+        self._snapshot = None
+
+    def _read_io(self, pid):
+        read_bytes = write_bytes = None
+        try:
+            with open(f"{self.proc}/{pid}/io", 'rb') as f:
+                for line in f:
+                    if line.startswith(b'read_bytes:'):
+                        read_bytes = int(line[11:])
+                    elif line.startswith(b'write_bytes:'):
+                        write_bytes = int(line[12:])
+        except OSError:
+            return None  # exited, or not ours to read
+        if read_bytes is None or write_bytes is None:
+            return None
+        return read_bytes, write_bytes
+
+    def rates(self):
+        """Returns [(process, read bytes/s, write bytes/s)] for processes doing I/O since the previous scan."""
+        snapshot = self.sampler.snapshot()
+        if snapshot is self._snapshot:
+            return self._rates
+        # The snapshot may be up to max_age old; time the counters by when they are read.
+        read_at = time.monotonic()
+        elapsed = read_at - self._previous_time if self._previous_time is not None else None
+        current = {}
+        rates = []
+        for process in snapshot.processes:
+            counters = self._read_io(process.pid)
+            if counters is None:
+                continue
+            key = (process.pid, process.start)
+            current[key] = counters
+            if not elapsed:
+                continue
+            previous = self._previous.get(key, (0, 0))
+            read_rate = (counters[0] - previous[0]) / elapsed
+            write_rate = (counters[1] - previous[1]) / elapsed
+            if read_rate > 0 or write_rate > 0:
+                rates.append((process, read_rate, write_rate))
+        self._previous = current
+        self._previous_time = read_at
+        self._snapshot = snapshot
+        self._rates = rates
+        return rates
+
+
+IO_SAMPLER = IoSampler()
+
+
+def collect_disk_io(task):
+    rates = IO_SAMPLER.rates()
+    total_read = sum(rate[1] for rate in rates)
+    total_write = sum(rate[2] for rate in rates)
+    top = sorted(rates, key=lambda rate: rate[1] + rate[2], reverse=True)[:task.get('top_n', TOP_N_PROCESSES)]
+    return {
+        'read_bytes_per_sec': round(total_read),
+        'write_bytes_per_sec': round(total_write),
+        'processes': [
+            {'pid': process.pid, 'user': process.user, 'read_bytes_per_sec': round(read_rate),
+             'write_bytes_per_sec': round(write_rate), 'command': process.cmdline}
+            for process, read_rate, write_rate in top
+        ],
+    }
+
+
+# Built-in collectors, referenced by a task's 'collector' key. Each takes the task
+# dictionary and returns a JSON-serialisable payload, or None when there is nothing new to store.
+COLLECTORS = {
+    'top_memory': collect_top_memory,
+    'top_cpu': collect_top_cpu,
+    'process_watch': collect_process_watch,
+    'ufw_log': collect_ufw_log,
+    'sockets': collect_sockets,
+    'disk_io': collect_disk_io,
+}
+
+
+# --- Result Store ---
+# Every run becomes one JSON line in its task's current file:
+#     {"task": ..., "ts": <unix time the run finished>, "duration": <seconds>,
+#      "exit_code": <int, or null if it timed out or failed>, "payload": ..., "error": ...}
+# Files stay open and writes are buffered; everything is flushed every
+# RESULT_FLUSH_SECONDS and fsynced every RESULT_FSYNC_SECONDS, so a crash loses at
+# most that much. Each file is named after the time it was started, which is also
+# when the previous one of that task ended; read_results() uses the names to open
+# only files that can hold the requested range.
+
+RESULT_FILE_PATTERN = re.compile(r"^(\d{8}T\d{6})(?:-(\d+))?\.jsonl$")
+
+
+class _OpenResultFile:
+    __slots__ = ('file', 'path', 'opened', 'size')
+
+    def __init__(self, file, path, opened, size):
+        self.file = file
+        self.path = path
+        self.opened = opened
+        self.size = size
+
+
+class ResultStore:
+    def __init__(self, directory=LOG_DIR, flush_interval=RESULT_FLUSH_SECONDS, fsync_interval=RESULT_FSYNC_SECONDS,
+                 rotate_bytes=RESULT_ROTATE_BYTES, rotate_seconds=RESULT_ROTATE_SECONDS,
+                 retention_seconds=RESULT_RETENTION_DAYS * 86400):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.retention_seconds = retention_seconds
+        self._files = {}  # task name -> _OpenResultFile
+        self._unsynced = set()
+        self._last_flush = self._last_fsync = time.monotonic()
+
+    def append(self, task, duration, exit_code, payload, error=None):
+        now = time.time()
+        record = {'task': task, 'ts': round(now, 3), 'duration': round(duration, 4),
+                  'exit_code': exit_code, 'payload': payload}
+        if error is not None:
+            record['error'] = error
+        line = (json.dumps(record, separators=(',', ':')) + "\n").encode()
+        current = self._files.get(task)
+        if current is not None and (current.size >= self.rotate_bytes or now - current.opened >= self.rotate_seconds):
+            self._close_file(task)
+            current = None
+        if current is None:
+            current = self._open_file(task, now)
+        current.file.write(line)
+        current.size += len(line)
+        self._unsynced.add(task)
+        self.maintain()
+
+    def maintain(self):
+        """Flushes and fsyncs when their intervals are up; the scheduler also calls this while idle."""
+        now = time.monotonic()
+        if now - self._last_fsync >= self.fsync_interval:
+            self.sync()
+        elif now - self._last_flush >= self.flush_interval:
+            for current in self._files.values():
+                current.file.flush()
+            self._last_flush = now
+
+    def sync(self):
+        for task in self._unsynced:
+            current = self._files.get(task)
+            if current is not None:
+                current.file.flush()
+                os.fsync(current.file.fileno())
+        self._unsynced.clear()
+        self._last_flush = self._last_fsync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        for task in list(self._files):
+            self._close_file(task)
+
+    def _open_file(self, task, now):
+        task_dir = os.path.join(self.directory, task)
+        os.makedirs(task_dir, mode=0o755, exist_ok=True)
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))
+        path = os.path.join(task_dir, f"{stamp}.jsonl")
+        sequence = 0
+        while os.path.exists(path):
+            sequence += 1
+            path = os.path.join(task_dir, f"{stamp}-{sequence}.jsonl")
+        current = self._files[task] = _OpenResultFile(open(path, 'ab', buffering=64 * 1024), path, now, 0)
+        self._expire(task_dir, now)
+        return current
+
+    def _close_file(self, task):
+        current = self._files.pop(task)
+        current.file.flush()
+        if task in self._unsynced:
+            os.fsync(current.file.fileno())
+            self._unsynced.discard(task)
+        current.file.close()
+
+    def _expire(self, task_dir, now):
+        # A file ends where the next one starts; the newest one is still being written.
+        files = result_files(task_dir)
+        for (_start, path), (next_start, _next_path) in zip(files, files[1:]):
+            if next_start < now - self.retention_seconds:
+                os.remove(path)
+
+
+def result_files(task_dir):
+    """Returns [(start time, path)] of a task's result files, oldest first."""
+    try:
+        names = os.listdir(task_dir)
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        match = RESULT_FILE_PATTERN.match(name)
+        if match:
+            start = datetime.datetime.strptime(match.group(1), '%Y%m%dT%H%M%S').replace(tzinfo=datetime.timezone.utc)
+            files.append((start.timestamp(), int(match.group(2) or 0), os.path.join(task_dir, name)))
+    files.sort()
+    return [(start, path) for start, _sequence, path in files]
+
+
+def read_results(task, start=None, end=None, directory=LOG_DIR):
+    """Yields the stored records of ``task`` with start <= ts <= end (unix times), oldest first."""
+    files = result_files(os.path.join(directory, task))
+    for index, (file_start, path) in enumerate(files):
+        # Allow a second of slack: names are truncated to whole seconds.
+        file_end = files[index + 1][0] + 1 if index + 1 < len(files) else float('inf')
+        if end is not None and file_start > end:
+            break
+        if start is not None and file_end < start:
+            continue
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # cut short by a crash
+                if (start is None or record['ts'] >= start) and (end is None or record['ts'] <= end):
+                    yield record
+
+
+# --- Self-Instrumentation ---
+# What the agent costs, in Prometheus text format: per-task run counts, failures
+# (errors, timeouts and non-zero exit codes), missed runs, run duration and scheduling
+# lag histograms (lag = how long after its due time a run actually started, including
+# any wait for a concurrency slot), and the agent's own CPU time and memory. CPU time
+# of finished commands is reported separately as children CPU.
+
+METRIC_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+AGENT_START_TIME = time.time()
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(METRIC_BUCKETS_SECONDS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(METRIC_BUCKETS_SECONDS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(states):
+    """Renders the scheduler's task states and the agent's own usage as Prometheus text."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    def histogram(name, help_text, attribute):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for state in states:
+            task = _label(state.task['name'])
+            values = getattr(state, attribute)
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS_SECONDS, values.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{task="{task}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{task="{task}",le="+Inf"}} {values.count}')
+            lines.append(f'{name}_sum{{task="{task}"}} {round(values.sum, 6)}')
+            lines.append(f'{name}_count{{task="{task}"}} {values.count}')
+
+    for attribute, help_text in (('runs', 'Runs started.'), ('failures', 'Runs that failed, timed out or exited non-zero.'),
+                                 ('timeouts', 'Runs stopped by their timeout.'), ('missed', 'Due runs skipped.')):
+        metric(f"monitoring_agent_task_{attribute}_total", 'counter', help_text,
+               [((('task', state.task['name']),), getattr(state, attribute)) for state in states])
+    histogram("monitoring_agent_task_duration_seconds", "Run duration.", 'duration')
+    histogram("monitoring_agent_task_lag_seconds", "Delay between a run's due time and its start.", 'lag')
+
+    times = os.times()
+    metric("process_cpu_seconds_total", 'counter', "Agent CPU time (user and system).",
+           [((), round(times.user + times.system, 3))])
+    metric("monitoring_agent_children_cpu_seconds_total", 'counter', "CPU time of finished task commands.",
+           [((), round(times.children_user + times.children_system, 3))])
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+        metric("process_resident_memory_bytes", 'gauge', "Agent resident memory.", [((), rss)])
+    except OSError:
+        pass
+    metric("process_start_time_seconds", 'gauge', "Agent start time (unix seconds).", [((), round(AGENT_START_TIME, 3))])
+    return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(states, port, host="127.0.0.1"):
+    """Serves render_metrics() at /metrics on a local port; returns the asyncio server."""
+
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while True:
+                header = await asyncio.wait_for(reader.readline(), 5)
+                if header in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] in (b"/metrics", b"/"):
+                status, body = "200 OK", render_metrics(states).encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
 # --- Functions ---
 
 def ensure_log_directory_exists():
@@ -76,97 +1024,221 @@ def ensure_log_directory_exists():
     if os.geteuid() == 0: # If running as root
         os.chmod(LOG_DIR, 0o755) # drwxr-xr-x
 
-def run_command_and_log(task_name, command_str, log_file_path):
-    """Runs a shell command and logs its output to a file."""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+async def run_command(task, timeout):
+    """Runs a task's shell command; returns (exit code, payload)."""
+    # The shell runs in its own session so that a timeout can kill the whole pipeline.
+    process = await asyncio.create_subprocess_shell(
+        task['command'],
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
     try:
-        # Use shell=True for piping and complex commands
-        # Capture stdout and stderr
-        result = subprocess.run(
-            command_str,
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False # Don't raise exception for non-zero exit codes
-        )
-        output = result.stdout
-        error_output = result.stderr
-
-        with open(log_file_path, "a") as f:
-            f.write(f"--- {task_name} Output ({timestamp}) ---\n")
-            if output:
-                f.write(output.strip() + "\n")
-            if error_output:
-                f.write(f"--- Error ({timestamp}) ---\n")
-                f.write(error_output.strip() + "\n")
-            f.write("\n") # Add a newline for separation between entries
-
-    except Exception as e:
-        with open(log_file_path, "a") as f:
-            f.write(f"--- Error Running {task_name} ({timestamp}) ---\n")
-            f.write(f"Exception: {e}\n")
-            f.write("\n")
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        if isinstance(e, asyncio.TimeoutError):
+            await process.wait()
+        raise
+    return process.returncode, {'stdout': stdout.decode(errors='replace'), 'stderr': stderr.decode(errors='replace')}
+
+async def run_collector(task, timeout, on_overrun=None):
+    """
+    Runs a built-in collector in a worker thread; returns (0, payload).
+    A collector that overruns is abandoned, not interrupted: threads cannot be
+    killed. Before asyncio.TimeoutError is raised, ``on_overrun`` gets the
+    future of the still running thread.
+    """
+    loop = asyncio.get_running_loop()
+    work = loop.run_in_executor(None, COLLECTORS[task['collector']], task)
+    try:
+        # shield() keeps ``work`` pending until the thread has really returned.
+        payload = await asyncio.wait_for(asyncio.shield(work), timeout)
+    except asyncio.TimeoutError:
+        if on_overrun is not None:
+            on_overrun(work)
+        raise
+    return 0, payload
+
+async def run_task(task, timeout, on_overrun=None):
+    """Runs one task; returns (exit code, payload) or raises asyncio.TimeoutError if it overran."""
+    if task.get('collector'):
+        return await run_collector(task, timeout, on_overrun)
+    return await run_command(task, timeout)
+
+
+class TaskState:
+    """Scheduling bookkeeping for one task."""
+    __slots__ = ('task', 'next_due', 'running', 'runs', 'missed', 'timeouts', 'failures', 'duration', 'lag')
+
+    def __init__(self, task, next_due):
+        self.task = task
+        self.next_due = next_due
+        self.running = False
+        self.runs = 0
+        self.missed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.duration = Histogram()
+        self.lag = Histogram()
+
+
+class TaskScheduler:
+    """
+    Runs monitoring tasks concurrently from a min-heap ordered by next due time.
+
+    Each task is due at fixed multiples of its interval from the agent's start
+    (monotonic clock), so slow runs and late wake-ups never shift later runs.
+    A due time that passes while the task is still running, or that the
+    scheduler only reaches after the following one, is counted as missed
+    instead of being run late; a late scheduler runs the task for the latest
+    due time that has passed and measures lag from it. At most ``max_concurrency`` runs are active at
+    a time; each is limited to its task's timeout. Results go to ``store``.
+    """
+
+    def __init__(self, tasks, store, max_concurrency=MAX_CONCURRENT_TASKS, default_timeout=TASK_TIMEOUT_SECONDS):
+        self.store = store
+        self.default_timeout = default_timeout
+        self.max_concurrency = max_concurrency
+        start = time.monotonic()
+        self.states = [TaskState(task, start) for task in tasks if task['enabled']]
+        self._heap = [(state.next_due, index, state) for index, state in enumerate(self.states)]
+        heapq.heapify(self._heap)
+        self._running = set()
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            while self._heap:
+                due, index, state = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.store.maintain()
+                    await asyncio.sleep(min(delay, self.store.flush_interval))
+                    continue
+                interval = state.task['interval']
+                # Run for the latest due time that has gone by; the earlier ones are missed.
+                behind = int((time.monotonic() - due) // interval)
+                if behind:
+                    self._miss(state, behind, "scheduler woke late")
+                    due += behind * interval
+                if state.running:
+                    self._miss(state, 1, "previous run still in progress")
+                else:
+                    state.running = True
+                    run = asyncio.ensure_future(self._run(state, due))
+                    self._running.add(run)
+                    run.add_done_callback(self._running.discard)
+                state.next_due = due + interval
+                heapq.heapreplace(self._heap, (state.next_due, index, state))
+        finally:
+            for run in list(self._running):
+                run.cancel()
+
+    def _miss(self, state, count, reason):
+        state.missed += count
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"[{timestamp}] Skipped {count} run(s) of {state.task['name']}: {reason} (missed so far: {state.missed})")
+
+    async def _run(self, state, due):
+        task = state.task
+        overrun = []
+        try:
+            async with self._semaphore:
+                state.lag.observe(max(0.0, time.monotonic() - due))
+                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{timestamp}] Running {task['name']}...")
+                state.runs += 1
+                timeout = task.get('timeout', self.default_timeout)
+                started = time.monotonic()
+                error = None
+                try:
+                    exit_code, payload = await run_task(task, timeout, overrun.append)
+                except asyncio.TimeoutError:
+                    state.timeouts += 1
+                    exit_code, payload, error = None, None, f"Timed out after {timeout}s"
+                except Exception as e:
+                    exit_code, payload, error = None, None, f"{type(e).__name__}: {e}"
+                duration = time.monotonic() - started
+                state.duration.observe(duration)
+                if error is not None or exit_code != 0:
+                    state.failures += 1
+                if payload is not None or error is not None:
+                    self.store.append(task['name'], duration, exit_code, payload, error)
+        finally:
+            # Collectors share state (log followers, socket tables, I/O samplers) that is not
+            # thread-safe, so an abandoned run still counts as running until its thread returns.
+            if overrun and not overrun[0].done():
+                overrun[0].add_done_callback(lambda work: self._overrun_finished(state, work))
+            else:
+                state.running = False
+
+    def _overrun_finished(self, state, work):
+        state.running = False
+        if not work.cancelled():
+            work.exception()  # retrieved, so a late failure is not reported as never retrieved
+
+
+async def run_agent(scheduler, metrics_port=None):
+    """Runs the scheduler with SIGUSR1 metric dumps and, if configured, the metrics endpoint."""
+    metrics_port = metrics_port if metrics_port is not None else METRICS_PORT
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, lambda: print(render_metrics(scheduler.states), end="", flush=True))
+    server = None
+    if metrics_port:
+        server = await serve_metrics(scheduler.states, metrics_port)
+        print(f"Serving agent metrics at http://127.0.0.1:{metrics_port}/metrics")
+    try:
+        await scheduler.run()
+    finally:
+        loop.remove_signal_handler(signal.SIGUSR1)
+        if server is not None:
+            server.close()
+            await server.wait_closed()
 
 def main_loop():
     """Main loop to run monitoring tasks."""
     print(f"Starting system monitoring agent. Logs will be in {LOG_DIR}")
     ensure_log_directory_exists()
 
-    last_run_times = {task['name']: 0 for task in monitoring_tasks if task['enabled']}
-
-    while True:
-        current_time = time.time()
-        for task in monitoring_tasks:
-            if not task['enabled']:
-                continue
+    store = ResultStore(LOG_DIR)
+    scheduler = TaskScheduler(monitoring_tasks, store)
+    try:
+        asyncio.run(run_agent(scheduler))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+    for state in scheduler.states:
+        print(f"{state.task['name']}: {state.runs} run(s), {state.failures} failed, {state.missed} missed, "
+              f"{state.timeouts} timed out")
 
-            if current_time - last_run_times[task['name']] >= task['interval']:
-                log_file_path = os.path.join(LOG_DIR, f"{task['name']}.log")
-                print(f"[{timestamp}] Running {task['name']}...")
-                run_command_and_log(task['name'], task['command'], log_file_path)
-                last_run_times[task['name']] = current_time
-        
-        time.sleep(1) # Sleep briefly to avoid busy-waiting
+def show_results(task_name, since):
+    """Prints one task's stored results from the last ``since`` seconds."""
+    start = time.time() - since if since is not None else None
+    for record in read_results(task_name, start=start):
+        when = datetime.datetime.fromtimestamp(record['ts']).strftime("%Y-%m-%d %H:%M:%S")
+        outcome = record.get('error') or f"exit {record['exit_code']}"
+        print(f"[{when}] {record['duration']:.3f}s {outcome} {json.dumps(record['payload'])}")
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="System monitoring agent")
+    parser.add_argument("--show", metavar="TASK", help="print a task's stored results instead of monitoring")
+    parser.add_argument("--since", type=float, metavar="SECONDS", help="with --show, only results from the last SECONDS")
+    args = parser.parse_args()
+    if args.show:
+        show_results(args.show, args.since)
+        exit(0)
+
     # Check if running as root (required for most monitoring commands)
     if os.geteuid() != 0:
         print("This script requires root privileges. Please run with sudo.")
         print("Example: sudo python3 your_monitoring_agent.py")
         exit(1)
 
-    # --- Initial setup for iotop ---
-    # This part should ideally be run once manually or as part of a setup script,
-    # not every time the agent starts.
-    print("Checking for iotop installation...")
-    try:
-        subprocess.run(["which", "iotop"], check=True, capture_output=True)
-        print("iotop is installed.")
-    except subprocess.CalledProcessError:
-        print("iotop not found. Attempting to install iotop...")
-        try:
-            # Note: This will block the script until installation is complete.
-            # In a production agent, you'd handle this more gracefully or assume pre-installation.
-            subprocess.run(["sudo", "apt", "install", "-y", "iotop"], check=True)
-            print("iotop installed successfully.")
-        except Exception as e:
-            print(f"Failed to install iotop. Please install it manually: sudo apt install iotop. Error: {e}")
-            # Optionally disable iotop_monitor if installation failed
-            for task in monitoring_tasks:
-                if task['name'] == 'iotop_monitor':
-                    task['enabled'] = False
-            
-    # --- Check for 'ss' vs 'netstat' (adapt if 'ss' is missing) ---
-    try:
-        subprocess.run(["which", "ss"], check=True, capture_output=True)
-        print("Using 'ss' for network monitoring.")
-    except subprocess.CalledProcessError:
-        print("'ss' command not found. Falling back to 'netstat' for network monitoring.")
-        for task in monitoring_tasks:
-            if task['name'] == 'network_connections':
-                task['command'] = "netstat -tulpn"
-
-
     main_loop()
 
@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakeproc import FakeProc
+
+
+@pytest.fixture
+def proc(tmp_path):
+    return FakeProc(tmp_path / 'proc')
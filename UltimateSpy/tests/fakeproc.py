@@ -0,0 +1,41 @@
+"""A fake /proc tree for the sampler tests."""
+import os
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+
+class FakeProc:
+    """A /proc-style tree: meminfo, uptime, per-pid stat/cmdline/io/fd and net tables."""
+
+    def __init__(self, root, uptime=1000.0, mem_total_kb=1000000):
+        self.root = root
+        (root / 'net').mkdir(parents=True)
+        (root / 'meminfo').write_text(f"MemTotal:       {mem_total_kb} kB\nMemFree:        1 kB\n")
+        self.set_uptime(uptime)
+
+    def set_uptime(self, uptime):
+        (self.root / 'uptime').write_text(f"{uptime:.2f} 1.00\n")
+
+    def process(self, pid, comm, utime=0, stime=0, start=100, rss=256, threads=1, cmdline=b'', ppid=1):
+        directory = self.root / str(pid)
+        (directory / 'fd').mkdir(parents=True, exist_ok=True)
+        fields = ['S', ppid, pid, pid, 0, -1, 0, 0, 0, 0, 0, utime, stime, 0, 0, 20, 0, threads, 0, start,
+                  4096 * 1024, rss, 0, 0]
+        (directory / 'stat').write_bytes(f"{pid} ({comm}) ".encode() + ' '.join(map(str, fields)).encode() + b"\n")
+        (directory / 'cmdline').write_bytes(cmdline)
+        return directory
+
+    def io(self, pid, read_bytes, write_bytes):
+        (self.root / str(pid) / 'io').write_text(
+            f"rchar: 1\nwchar: 1\nsyscr: 1\nsyscw: 1\nread_bytes: {read_bytes}\nwrite_bytes: {write_bytes}\n"
+            "cancelled_write_bytes: 0\n")
+
+    def socket(self, pid, fd, inode):
+        os.symlink(f"socket:[{inode}]", str(self.root / str(pid) / 'fd' / str(fd)))
+
+    def net(self, table, rows):
+        lines = [TCP_HEADER]
+        for index, (local, remote, state, inode) in enumerate(rows):
+            lines.append(f"{index:4}: {local} {remote} {state} 00000000:00000000 00:00000000 00000000     0        0 "
+                         f"{inode} 1 0000000000000000 100 0 0 10 0\n")
+        (self.root / 'net' / table).write_text(''.join(lines))
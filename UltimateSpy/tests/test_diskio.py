@@ -0,0 +1,24 @@
+import types
+import pytest
+import monitoring_king as mk
+from monitoring_king import IoSampler, ProcSampler
+
+
+def test_io_rates_use_the_time_the_counters_were_read(proc, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(mk, 'time', types.SimpleNamespace(monotonic=lambda: clock[0], time=lambda: clock[0]))
+    proc.process(10, 'writer')
+    proc.io(10, 0, 0)
+    sampler = ProcSampler(proc=str(proc.root), max_age=1.0)
+    io = IoSampler(proc=str(proc.root), sampler=sampler)
+    assert io.rates() == []
+    clock[0] = 10.0
+    proc.process(11, 'newcomer')
+    proc.io(11, 500, 0)
+    sampler.snapshot()  # taken by another collector
+    clock[0] = 10.9
+    proc.io(10, 1090, 2180)
+    rates = {process.pid: (read, write) for process, read, write in io.rates()}
+    assert rates[10] == (pytest.approx(100.0), pytest.approx(200.0))
+    assert rates[11] == (pytest.approx(500 / 10.9), 0.0)  # new since the previous scan: counted from zero
+    assert io.rates() is io.rates()  # same snapshot, same result
@@ -0,0 +1,51 @@
+import asyncio
+from monitoring_king import TaskState, render_metrics, serve_metrics
+
+
+def make_state(name):
+    state = TaskState({'name': name}, 0)
+    state.runs, state.failures, state.timeouts, state.missed = 5, 2, 1, 3
+    for value in (0.003, 2.0, 100.0):
+        state.lag.observe(value)
+    return state
+
+def test_render_metrics():
+    text = render_metrics([make_state('disk'), make_state('a"b\\c')])
+    lines = text.splitlines()
+    assert "# TYPE monitoring_agent_task_runs_total counter" in lines
+    assert 'monitoring_agent_task_runs_total{task="disk"} 5' in lines
+    assert 'monitoring_agent_task_missed_total{task="a\\"b\\\\c"} 3' in lines
+    lag = {line.split(' ')[0]: line.split(' ')[1] for line in lines if line.startswith('monitoring_agent_task_lag_seconds')
+           and 'task="disk"' in line}
+    assert lag['monitoring_agent_task_lag_seconds_bucket{task="disk",le="0.0025"}'] == '0'
+    assert lag['monitoring_agent_task_lag_seconds_bucket{task="disk",le="0.005"}'] == '1'
+    assert lag['monitoring_agent_task_lag_seconds_bucket{task="disk",le="2.5"}'] == '2'
+    assert lag['monitoring_agent_task_lag_seconds_bucket{task="disk",le="30"}'] == '2'
+    assert lag['monitoring_agent_task_lag_seconds_bucket{task="disk",le="+Inf"}'] == '3'
+    assert lag['monitoring_agent_task_lag_seconds_sum{task="disk"}'] == '102.003'
+    assert lag['monitoring_agent_task_lag_seconds_count{task="disk"}'] == '3'
+    assert 'monitoring_agent_task_duration_seconds_count{task="disk"} 0' in lines
+    assert any(line.startswith('process_cpu_seconds_total ') for line in lines)
+    assert text.endswith("\n")
+
+def test_serve_metrics():
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: x\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def main():
+        server = await serve_metrics([make_state('disk')], 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, '/metrics'), await get(port, '/other')
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    found, missing = asyncio.run(main())
+    assert found.startswith(b"HTTP/1.0 200 OK\r\n")
+    assert b'monitoring_agent_task_runs_total{task="disk"} 5' in found
+    assert missing.startswith(b"HTTP/1.0 404 Not Found")
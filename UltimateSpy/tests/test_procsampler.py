@@ -0,0 +1,42 @@
+import os
+import pwd
+import shutil
+import pytest
+from monitoring_king import CLK_TCK, PAGE_SIZE, ProcSampler
+
+
+def by_pid(processes):
+    return {process.pid: process for process in processes}
+
+def test_stat_parsing_survives_parentheses_in_comm(proc):
+    proc.process(10, 'evil) S 99 (x', utime=3, stime=4, threads=7, rss=2500, ppid=42, cmdline=b'python\0x.py\0')
+    proc.process(11, 'kworker/0:1')
+    sampler = ProcSampler(proc=str(proc.root))
+    processes = by_pid(sampler._scan(0.0))
+    evil = processes[10]
+    assert (evil.name, evil.ppid, evil.state, evil.threads, evil.start) == ('evil) S 99 (x', 42, 'S', 7, 100)
+    assert evil.cmdline == 'python x.py'
+    assert evil.rss_kb == 2500 * PAGE_SIZE // 1024
+    assert evil.mem_percent == pytest.approx(evil.rss_kb * 100.0 / 1000000)
+    assert evil.user == pwd.getpwuid(os.getuid()).pw_name
+    assert processes[11].cmdline == '[kworker/0:1]'
+
+def test_cpu_percent_over_lifetime_then_between_scans(proc):
+    proc.process(10, 'busy', utime=50 * CLK_TCK, start=500 * CLK_TCK)
+    sampler = ProcSampler(proc=str(proc.root))
+    assert sampler._scan(10.0)[0].cpu_percent == pytest.approx(10.0)  # 50 s of CPU in 500 s of life
+    proc.process(10, 'busy', utime=51 * CLK_TCK, start=500 * CLK_TCK)
+    assert sampler._scan(12.0)[0].cpu_percent == pytest.approx(50.0)  # 1 s of CPU in 2 s
+    proc.process(10, 'reused', utime=CLK_TCK, start=990 * CLK_TCK)  # same pid, new process
+    [reused] = sampler._scan(14.0)
+    assert reused.cpu_percent == pytest.approx(10.0) and reused.name == 'reused'
+
+def test_snapshot_is_shared_within_max_age_and_drops_exited(proc):
+    proc.process(10, 'a')
+    proc.process(11, 'b')
+    sampler = ProcSampler(proc=str(proc.root), max_age=60)
+    first = sampler.snapshot()
+    assert sampler.snapshot() is first and sorted(first.pids) == [10, 11]
+    shutil.rmtree(str(proc.root / '11'))
+    assert [process.pid for process in sampler._scan(1.0)] == [10]
+    assert list(sampler._static) == [10]
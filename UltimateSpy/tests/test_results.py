@@ -0,0 +1,96 @@
+import calendar
+import json
+import os
+import time
+import pytest
+from monitoring_king import ResultStore, read_results, result_files
+
+
+def stamp(ts):
+    return time.strftime('%Y%m%dT%H%M%S', time.gmtime(ts))
+
+def write_file(task_dir, ts, records, suffix=''):
+    os.makedirs(task_dir, exist_ok=True)
+    with open(os.path.join(task_dir, f"{stamp(ts)}{suffix}.jsonl"), 'w') as f:
+        for record_ts in records:
+            f.write(json.dumps({'task': 't', 'ts': record_ts, 'duration': 0.1, 'exit_code': 0, 'payload': None}) + "\n")
+
+@pytest.fixture
+def store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        result = ResultStore(str(tmp_path), **kwargs)
+        stores.append(result)
+        return result
+    yield make
+    for result in stores:
+        result.close()
+
+def test_records_round_trip(store, tmp_path):
+    results = store()
+    results.append('disk', 0.25, 0, {'free': 1})
+    results.append('disk', 30.0, None, None, error="Timed out after 30s")
+    results.close()
+    records = list(read_results('disk', directory=str(tmp_path)))
+    assert [(r['exit_code'], r['payload'], r.get('error')) for r in records] == [
+        (0, {'free': 1}, None), (None, None, "Timed out after 30s")]
+    assert records[0]['task'] == 'disk' and records[0]['duration'] == 0.25
+
+def test_flush_interval_makes_records_visible_without_closing(store, tmp_path):
+    results = store(flush_interval=0)
+    results.append('disk', 0.1, 0, 'x')
+    assert [r['payload'] for r in read_results('disk', directory=str(tmp_path))] == ['x']
+
+def test_rotation_by_size_numbers_files_within_a_second(store, tmp_path):
+    results = store(rotate_bytes=1)
+    for i in range(4):
+        results.append('cpu', 0.1, 0, i)
+    results.close()
+    names = [os.path.basename(path) for _start, path in result_files(str(tmp_path / 'cpu'))]
+    assert len(names) == 4
+    assert [r['payload'] for r in read_results('cpu', directory=str(tmp_path))] == [0, 1, 2, 3]
+
+def test_rotation_by_age(store, tmp_path):
+    results = store(rotate_seconds=0)
+    results.append('cpu', 0.1, 0, 1)
+    results.append('cpu', 0.1, 0, 2)
+    assert len(result_files(str(tmp_path / 'cpu'))) == 2
+
+def test_sequence_suffixes_sort_after_the_base_name(tmp_path):
+    task_dir = str(tmp_path / 't')
+    for suffix in ('-10', '', '-2'):
+        write_file(task_dir, 1000, [], suffix)
+    assert [os.path.basename(path) for _start, path in result_files(task_dir)] == [
+        '19700101T001640.jsonl', '19700101T001640-2.jsonl', '19700101T001640-10.jsonl']
+
+def test_retention_removes_files_that_ended_before_the_cutoff(store, tmp_path):
+    task_dir = str(tmp_path / 'net')
+    now = time.time()
+    write_file(task_dir, now - 10 * 86400, [now - 10 * 86400])
+    write_file(task_dir, now - 5 * 86400, [now - 5 * 86400])
+    write_file(task_dir, now - 3600, [now - 3600])
+    store(retention_seconds=2 * 86400).append('net', 0.1, 0, None)
+    kept = [start for start, _path in result_files(task_dir)]
+    # The 5-day-old file ran until the 1-hour-old one started, so it still holds recent results.
+    assert len(kept) == 3 and kept[0] == pytest.approx(now - 5 * 86400, abs=1)
+
+def test_read_results_range_edges(tmp_path):
+    base = calendar.timegm((2024, 1, 1, 0, 0, 0))
+    task_dir = str(tmp_path / 't')
+    write_file(task_dir, base, [base + 0.5, base + 5, base + 9.5])
+    write_file(task_dir, base + 10, [base + 10, base + 15])
+    with open(os.path.join(task_dir, f"{stamp(base + 10)}.jsonl"), 'a') as f:
+        f.write('{"task": "t", "ts": ')  # cut short by a crash
+
+    def between(start=None, end=None):
+        start = base + start if start is not None else None
+        end = base + end if end is not None else None
+        return [r['ts'] - base for r in read_results('t', start, end, directory=str(tmp_path))]
+    assert between() == [0.5, 5, 9.5, 10, 15]
+    assert between(5, 10) == [5, 9.5, 10]
+    assert between(10.5) == [15]
+    assert between(end=0.5) == [0.5]
+    assert between(16) == []
+    assert between(end=0.4) == []
+    assert list(read_results('missing', directory=str(tmp_path))) == []
@@ -0,0 +1,82 @@
+import asyncio
+import time
+import pytest
+import monitoring_king as mk
+from monitoring_king import ResultStore, TaskScheduler, read_results
+
+
+@pytest.fixture
+def store(tmp_path):
+    result = ResultStore(str(tmp_path), flush_interval=0.05)
+    yield result
+    result.close()
+
+@pytest.fixture
+def collector(monkeypatch):
+    def add(name, function):
+        monkeypatch.setitem(mk.COLLECTORS, name, function)
+    return add
+
+def run_for(scheduler, seconds):
+    async def main():
+        try:
+            await asyncio.wait_for(scheduler.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(main())
+
+def task(name, interval, **extra):
+    return dict({'name': name, 'interval': interval, 'enabled': True}, **extra)
+
+def test_late_wakeup_runs_the_latest_due_time(store, collector):
+    collector('noop', lambda task: {})
+    scheduler = TaskScheduler([task('late', 1.0, collector='noop')], store)
+    state = scheduler.states[0]
+    start = time.monotonic()
+    scheduler._heap = [(start - 2.5, 0, state)]
+    run_for(scheduler, 0.2)
+    assert (state.missed, state.runs) == (2, 1)
+    assert state.lag.sum == pytest.approx(0.5, abs=0.1)  # from start - 0.5, not start - 2.5
+    assert state.next_due == pytest.approx(start + 0.5, abs=0.01)
+
+def test_overlapping_runs_are_missed_not_queued(store, collector):
+    collector('slow', lambda task: time.sleep(0.25) or {})
+    scheduler = TaskScheduler([task('slow', 0.1, collector='slow')], store)
+    run_for(scheduler, 0.45)
+    state = scheduler.states[0]
+    assert state.runs >= 1 and state.missed >= 2
+    assert state.runs + state.missed >= 4
+
+def test_disabled_tasks_are_not_scheduled(store):
+    scheduler = TaskScheduler([task('off', 1.0, enabled=False, command='true')], store)
+    assert scheduler.states == []
+
+def test_timeouts_and_exit_codes_are_recorded(store, collector, tmp_path):
+    collector('stuck', lambda task: time.sleep(0.5) or {})
+    tasks = [task('stuck', 60, collector='stuck', timeout=0.05), task('cmd', 60, command='echo hi; exit 3')]
+    scheduler = TaskScheduler(tasks, store)
+    run_for(scheduler, 0.4)
+    store.close()
+    stuck, cmd = scheduler.states
+    assert (stuck.runs, stuck.timeouts, stuck.failures) == (1, 1, 1)
+    assert (cmd.runs, cmd.timeouts, cmd.failures) == (1, 0, 1)
+    [timed_out] = read_results('stuck', directory=str(tmp_path))
+    assert timed_out['error'] == "Timed out after 0.05s" and timed_out['exit_code'] is None
+    [finished] = read_results('cmd', directory=str(tmp_path))
+    assert finished['exit_code'] == 3 and finished['payload']['stdout'] == "hi\n"
+
+def test_timed_out_collector_blocks_the_next_run_until_its_thread_returns(store, collector):
+    active, overlaps = [], []
+
+    def slow(task):
+        overlaps.append(len(active))
+        active.append(1)
+        time.sleep(0.3)
+        active.pop()
+        return {}
+    collector('slow', slow)
+    scheduler = TaskScheduler([task('slow', 0.1, collector='slow', timeout=0.05)], store)
+    run_for(scheduler, 0.55)
+    state = scheduler.states[0]
+    assert overlaps == [0] * state.runs and state.runs >= 2
+    assert state.timeouts == state.runs and state.missed >= 3
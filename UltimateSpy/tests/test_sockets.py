@@ -0,0 +1,63 @@
+import pytest
+from monitoring_king import ProcSampler, SocketTable, decode_proc_net_address, socket_record
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('0100007F:0035', '127.0.0.1:53'),
+    ('00000000:1F90', '0.0.0.0:8080'),
+    ('00000000000000000000000001000000:0035', '[::1]:53'),
+    ('B80D0120000000000000000001000000:01BB', '[2001:db8::1]:443'),
+    ('000080FE00000000FF000000020000A0:0016', '[fe80::ff:a000:2]:22'),
+    ('0000000000000000FFFF00000100007F:0050', '[::ffff:127.0.0.1]:80'),
+])
+def test_decode_proc_net_address(text, expected):
+    assert decode_proc_net_address(text) == expected
+
+@pytest.fixture
+def sockets(proc):
+    proc.process(10, 'named', utime=100)
+    proc.process(20, 'curl', utime=5)
+    proc.socket(10, 3, 1001)
+    proc.socket(10, 4, 1003)
+    proc.socket(20, 3, 1002)
+    proc.socket(20, 4, 2001)
+    proc.net('tcp', [
+        ('0100007F:0035', '00000000:0000', '0A', 1001),
+        ('0200000A:9C40', '0100000A:01BB', '01', 1002),
+        ('0200000A:9C41', '0100000A:01BB', '06', 0),     # TIME_WAIT
+        ('0200000A:9C42', '0100000A:01BB', '02', 1009),  # SYN_SENT
+    ])
+    proc.net('tcp6', [('00000000000000000000000001000000:1F90', '00000000000000000000000000000000:0000', '0A', 1003)])
+    proc.net('udp', [('00000000:0035', '00000000:0000', '07', 2001), ('0200000A:A000', '0100000A:0035', '01', 2002)])
+    return proc
+
+def records(entries):
+    return sorted((socket_record(entry) for entry in entries), key=lambda record: (record['table'], record['local']))
+
+def test_socket_table_reports_owners_then_changes(sockets):
+    table = SocketTable(proc=str(sockets.root), sampler=ProcSampler(proc=str(sockets.root)))
+    opened, closed = table.poll()
+    assert closed == []
+    assert records(opened) == [
+        {'table': 'tcp', 'state': 'ESTAB', 'local': '10.0.0.2:40000', 'remote': '10.0.0.1:443', 'pid': 20, 'process': 'curl'},
+        {'table': 'tcp', 'state': 'LISTEN', 'local': '127.0.0.1:53', 'remote': None, 'pid': 10, 'process': 'named'},
+        {'table': 'tcp6', 'state': 'LISTEN', 'local': '[::1]:8080', 'remote': None, 'pid': 10, 'process': 'named'},
+        {'table': 'udp', 'state': 'LISTEN', 'local': '0.0.0.0:53', 'remote': None, 'pid': 20, 'process': 'curl'},
+        {'table': 'udp', 'state': 'ESTAB', 'local': '10.0.0.2:40960', 'remote': '10.0.0.1:53', 'pid': None, 'process': None},
+    ]
+    assert table.poll() == ([], [])
+    scans = table.fd_scans
+
+    sockets.socket(20, 5, 1004)
+    sockets.net('tcp', [('0100007F:0035', '00000000:0000', '0A', 1001), ('00000000:0016', '00000000:0000', '0A', 1004)])
+    opened, closed = table.poll()
+    assert records(opened) == [
+        {'table': 'tcp', 'state': 'LISTEN', 'local': '0.0.0.0:22', 'remote': None, 'pid': 20, 'process': 'curl'}]
+    assert [record['local'] for record in records(closed)] == ['10.0.0.2:40000']
+    assert table.fd_scans - scans <= 2
+
+def test_socket_table_listeners_only(sockets):
+    table = SocketTable(proc=str(sockets.root), sampler=ProcSampler(proc=str(sockets.root)), connections=False)
+    opened, _closed = table.poll()
+    assert {record['state'] for record in records(opened)} == {'LISTEN'}
+    assert len(opened) == 3
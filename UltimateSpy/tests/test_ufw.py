@@ -0,0 +1,118 @@
+import os
+import pytest
+from monitoring_king import UfwLogFollower, parse_ufw_line
+
+LINE = ("Oct 18 14:00:{second:02d} host kernel: [12345.678901] [UFW {action}] IN=eth0 OUT= MAC=aa:bb "
+        "SRC={src} DST=10.0.0.2 LEN=60 TOS=0x00 TTL=50 ID=0 DF PROTO=TCP SPT=4444 DPT=22 WINDOW=0 SYN URGP=0\n")
+
+
+def line(second=1, src='203.0.113.5', action='BLOCK'):
+    return LINE.format(second=second, src=src, action=action)
+
+def append(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / 'ufw.log'
+    path.write_text(line(0, src='198.51.100.1'))
+    return str(path)
+
+@pytest.fixture
+def follow(log, tmp_path):
+    followers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('state_path', str(tmp_path / 'ufw.state'))
+        follower = UfwLogFollower(log, **kwargs)
+        followers.append(follower)
+        return follower
+    yield make
+    for follower in followers:
+        follower.close()
+
+def sources(events):
+    return [event.src for event in events]
+
+def test_parse_ufw_line():
+    event = parse_ufw_line(line(7, action='LIMIT BLOCK'))
+    assert event.to_dict() == {'time': 'Oct 18 14:00:07', 'action': 'LIMIT BLOCK', 'src': '203.0.113.5',
+                               'dst': '10.0.0.2', 'proto': 'TCP', 'spt': '4444', 'dpt': '22', 'interface': 'eth0'}
+    assert parse_ufw_line(line(action='ALLOW')) is None
+    assert parse_ufw_line("Oct 18 14:00:00 host sshd[1]: session opened") is None
+
+def test_starts_at_the_end_then_reads_appended_lines(follow, log):
+    follower = follow()
+    assert follower.poll() == []
+    append(log, line(1) + line(2, src='192.0.2.9') + "Oct 18 14:00:03 host kernel: [UFW BLO")
+    assert sources(follower.poll()) == ['203.0.113.5', '192.0.2.9']
+    assert follower.poll() == []
+    append(log, "CK] SRC=192.0.2.10 PROTO=UDP\n")
+    assert sources(follower.poll()) == ['192.0.2.10']
+    assert follower.blocked_by_source['203.0.113.5'] == 1
+
+def test_rotation_finishes_the_old_file_first(follow, log):
+    follower = follow()
+    follower.poll()
+    os.rename(log, log + '.1')
+    append(log + '.1', line(1, src='192.0.2.1'))  # written just before the rename took effect for the writer
+    append(log, line(2, src='192.0.2.2'))
+    assert sources(follower.poll()) == ['192.0.2.1', '192.0.2.2']
+    assert follower.rotations == 1
+    append(log, line(3, src='192.0.2.3'))
+    assert sources(follower.poll()) == ['192.0.2.3']
+
+def test_truncation_restarts_from_the_top(follow, log):
+    follower = follow()
+    follower.poll()
+    append(log, line(1) * 3)
+    follower.poll()
+    with open(log, 'w') as f:
+        f.write(line(2, src='192.0.2.7'))
+    assert sources(follower.poll()) == ['192.0.2.7']
+    assert follower.truncations == 1
+
+def test_restart_resumes_from_the_saved_offset(follow, log):
+    first = follow()
+    first.poll()
+    append(log, line(1, src='192.0.2.1'))
+    assert sources(first.poll()) == ['192.0.2.1']
+    first.close()
+    append(log, line(2, src='192.0.2.2'))
+    assert sources(follow().poll()) == ['192.0.2.2']
+
+def test_saved_offset_of_another_file_is_ignored(follow, log):
+    first = follow()
+    first.poll()
+    first.close()
+    with open(log + '.new', 'w') as f:
+        f.write(line(1) + line(2))
+    os.replace(log + '.new', log)
+    assert follow().poll() == []  # different inode: start at the end as usual
+
+def test_missing_log_is_read_from_the_start_once_it_appears(tmp_path):
+    path = str(tmp_path / 'later.log')
+    follower = UfwLogFollower(path)
+    try:
+        assert follower.poll() == []
+        append(path, line(1, src='192.0.2.1'))
+        assert sources(follower.poll()) == ['192.0.2.1']
+    finally:
+        follower.close()
+
+def test_max_bytes_spreads_a_backlog_over_polls(follow, log):
+    follower = follow(max_bytes=len(line()) * 2)
+    follower.poll()
+    append(log, ''.join(line(i, src=f"192.0.2.{i}") for i in range(5)))
+    batches = [sources(follower.poll()) for _ in range(4)]
+    assert batches == [['192.0.2.0', '192.0.2.1'], ['192.0.2.2', '192.0.2.3'], ['192.0.2.4'], []]
+
+def test_source_counts_stay_bounded(follow, log):
+    follower = follow(max_sources=4)
+    follower.poll()
+    append(log, line(1, src='192.0.2.1') * 3 + ''.join(line(2, src=f"198.51.100.{i}") for i in range(4)))
+    follower.poll()
+    assert len(follower.blocked_by_source) <= 4
+    assert follower.blocked_by_source['192.0.2.1'] == 3
+    assert follower.dropped_sources > 0
@@ -0,0 +1,248 @@
+"""
+Throughput benchmark for JsonFormatter and SecureJsonFormatter.
+
+Runs both formatters over synthetic workloads and reports records/sec,
+p50/p99 latency per record and peak bytes allocated per record. Results can
+be saved as a baseline and later compared against it to catch regressions:
+
+    python benchmarks/bench_formatters.py                       # print results
+    python benchmarks/bench_formatters.py --save-baseline       # write baseline.json
+    python benchmarks/bench_formatters.py --compare             # exit 1 on regression
+
+Run from the python-json-logger-patched directory. Workloads are generated
+from a fixed seed, so runs on the same machine are comparable. --compare
+warns when the baseline was recorded on another platform, Python version,
+record count or seed.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from pythonjsonlogger_patched import JsonFormatter  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+
+
+def load_secure_formatter():
+    """SecureJsonFormatter lives in the hardened test module; load it by path."""
+    path = os.path.join(ROOT, 'tests', 'secure_hardened_test.py')
+    spec = importlib.util.spec_from_file_location('secure_hardened_test', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SecureJsonFormatter
+
+
+# --- Workloads ---
+
+def make_record(message, extra):
+    record = logging.LogRecord('bench', logging.INFO, __file__, 1, message, None, None)
+    record.extra = extra
+    return record
+
+def flat_small(rng, n):
+    return [make_record('request handled', {
+        'host': f"web-{rng.randint(1, 20)}",
+        'path': f"/api/v1/items/{rng.randint(1, 10000)}",
+        'status': rng.choice([200, 200, 200, 404, 500]),
+        'duration_ms': round(rng.random() * 100, 3),
+        'cached': rng.random() < 0.5,
+    }) for _ in range(n)]
+
+def deep_nested(rng, n):
+    records = []
+    for _ in range(n):
+        node = {'value': rng.randint(0, 1000)}
+        for depth in range(20):
+            node = {'depth': depth, 'items': [rng.randint(0, 9), 'x' * 8, node], 'meta': {'k': 'v'}}
+        records.append(make_record('nested payload', {'payload': node}))
+    return records
+
+def control_chars(rng, n):
+    alphabet = 'abcdefghij "\\<>/\n\r\t\x00\x1b\x7f'
+    records = []
+    for _ in range(n):
+        text = ''.join(rng.choice(alphabet) for _ in range(4096))
+        records.append(make_record('untrusted input', {
+            'body': text,
+            'injected': f"<script>alert({rng.randint(0, 99)})</script>{text[:256]}",
+        }))
+    return records
+
+def redaction_heavy(rng, n):
+    sensitive = ['password', 'token', 'Authorization', 'cookie', 'secret']
+    records = []
+    for _ in range(n):
+        extra = {}
+        for i in range(30):
+            key = rng.choice(sensitive) if i % 3 == 0 else f"field_{i}"
+            extra[key if key not in extra else f"{key}_{i}"] = f"value-{rng.randint(0, 10 ** 6)}"
+        extra['headers'] = {name: 'Bearer abc.def.ghi' for name in sensitive}
+        records.append(make_record('auth event', extra))
+    return records
+
+WORKLOADS = {
+    'flat_small': flat_small,
+    'deep_nested': deep_nested,
+    'control_chars': control_chars,
+    'redaction_heavy': redaction_heavy,
+}
+
+
+# --- Measurement ---
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def measure(formatter, records, repeat):
+    best = None
+    for _ in range(repeat):
+        latencies = []
+        clock = time.perf_counter_ns
+        start = clock()
+        for record in records:
+            t0 = clock()
+            formatter.format(record)
+            latencies.append(clock() - t0)
+        elapsed = (clock() - start) / 1e9
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+    latencies.sort()
+    return {
+        'records_per_sec': len(records) / elapsed,
+        'p50_us': percentile(latencies, 0.50) / 1000,
+        'p99_us': percentile(latencies, 0.99) / 1000,
+        'bytes_per_record': allocated_per_record(formatter, records[:200]),
+    }
+
+def allocated_per_record(formatter, records):
+    """Average peak traced memory while formatting one record."""
+    if not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    tracemalloc.start()
+    try:
+        total = 0
+        for record in records:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            formatter.format(record)
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / len(records)
+
+def run(records_per_workload, repeat, seed):
+    formatters = {
+        'JsonFormatter': JsonFormatter(),
+        'SecureJsonFormatter': load_secure_formatter()(),
+    }
+    results = {}
+    for workload, build in WORKLOADS.items():
+        records = build(random.Random(seed), records_per_workload)
+        for name, formatter in formatters.items():
+            formatter.format(records[0])  # warm up caches and lazy imports
+            results[f"{name}/{workload}"] = measure(formatter, records, repeat)
+    return results
+
+
+# --- Reporting and baselines ---
+
+def print_table(results, baseline=None):
+    header = f"{'benchmark':<40}{'records/s':>12}{'p50 us':>10}{'p99 us':>10}{'bytes/rec':>12}"
+    print(header)
+    print('-' * len(header))
+    for name, row in results.items():
+        alloc = '-' if row['bytes_per_record'] is None else f"{row['bytes_per_record']:.0f}"
+        line = f"{name:<40}{row['records_per_sec']:>12.0f}{row['p50_us']:>10.1f}{row['p99_us']:>10.1f}{alloc:>12}"
+        if baseline and name in baseline:
+            change = row['records_per_sec'] / baseline[name]['records_per_sec'] - 1
+            line += f"  ({change:+.1%} vs baseline)"
+        print(line)
+
+def run_info(records, seed):
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'records': records,
+        'seed': seed,
+    }
+
+def baseline_mismatches(saved, current):
+    """Lists the run settings that differ between a saved baseline and this run."""
+    return [f"{key}: baseline {saved.get(key)!r}, this run {value!r}"
+            for key, value in current.items() if saved.get(key) != value]
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if row['records_per_sec'] < base['records_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: records/sec {row['records_per_sec']:.0f} < {base['records_per_sec']:.0f}")
+        if row['p99_us'] > base['p99_us'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {row['p99_us']:.1f}us > {base['p99_us']:.1f}us")
+        if row['bytes_per_record'] and base.get('bytes_per_record') and \
+                row['bytes_per_record'] > base['bytes_per_record'] * (1 + tolerance):
+            regressions.append(f"{name}: bytes/record {row['bytes_per_record']:.0f} > {base['bytes_per_record']:.0f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000, help="records per workload (default: 2000)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes per benchmark, best is kept")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help="write results to PATH (default: benchmarks/baseline.json)")
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help="compare against a saved baseline and exit 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed relative slowdown before a result counts as a regression")
+    args = parser.parse_args(argv)
+
+    info = run_info(args.records, args.seed)
+    results = run(args.records, args.repeat, args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        mismatches = baseline_mismatches(saved, info)
+        if mismatches:
+            print("Warning: the baseline was recorded under different conditions; "
+                  "results may not be comparable:", file=sys.stderr)
+            for line in mismatches:
+                print(f"  {line}", file=sys.stderr)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(dict(info, results=results), f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
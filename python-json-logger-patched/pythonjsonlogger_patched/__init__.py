@@ -1,3 +1,7 @@
 from .jsonlogger import JsonFormatter
+from .handlers import AsyncJsonHandler, CoalescingHandler, NDJSONStreamHandler
+from .redaction import RedactionRules
+from .rotating import RotatingNDJSONFileHandler
 
-__all__ = ["JsonFormatter"]
+__all__ = ["JsonFormatter", "AsyncJsonHandler", "CoalescingHandler", "NDJSONStreamHandler", "RedactionRules",
+           "RotatingNDJSONFileHandler"]
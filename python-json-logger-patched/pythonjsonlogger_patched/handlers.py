@@ -0,0 +1,322 @@
+import collections
+import copy
+import io
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEW = 'drop_new'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEW)
+
+
+class AsyncJsonHandler(logging.Handler):
+    """
+    Moves formatting and I/O off the logging thread.
+
+    Records are appended to a bounded in-memory queue and handed to ``target``
+    (any logging.Handler) by a background worker, up to ``batch_size`` at a
+    time. Targets that define ``emit_batch(records)`` receive the whole batch
+    in one call; other targets get one ``handle`` call per record followed by a
+    single ``flush``.
+
+    When the queue holds ``capacity`` records, ``overflow`` decides what
+    happens: 'block' waits for room, 'drop_oldest' discards the oldest queued
+    record and 'drop_new' discards the incoming one. Discarded records are
+    counted in ``dropped``.
+
+    Records are queued as-is, so their message is only rendered on the
+    worker; avoid mutating objects passed as logging arguments afterwards.
+    """
+
+    def __init__(self, target, capacity=10000, batch_size=256,
+                 overflow=OVERFLOW_BLOCK, flush_interval=0.5, level=logging.NOTSET):
+        super().__init__(level)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        if capacity < 1 or batch_size < 1:
+            raise ValueError("capacity and batch_size must be positive")
+        self.target = target
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._pending = 0  # queued or currently being written
+        self._closed = False
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._drained = threading.Condition(self._mutex)
+        self._worker = threading.Thread(target=self._run, name='AsyncJsonHandler', daemon=True)
+        self._worker.start()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        with self._mutex:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._queue) >= self.capacity:
+                if self.overflow == OVERFLOW_DROP_NEW:
+                    self.dropped += 1
+                    return
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._queue.popleft()
+                    self._pending -= 1
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.capacity and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        self.dropped += 1
+                        return
+            self._queue.append(record)
+            self._pending += 1
+            self._not_empty.notify()
+
+    def _run(self):
+        while True:
+            with self._mutex:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait(self.flush_interval)
+                if not self._queue:
+                    return
+                count = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft() for _ in range(count)]
+                self._not_full.notify_all()
+            try:
+                self._write(batch)
+            except Exception:
+                self.handleError(batch[-1])
+            finally:
+                with self._mutex:
+                    self._pending -= count
+                    if self._pending <= 0:
+                        self._drained.notify_all()
+
+    def _write(self, batch):
+        target = self.target
+        emit_batch = getattr(target, 'emit_batch', None)
+        if emit_batch is None:
+            for record in batch:
+                target.handle(record)
+        else:
+            batch = [record for record in batch if target.filter(record)]
+            if not batch:
+                return
+            target.acquire()
+            try:
+                emit_batch(batch)
+            except Exception:
+                target.handleError(batch[0])
+            finally:
+                target.release()
+        target.flush()
+
+    def flush(self, timeout=None):
+        """Block until every record queued so far has been written."""
+        with self._mutex:
+            if self._worker.is_alive():
+                self._drained.wait_for(lambda: self._pending <= 0, timeout)
+
+    def close(self):
+        with self._mutex:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        if self._worker is not threading.current_thread():
+            self._worker.join()
+        try:
+            self.target.close()
+        finally:
+            super().close()
+
+
+class NDJSONStreamHandler(logging.Handler):
+    """
+    Writes newline-delimited JSON to a binary stream, one write per batch.
+
+    Pairs with JsonFormatter.format_batch: ``emit_batch`` serializes every
+    record into one reused bytearray before a single write and flush, which
+    is what AsyncJsonHandler calls on its worker. Text streams are accepted
+    too and receive the decoded batch.
+    """
+
+    def __init__(self, stream=None, level=logging.NOTSET):
+        super().__init__(level)
+        if stream is None:
+            stream = sys.stderr.buffer
+        self.stream = stream
+        self._text = isinstance(stream, io.TextIOBase)
+        self._buffer = bytearray()
+
+    def emit(self, record):
+        try:
+            self.emit_batch([record])
+        except Exception:
+            self.handleError(record)
+
+    def emit_batch(self, records):
+        buffer = self._buffer
+        del buffer[:]
+        formatter = self.formatter
+        if hasattr(formatter, 'format_batch'):
+            formatter.format_batch(records, buffer)
+        else:
+            for record in records:
+                buffer += self.format(record).encode('utf-8', 'backslashreplace')
+                buffer += b'\n'
+        if self._text:
+            self.stream.write(buffer.decode('utf-8'))
+        else:
+            self.stream.write(buffer)
+        self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, 'flush'):
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+def template_fingerprint(record):
+    """Groups records by logger, level and unformatted message template."""
+    msg = record.msg
+    if not isinstance(msg, (str, int, float)):
+        msg = str(msg)
+    return record.name, record.levelno, msg
+
+
+def message_fingerprint(record):
+    """Groups records by logger, level and rendered message (for f-string style logging)."""
+    return record.name, record.levelno, record.getMessage()
+
+
+class _Run:
+    __slots__ = ('first_seen', 'last_seen', 'count', 'last_record')
+
+    def __init__(self, record):
+        self.first_seen = self.last_seen = record.created
+        self.count = 1
+        self.last_record = record
+
+
+class CoalescingHandler(logging.Handler):
+    """
+    Collapses floods of repeated records before they reach ``target``.
+
+    The first record of each fingerprint is forwarded immediately. Further
+    records with the same fingerprint within ``window`` seconds of it are only
+    counted; when the window closes one summary record is forwarded: a copy of
+    the last duplicate carrying ``repeat_count`` (occurrences in the window,
+    including the first), ``first_seen`` and ``last_seen`` as attributes and in
+    its ``extra`` dict, so JsonFormatter emits them as fields.
+
+    At most ``max_entries`` fingerprints are tracked; the oldest is closed
+    early when a new one arrives. Expired windows are closed on each emit, on
+    flush()/close() and, unless ``sweep`` is False, by a background thread
+    every ``window`` seconds.
+    """
+
+    def __init__(self, target, window=1.0, fingerprint=template_fingerprint, max_entries=10000,
+                 sweep=True, clock=time.time, level=logging.NOTSET):
+        super().__init__(level)
+        self.target = target
+        self.window = window
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.clock = clock
+        self.suppressed = 0
+        self._runs = collections.OrderedDict()
+        self._stop = threading.Event()
+        self._sweeper = None
+        if sweep:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='CoalescingHandler', daemon=True)
+            self._sweeper.start()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        self._close_expired(self.clock())
+        key = self.fingerprint(record)
+        run = self._runs.get(key)
+        if run is not None:
+            run.count += 1
+            run.last_seen = record.created
+            run.last_record = record
+            self.suppressed += 1
+            return
+        if len(self._runs) >= self.max_entries:
+            self._finish(*self._runs.popitem(last=False))
+        self._runs[key] = _Run(record)
+        self.target.handle(record)
+
+    def _close_expired(self, now):
+        runs = self._runs
+        while runs:
+            key, run = next(iter(runs.items()))
+            if run.first_seen + self.window > now:
+                break
+            del runs[key]
+            self._finish(key, run)
+
+    def _finish(self, key, run):
+        if run.count < 2:
+            return
+        summary = copy.copy(run.last_record)
+        fields = {
+            'repeat_count': run.count,
+            'first_seen': _utc_iso(run.first_seen),
+            'last_seen': _utc_iso(run.last_seen),
+        }
+        summary.__dict__.update(fields)
+        extra = getattr(summary, 'extra', None)
+        summary.extra = dict(extra, **fields) if isinstance(extra, dict) else fields
+        self.target.handle(summary)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.window):
+            self.acquire()
+            try:
+                self._close_expired(self.clock())
+            finally:
+                self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._close_expired(self.clock())
+        finally:
+            self.release()
+        self.target.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._sweeper is not None and self._sweeper is not threading.current_thread():
+            self._sweeper.join()
+        self.acquire()
+        try:
+            while self._runs:
+                self._finish(*self._runs.popitem(last=False))
+        finally:
+            self.release()
+        try:
+            self.target.close()
+        finally:
+            super().close()
+
+
+def _utc_iso(created):
+    return datetime.fromtimestamp(created, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
@@ -1,57 +1,247 @@
 
 import logging
 import json
-from datetime import datetime
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
 import re
 
+from .traversal import UNLIMITED, sanitize_tree
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        value = compute(key)
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
 class JsonFormatter(logging.Formatter):
     CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f-\x9f]')
     DANGEROUS_KEYS = {'password', 'secret', 'token', 'authorization', 'cookie'}
+    SCRIPT_TAG = re.compile(r'<\s*script.*?>.*?<\s*/\s*script\s*>', re.IGNORECASE | re.DOTALL)
+
+    # Precompiled string sanitizer: CONTROL_CHARS are deleted and '\\' / '"'
+    # escaped by a single str.translate call.
+    _ESCAPE_TABLE = dict.fromkeys(list(range(0x00, 0x20)) + list(range(0x7f, 0xa0)))
+    _ESCAPE_TABLE.update({ord('\\'): '\\\\', ord('"'): '\\"'})
+    _SUSPICIOUS = re.compile(r'[\x00-\x1f\x7f-\x9f\\"<]')
+
+    # Equivalent to json.dumps(..., ensure_ascii=False) without building a new
+    # encoder for every record.
+    _encoder = json.JSONEncoder(ensure_ascii=False)
+
+    TIMESTAMP_PRECISIONS = ('microsecond', 'millisecond', 'second')
+
+    def __init__(self, *args, cache_size=0, cache_max_length=256, limits=None,
+                 timestamp_precision='microsecond', static_fields=None, redaction_rules=None, **kwargs):
+        """
+        ``redaction_rules`` is a RedactionRules instance (key globs, dotted
+        paths, value patterns) used instead of the default behaviour of
+        redacting top-level DANGEROUS_KEYS.
+
+        ``timestamp`` is rendered from ``record.created`` in UTC as
+        ``YYYY-MM-DDTHH:MM:SS[.ffffff]Z`` (the isoformat() layout), with the
+        fractional part controlled by ``timestamp_precision``: 'microsecond'
+        (omitted when zero, like isoformat), 'millisecond' (always three
+        digits) or 'second' (none). The date/time prefix is rendered once per
+        second and reused.
+
+        ``static_fields`` are constant fields added to every record unless
+        the extras already set them; they are sanitized once, here.
+
+        ``limits`` is a TraversalLimits bounding the depth, container sizes,
+        string lengths and total size of sanitized extras. Extras are not
+        truncated when it is omitted (UNLIMITED); pass
+        ``traversal.DEFAULT_LIMITS`` for conservative bounds.
+
+        ``cache_size`` > 0 enables two LRU caches of that many entries: one for
+        sanitized strings and one for the sanitized form and redaction
+        decision of top-level keys. Only plain ``str`` instances of at most
+        ``cache_max_length`` characters are cached; containers and other
+        types are always processed afresh.
+        """
+        super().__init__(*args, **kwargs)
+        if timestamp_precision not in self.TIMESTAMP_PRECISIONS:
+            raise ValueError(f"timestamp_precision must be one of {self.TIMESTAMP_PRECISIONS}")
+        self.limits = UNLIMITED if limits is None else limits
+        self.redaction_rules = redaction_rules
+        self.timestamp_precision = timestamp_precision
+        self._timestamp_prefix = (None, '')
+        self._logger_fields = {}
+        self.cache_max_length = cache_max_length
+        if cache_size > 0:
+            self._value_cache = _LRUCache(cache_size)
+            self._key_cache = _LRUCache(cache_size)
+        else:
+            self._value_cache = self._key_cache = None
+        self.static_fields = self._sanitize(static_fields) if static_fields else {}
+
+    def cache_info(self):
+        """Returns hit/miss statistics as {'values': CacheInfo, 'keys': CacheInfo}, or None if caching is off."""
+        if self._value_cache is None:
+            return None
+        return {'values': self._value_cache.info(), 'keys': self._key_cache.info()}
+
+    def cache_clear(self):
+        if self._value_cache is not None:
+            self._value_cache.clear()
+            self._key_cache.clear()
 
     def add_fields(self, log_record, record, message_dict):
-        for key, value in message_dict.items():
-            sanitized_key = self._sanitize(key)
-            if sanitized_key.lower() in self.DANGEROUS_KEYS:
-                log_record[sanitized_key] = "***REDACTED***"
-            else:
-                log_record[sanitized_key] = self._sanitize(value)
+        extras = self._sanitize(message_dict, top_level=True)
+        if isinstance(extras, dict):
+            log_record.update(extras)
         if not log_record.get('timestamp'):
-            log_record['timestamp'] = datetime.utcnow().isoformat() + 'Z'
-        if not log_record.get('level'):
-            log_record['level'] = record.levelname
-        if not log_record.get('name'):
-            log_record['name'] = record.name
+            log_record['timestamp'] = self._render_timestamp(record.created)
+        for key, value in self._fields_for(record).items():
+            if not log_record.get(key):
+                log_record[key] = value
         if not log_record.get('message'):
             log_record['message'] = record.getMessage()
 
-    def _sanitize(self, value):
-        if isinstance(value, str):
-            # Remove control characters, escape dangerous characters
-            value = self.CONTROL_CHARS.sub('', value)
-            value = (
-                value.replace('\\', '\\\\')
-                     .replace('"', '\\"')
-                     .replace('\n', '\\n')
-                     .replace('\r', '\\r')
-            )
-            # Remove simple script tags
-            value = re.sub(r'<\s*script.*?>.*?<\s*/\s*script\s*>', '', value, flags=re.IGNORECASE|re.DOTALL)
-            return value
-        elif isinstance(value, dict):
-            return {self._sanitize(k): self._sanitize(v) for k, v in value.items()}
-        elif isinstance(value, list):
-            return [self._sanitize(v) for v in value]
-        elif isinstance(value, (int, float, bool)) or value is None:
+    def _render_timestamp(self, created):
+        seconds = int(created)
+        micros = round((created - seconds) * 1e6)
+        if micros >= 1000000:
+            seconds += 1
+            micros -= 1000000
+        cached_seconds, prefix = self._timestamp_prefix
+        if cached_seconds != seconds:
+            prefix = datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            self._timestamp_prefix = (seconds, prefix)
+        if self.timestamp_precision == 'microsecond':
+            return f"{prefix}.{micros:06d}Z" if micros else prefix + 'Z'
+        if self.timestamp_precision == 'millisecond':
+            return f"{prefix}.{micros // 1000:03d}Z"
+        return prefix + 'Z'
+
+    def _fields_for(self, record):
+        # level, name and static_fields only change with the logger and level.
+        key = (record.name, record.levelname)
+        fields = self._logger_fields.get(key)
+        if fields is None:
+            if len(self._logger_fields) >= 1024:
+                self._logger_fields.clear()
+            fields = {'level': record.levelname, 'name': record.name}
+            fields.update((k, v) for k, v in self.static_fields.items() if k not in fields)
+            self._logger_fields[key] = fields
+        return fields
+
+    def _classify_key(self, key):
+        if self._key_cache is not None and type(key) is str and len(key) <= self.cache_max_length:
+            return self._key_cache.get(key, self._classify_key_uncached)
+        return self._classify_key_uncached(key)
+
+    def _classify_key_uncached(self, key):
+        sanitized_key = self._clean_key(key)
+        return sanitized_key, isinstance(sanitized_key, str) and sanitized_key.lower() in self.DANGEROUS_KEYS
+
+    def _key_policy(self, key, ctx):
+        if self.redaction_rules is not None:
+            sanitized_key = self._clean_key(key)
+            redact, child_ctx = self.redaction_rules.step(ctx, sanitized_key)
+            return sanitized_key, redact, child_ctx
+        # Without rules, ctx is True only at the top level of the extras,
+        # which is the only place DANGEROUS_KEYS apply.
+        if ctx:
+            sanitized_key, redact = self._classify_key(key)
+            return sanitized_key, redact, False
+        return self._clean_key(key), False, False
+
+    def _clean_key(self, key):
+        if key is None or isinstance(key, (bool, int, float)):
+            return key
+        if not isinstance(key, str):
+            key = str(key)
+        # Value patterns apply to values only; without rules the cached
+        # string path is the plain sanitizer, so keys can share it.
+        if self.redaction_rules is None:
+            return self._clean_str(key)
+        return self._sanitize_str(key)
+
+    def _clean_str(self, value):
+        if self._value_cache is not None and type(value) is str and len(value) <= self.cache_max_length:
+            return self._value_cache.get(value, self._process_str)
+        return self._process_str(value)
+
+    def _process_str(self, value):
+        value = self._sanitize_str(value)
+        if self.redaction_rules is not None:
+            value = self.redaction_rules.redact_value(value)
+        return value
+
+    def _sanitize(self, value, top_level=False):
+        rules = self.redaction_rules
+        if rules is None:
+            return sanitize_tree(value, self._clean_str, self._key_policy, root_ctx=top_level, limits=self.limits)
+        return sanitize_tree(value, self._clean_str, self._key_policy, root_ctx=rules.root, limits=self.limits,
+                             redacted_value=rules.redacted_value)
+
+    def _sanitize_str(self, value):
+        # Same result as removing CONTROL_CHARS, escaping '\\' and '"', then
+        # stripping SCRIPT_TAG matches, in at most two passes.
+        if not self._SUSPICIOUS.search(value):
             return value
-        else:
-            # Fallback: convert unknown types to string, then sanitize
-            return self._sanitize(str(value))
+        value = value.translate(self._ESCAPE_TABLE)
+        if '<' in value:
+            value = self.SCRIPT_TAG.sub('', value)
+        return value
 
-    def format(self, record):
+    def _build_record(self, record):
         log_record = {}
         # Merge extra fields, if present
         message_dict = getattr(record, 'extra', {})
         self.add_fields(log_record, record, message_dict)
-        return json.dumps(log_record, ensure_ascii=False)
+        return log_record
+
+    def format(self, record):
+        return self._encoder.encode(self._build_record(record))
 
+    def format_batch(self, records, buffer=None):
+        """
+        Serializes many records as newline-delimited JSON (UTF-8) into a single
+        output buffer and returns it.
 
+        ``buffer`` may be a bytearray or a binary file-like object such as
+        io.BytesIO; a new bytearray is used when it is omitted.
+        """
+        if buffer is None:
+            buffer = bytearray()
+        write = buffer.extend if isinstance(buffer, bytearray) else buffer.write
+        encode = self._encoder.encode
+        for record in records:
+            write(encode(self._build_record(record)).encode('utf-8', 'backslashreplace'))
+            write(b'\n')
+        return buffer
@@ -0,0 +1,206 @@
+import re
+import threading
+
+from .traversal import REDACTED_VALUE
+
+# Common secret shapes for value_patterns.
+BEARER_TOKEN = r'(?i:bearer)\s+[A-Za-z0-9._~+/=-]+'
+BASIC_AUTH = r'(?i:basic)\s+[A-Za-z0-9+/=]{8,}'
+JWT = r'eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+'
+
+
+class _GlobDFA:
+    """Lazily built DFA tables for one set of glob patterns."""
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.states = {}       # frozenset of NFA positions -> state id
+        self.positions = []    # state id -> frozenset of NFA positions
+        self.transitions = []  # state id -> {char: state id}
+        self.accepts = []      # state id -> frozenset of completed pattern indices
+        self.lock = threading.Lock()
+        self.start = self.state(self.closure((i, 0) for i in range(len(patterns))))
+
+    def closure(self, positions):
+        closed = set()
+        stack = list(positions)
+        while stack:
+            index, pos = stack.pop()
+            if (index, pos) in closed:
+                continue
+            closed.add((index, pos))
+            pattern = self.patterns[index]
+            if pos < len(pattern) and pattern[pos] == '*':
+                stack.append((index, pos + 1))
+        return frozenset(closed)
+
+    def state(self, positions):
+        state = self.states.get(positions)
+        if state is None:
+            state = len(self.positions)
+            self.positions.append(positions)
+            self.transitions.append({})
+            self.accepts.append(frozenset(i for i, pos in positions if pos == len(self.patterns[i])))
+            self.states[positions] = state
+        return state
+
+    def step(self, state, char):
+        with self.lock:
+            target = self.transitions[state].get(char)
+            if target is not None:
+                return target
+            moved = []
+            for index, pos in self.positions[state]:
+                pattern = self.patterns[index]
+                if pos < len(pattern):
+                    token = pattern[pos]
+                    if token == '*':
+                        moved.append((index, pos))
+                    elif token == '?' or token == char:
+                        moved.append((index, pos + 1))
+            target = self.state(self.closure(moved))
+            self.transitions[state][char] = target
+            return target
+
+
+class GlobAutomaton:
+    """
+    Matches a string against many '*' / '?' glob patterns at once.
+
+    The patterns run as one NFA whose deterministic states are built lazily
+    and memoized, so after warm-up a lookup costs one dict access per
+    character regardless of how many patterns were loaded. ``max_states``
+    bounds the memo; the tables are rebuilt from scratch when it is exceeded.
+    """
+
+    def __init__(self, patterns, max_states=10000):
+        self.patterns = list(patterns)
+        self.max_states = max_states
+        self._dfa = _GlobDFA(self.patterns)
+
+    def match(self, text):
+        """Returns the indices of all patterns matching ``text`` in full."""
+        dfa = self._dfa
+        if len(dfa.positions) > self.max_states:
+            dfa = self._dfa = _GlobDFA(self.patterns)
+        state = dfa.start
+        transitions = dfa.transitions
+        positions = dfa.positions
+        for char in text:
+            next_state = transitions[state].get(char)
+            if next_state is None:
+                next_state = dfa.step(state, char)
+            state = next_state
+            if not positions[state]:
+                return frozenset()
+        return dfa.accepts[state]
+
+
+class _PathNode:
+    __slots__ = ('literal', 'glob_patterns', 'glob_children', 'globs', 'terminal')
+
+    def __init__(self):
+        self.literal = {}
+        self.glob_patterns = []
+        self.glob_children = []
+        self.globs = None
+        self.terminal = False
+
+
+class RedactionRules:
+    """
+    Compiled redaction configuration.
+
+    keys            key names or globs ('password', '*token*', 'api?key') redacted
+                    at any nesting level
+    paths           dotted paths from the top of the extras ('headers.authorization',
+                    'users.*.ssn'); each segment may be a glob. List items do not
+                    consume a segment.
+    value_patterns  regular expressions; matching parts of any string value are
+                    replaced with ``redacted_value``
+
+    Keys and paths are compared case-insensitively unless ``case_sensitive``.
+    All rules are compiled once: plain key names go to a set, key globs share
+    one GlobAutomaton, paths form a segment trie and value patterns are joined
+    into a single regex, so the per-key cost does not grow with the rule count.
+    """
+
+    def __init__(self, keys=(), paths=(), value_patterns=(), case_sensitive=False,
+                 redacted_value=REDACTED_VALUE):
+        self.case_sensitive = case_sensitive
+        self.redacted_value = redacted_value
+        fold = self._fold
+        keys = [fold(key) for key in keys]
+        self._exact_keys = frozenset(key for key in keys if not _is_glob(key))
+        key_globs = [key for key in keys if _is_glob(key)]
+        self._key_globs = GlobAutomaton(key_globs) if key_globs else None
+
+        self._root = _PathNode()
+        for path in paths:
+            node = self._root
+            for segment in fold(path).split('.'):
+                if _is_glob(segment):
+                    if segment not in node.glob_patterns:
+                        node.glob_patterns.append(segment)
+                        node.glob_children.append(_PathNode())
+                    node = node.glob_children[node.glob_patterns.index(segment)]
+                else:
+                    node = node.literal.setdefault(segment, _PathNode())
+            node.terminal = True
+        self._compile_globs(self._root)
+        self.root = (self._root,)
+
+        patterns = list(value_patterns)
+        self._values = re.compile('|'.join(f'(?:{p})' for p in patterns)) if patterns else None
+
+    @classmethod
+    def from_specs(cls, specs, **kwargs):
+        """Builds rules from plain strings: entries containing '.' are paths, the rest keys."""
+        specs = [spec.strip() for spec in specs if spec.strip()]
+        return cls(keys=[s for s in specs if '.' not in s], paths=[s for s in specs if '.' in s], **kwargs)
+
+    def _fold(self, text):
+        return text if self.case_sensitive else text.lower()
+
+    def _compile_globs(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.glob_patterns:
+                node.globs = GlobAutomaton(node.glob_patterns)
+            stack.extend(node.literal.values())
+            stack.extend(node.glob_children)
+
+    def step(self, ctx, key):
+        """
+        Classifies ``key`` inside a mapping reached through path state
+        ``ctx`` (``self.root`` at the top level). Returns (redact, child_ctx).
+        """
+        if not isinstance(key, str):
+            key = str(key)
+        folded = self._fold(key)
+        redact = folded in self._exact_keys or bool(self._key_globs and self._key_globs.match(folded))
+        if not ctx:
+            return redact, ()
+        children = []
+        for node in ctx:
+            child = node.literal.get(folded)
+            if child is not None:
+                children.append(child)
+            if node.globs is not None:
+                for index in node.globs.match(folded):
+                    children.append(node.glob_children[index])
+        for child in children:
+            if child.terminal:
+                redact = True
+        return redact, tuple(child for child in children if child.literal or child.glob_patterns)
+
+    def redact_value(self, text):
+        """Replaces value_patterns matches in ``text``."""
+        if self._values is None:
+            return text
+        return self._values.sub(self.redacted_value, text)
+
+
+def _is_glob(text):
+    return '*' in text or '?' in text
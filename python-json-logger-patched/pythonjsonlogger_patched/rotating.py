@@ -0,0 +1,285 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+class _Block:
+    """Byte range of the active segment written between two checkpoints."""
+    __slots__ = ('min_ts', 'max_ts', 'raw_offset', 'raw_length')
+
+    def __init__(self, raw_offset):
+        self.min_ts = None
+        self.max_ts = None
+        self.raw_offset = raw_offset
+        self.raw_length = 0
+
+    def add(self, min_ts, max_ts, length):
+        self.min_ts = min_ts if self.min_ts is None else min(self.min_ts, min_ts)
+        self.max_ts = max_ts if self.max_ts is None else max(self.max_ts, max_ts)
+        self.raw_length += length
+
+
+class RotatingNDJSONFileHandler(logging.Handler):
+    """
+    Appends newline-delimited JSON to ``filename`` and rotates it by size
+    and/or age.
+
+    A segment is rotated once it holds ``max_bytes`` or has been open for
+    ``interval`` seconds (either may be None). Rotated segments are renamed
+    to ``<base>.<UTC start time>-<seq><ext>`` and handed to a background
+    thread that gzips them (when ``compress`` is true), records them in the
+    index file ``<filename>.index`` and deletes all but the newest
+    ``backup_count`` segments. The logging thread only renames files.
+
+    While writing, a checkpoint is taken every ``checkpoint_bytes``. Each
+    checkpointed block is compressed as its own gzip member and listed in the
+    index with its time range (from ``record.created``) and byte offsets, so
+    read_window() can decompress only the blocks covering a time window.
+
+    Implements ``emit_batch`` so AsyncJsonHandler writes whole batches at once;
+    rotation and checkpoints happen between batches.
+    """
+
+    def __init__(self, filename, max_bytes=64 * 1024 * 1024, interval=None, backup_count=None,
+                 compress=True, checkpoint_bytes=1024 * 1024, level=logging.NOTSET):
+        super().__init__(level)
+        self.baseFilename = os.path.abspath(filename)
+        self.index_path = self.baseFilename + '.index'
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.checkpoint_bytes = checkpoint_bytes
+        self._sequence = 0
+        self._pending = queue.Queue()
+        self._finisher = threading.Thread(target=self._finish_segments, name='RotatingNDJSONFileHandler',
+                                          daemon=True)
+        self._finisher.start()
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            self._recover_leftover()
+        self._open()
+
+    # --- Writing ---
+
+    def _open(self):
+        self.stream = open(self.baseFilename, 'ab')
+        self._opened_at = time.time()
+        self._size = 0
+        self._records = 0
+        self._blocks = [_Block(0)]
+
+    def emit(self, record):
+        try:
+            self.emit_batch([record])
+        except Exception:
+            self.handleError(record)
+
+    def emit_batch(self, records):
+        if self._should_rotate():
+            self._rotate()
+        formatter = self.formatter
+        if hasattr(formatter, 'format_batch'):
+            data = formatter.format_batch(records)
+        else:
+            data = bytearray()
+            for record in records:
+                data += self.format(record).encode('utf-8', 'backslashreplace') + b'\n'
+        created = [record.created for record in records]
+        block = self._blocks[-1]
+        if block.raw_length >= self.checkpoint_bytes:
+            block = _Block(self._size)
+            self._blocks.append(block)
+        self.stream.write(data)
+        self.stream.flush()
+        block.add(min(created), max(created), len(data))
+        self._size += len(data)
+        self._records += len(records)
+
+    def _should_rotate(self):
+        if self._size == 0:
+            return False
+        if self.max_bytes is not None and self._size >= self.max_bytes:
+            return True
+        return self.interval is not None and time.time() - self._opened_at >= self.interval
+
+    def _rotate(self):
+        self.stream.close()
+        self.stream = None
+        blocks = [block for block in self._blocks if block.raw_length]
+        start = blocks[0].min_ts if blocks else self._opened_at
+        segment = self._segment_name(start)
+        os.replace(self.baseFilename, segment)
+        self._pending.put((segment, blocks, self._records))
+        self._open()
+
+    def _segment_name(self, start):
+        base, ext = os.path.splitext(self.baseFilename)
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(start))
+        while True:
+            self._sequence += 1
+            name = f"{base}.{stamp}-{self._sequence:04d}{ext}"
+            if not os.path.exists(name) and not os.path.exists(name + '.gz'):
+                return name
+
+    def _recover_leftover(self):
+        # A file left behind by a previous process: rotate it with an unknown time range.
+        size = os.path.getsize(self.baseFilename)
+        block = _Block(0)
+        block.raw_length = size
+        segment = self._segment_name(os.path.getmtime(self.baseFilename))
+        os.replace(self.baseFilename, segment)
+        self._pending.put((segment, [block], None))
+
+    # --- Background compression, indexing and retention ---
+
+    def _finish_segments(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                self._finish(*item)
+            except Exception:
+                self.handleError(logging.makeLogRecord({'msg': f"failed to finish segment {item[0]}"}))
+            finally:
+                self._pending.task_done()
+
+    def _finish(self, segment, blocks, records):
+        entries = []
+        if self.compress:
+            target = segment + '.gz'
+            with open(segment, 'rb') as src, open(target + '.tmp', 'wb') as dst:
+                for block in blocks:
+                    src.seek(block.raw_offset)
+                    offset = dst.tell()
+                    dst.write(gzip.compress(src.read(block.raw_length)))
+                    entries.append(_block_entry(block, offset, dst.tell() - offset))
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(target + '.tmp', target)
+            os.remove(segment)
+        else:
+            target = segment
+            entries = [_block_entry(block, block.raw_offset, block.raw_length) for block in blocks]
+        known = [b for b in blocks if b.min_ts is not None]
+        entry = {
+            'segment': os.path.basename(target),
+            'compressed': self.compress,
+            'min_ts': min(b.min_ts for b in known) if known else None,
+            'max_ts': max(b.max_ts for b in known) if known else None,
+            'records': records,
+            'raw_bytes': sum(b.raw_length for b in blocks),
+            'blocks': entries,
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        if self.backup_count is not None:
+            self._apply_retention()
+
+    def _apply_retention(self):
+        entries = read_index(self.baseFilename)
+        if len(entries) <= self.backup_count:
+            return
+        drop = len(entries) - self.backup_count
+        directory = os.path.dirname(self.baseFilename)
+        for entry in entries[:drop]:
+            try:
+                os.remove(os.path.join(directory, entry['segment']))
+            except FileNotFoundError:
+                pass
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in entries[drop:]:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp, self.index_path)
+
+    # --- Lifecycle ---
+
+    def doRollover(self):
+        """Rotates the active file now, if it holds any records."""
+        self.acquire()
+        try:
+            if self._size:
+                self._rotate()
+        finally:
+            self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def wait_for_segments(self):
+        """Blocks until every rotated segment has been compressed and indexed."""
+        self._pending.join()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                if self._size:
+                    self._rotate()
+                self.stream.close()
+                self.stream = None
+                os.remove(self.baseFilename)
+        finally:
+            self.release()
+        if self._finisher.is_alive():
+            self._pending.put(None)
+            self._finisher.join()
+        super().close()
+
+
+def _block_entry(block, offset, length):
+    return {'min_ts': block.min_ts, 'max_ts': block.max_ts, 'offset': offset, 'length': length,
+            'raw_offset': block.raw_offset, 'raw_length': block.raw_length}
+
+
+def read_index(filename):
+    """Returns the index entries for ``filename``'s rotated segments, oldest first."""
+    path = os.path.abspath(filename) + '.index'
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _overlaps(min_ts, max_ts, start, end):
+    if min_ts is None or max_ts is None:
+        return True
+    return (start is None or max_ts >= start) and (end is None or min_ts <= end)
+
+
+def read_window(filename, start=None, end=None):
+    """
+    Yields the NDJSON lines (bytes, without the newline) of rotated segments
+    whose blocks overlap [start, end], given as Unix timestamps.
+
+    Only the overlapping blocks are read and decompressed. Selection is per
+    block, so lines just outside the window may be included; callers needing
+    an exact range should filter on the records' own timestamps. The active,
+    not yet rotated file is not read.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    for entry in read_index(filename):
+        if not _overlaps(entry['min_ts'], entry['max_ts'], start, end):
+            continue
+        with open(os.path.join(directory, entry['segment']), 'rb') as f:
+            for block in entry['blocks']:
+                if not _overlaps(block['min_ts'], block['max_ts'], start, end):
+                    continue
+                f.seek(block['offset'])
+                data = f.read(block['length'])
+                if entry['compressed']:
+                    data = gzip.decompress(data)
+                for line in data.splitlines():
+                    if line:
+                        yield line
@@ -0,0 +1,192 @@
+import dataclasses
+
+REDACTED_VALUE = "***REDACTED***"
+DEPTH_MARKER = "[max depth exceeded]"
+CIRCULAR_MARKER = "[circular reference]"
+STRING_MARKER = "...[truncated]"
+ITEMS_MARKER = "[{} more items truncated]"
+OUTPUT_MARKER = "[output size limit reached]"
+TRUNCATED_KEY = "..."
+
+
+class TraversalLimits:
+    """
+    Bounds applied by sanitize_tree.
+
+    max_depth          deepest container nesting kept; deeper containers become DEPTH_MARKER
+    max_items          entries kept per dict/list/tuple/set, the rest are summarised by ITEMS_MARKER
+    max_string_length  characters kept per string after sanitization
+    max_output_bytes   approximate budget for the whole result (string lengths plus a few
+                       bytes per scalar); once spent, traversal stops and OUTPUT_MARKER is added
+
+    Any limit may be None to disable it.
+    """
+    __slots__ = ('max_depth', 'max_items', 'max_string_length', 'max_output_bytes')
+
+    def __init__(self, max_depth=32, max_items=1000, max_string_length=32768, max_output_bytes=1048576):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.max_string_length = max_string_length
+        self.max_output_bytes = max_output_bytes
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"TraversalLimits({fields})"
+
+
+DEFAULT_LIMITS = TraversalLimits()
+UNLIMITED = TraversalLimits(None, None, None, None)
+
+
+_SCALARS = (str, int, float, type(None))
+
+
+def _plain_key(key, ctx):
+    return key, False, None
+
+
+def _items(value):
+    """Returns (is_mapping, iterable, size) for a container, or None for scalars."""
+    if isinstance(value, dict):
+        return True, value.items(), len(value)
+    if isinstance(value, (list, tuple)):
+        return False, value, len(value)
+    if isinstance(value, (set, frozenset)):
+        try:
+            ordered = sorted(value)
+        except TypeError:
+            ordered = list(value)
+        return False, ordered, len(ordered)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        fields = [(f.name, getattr(value, f.name)) for f in dataclasses.fields(value)]
+        return True, fields, len(fields)
+    return None
+
+
+class _Budget:
+    __slots__ = ('remaining',)
+
+    def __init__(self, limit):
+        self.remaining = limit
+
+    def spend(self, amount):
+        if self.remaining is None:
+            return True
+        self.remaining -= amount
+        return self.remaining >= 0
+
+
+def sanitize_tree(value, clean_str, key_policy=None, root_ctx=None, limits=DEFAULT_LIMITS,
+                  redacted_value=REDACTED_VALUE, stringify=True):
+    """
+    Returns a JSON-ready copy of ``value`` built with an explicit stack
+    instead of recursion, so arbitrarily deep or large inputs cannot raise
+    RecursionError.
+
+    Strings pass through ``clean_str``; dicts and dataclasses become dicts,
+    lists, tuples and sets become lists; bool/int/float/None are kept and
+    anything else is converted with str() and cleaned, or kept as it is when
+    ``stringify`` is false. Limits are enforced
+    with the marker strings defined in this module rather than by raising.
+
+    ``key_policy(key, ctx) -> (out_key, redact, child_ctx)`` is called for
+    every mapping key, where ``ctx`` is ``root_ctx`` for the top-level value
+    and the ``child_ctx`` returned for the enclosing key below it (list items
+    inherit their list's ctx). When ``redact`` is true the value is replaced
+    with ``redacted_value`` without being visited.
+    """
+    if key_policy is None:
+        key_policy = _plain_key
+    max_depth = limits.max_depth
+    max_items = limits.max_items
+    max_string = limits.max_string_length
+    budget = _Budget(limits.max_output_bytes)
+
+    def scalar(item):
+        if item is None or isinstance(item, (bool, int, float)):
+            budget.spend(8)
+            return item
+        if not isinstance(item, str):
+            if not stringify:
+                budget.spend(8)
+                return item
+            item = str(item)
+        item = clean_str(item)
+        if max_string is not None and len(item) > max_string:
+            item = item[:max_string] + STRING_MARKER
+        remaining = budget.remaining
+        if remaining is not None and len(item) + 2 > remaining:
+            item = item[:max(remaining - 2, 0)] + STRING_MARKER
+            budget.remaining = -1
+        else:
+            budget.spend(len(item) + 2)
+        return item
+
+    root = None if isinstance(value, _SCALARS) else _items(value)
+    if root is None:
+        return scalar(value)
+    is_map, items, size = root
+    result = {} if is_map else []
+    # Frame: [is_map, iterator, output, depth, ctx, size, count, source id]
+    stack = [[is_map, iter(items), result, 1, root_ctx, size, 0, id(value)]]
+    open_ids = {id(value)}
+
+    while stack:
+        frame = stack[-1]
+        is_map, iterator, out, depth, ctx, size, count, source_id = frame
+        if budget.remaining is not None and budget.remaining < 0:
+            break
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stack.pop()
+            open_ids.discard(source_id)
+            continue
+        if max_items is not None and count >= max_items:
+            marker = ITEMS_MARKER.format(size - count)
+            if is_map:
+                out[TRUNCATED_KEY] = marker
+            else:
+                out.append(marker)
+            stack.pop()
+            open_ids.discard(source_id)
+            continue
+        frame[6] = count + 1
+
+        child_ctx = ctx
+        if is_map:
+            key, item = item
+            key, redact, child_ctx = key_policy(key, ctx)
+            budget.spend(len(key) + 4 if isinstance(key, str) else 8)
+            if redact:
+                out[key] = redacted_value
+                continue
+
+        child = None if isinstance(item, _SCALARS) else _items(item)
+        if child is None:
+            converted = scalar(item)
+        elif id(item) in open_ids:
+            converted = CIRCULAR_MARKER
+        elif max_depth is not None and depth >= max_depth:
+            converted = DEPTH_MARKER
+        else:
+            child_is_map, child_items, child_size = child
+            converted = {} if child_is_map else []
+            budget.spend(2)
+            stack.append([child_is_map, iter(child_items), converted, depth + 1, child_ctx,
+                          child_size, 0, id(item)])
+            open_ids.add(id(item))
+
+        if is_map:
+            out[key] = converted
+        else:
+            out.append(converted)
+
+    if stack:
+        # Output budget exhausted: flag the innermost open container.
+        out = stack[-1][2]
+        if stack[-1][0]:
+            out[TRUNCATED_KEY] = OUTPUT_MARKER
+        else:
+            out.append(OUTPUT_MARKER)
+    return result
@@ -1,9 +1,12 @@
+import datetime
 import json
 import logging
 import os
 import re
 import io
 import pytest
+from pythonjsonlogger_patched.redaction import RedactionRules
+from pythonjsonlogger_patched.traversal import DEFAULT_LIMITS, UNLIMITED, sanitize_tree
 
 # ==============================================================================
 # SECTION 1: SECURE FORMATTER IMPLEMENTATION
@@ -33,6 +36,7 @@ def get_sensitive_keys():
     """
     Loads sensitive key names from an environment variable for secure configuration.
     This prevents hard-coding sensitive information in the application.
+    Entries may be globs ('*_token') or dotted paths ('headers.x-api-key').
     Example: export SENSITIVE_KEYS="password,token,my_custom_secret"
     """
     env_keys = os.environ.get('SENSITIVE_KEYS')
@@ -42,11 +46,18 @@ def get_sensitive_keys():
     return DEFAULT_SENSITIVE_KEYS
 
 SENSITIVE_KEYS = get_sensitive_keys()
+# Compiled once; matching cost does not depend on how many keys are configured.
+SENSITIVE_RULES = RedactionRules.from_specs(SENSITIVE_KEYS, redacted_value=REDACTED_VALUE)
 
 class Sanitizer:
     """
     A helper class to handle the sanitization and redaction of log data.
     """
+    def __init__(self, limits=UNLIMITED, rules=None):
+        # Bounds on depth, container size, string length and output size; none by default.
+        self.limits = limits
+        self.rules = SENSITIVE_RULES if rules is None else rules
+
     def sanitize_value(self, value):
         """Sanitizes a single string value."""
         if not isinstance(value, str):
@@ -58,23 +69,22 @@ class Sanitizer:
         # 3. Replace newlines/carriage returns to prevent log injection/splitting
         return sanitized.replace('\n', ' ').replace('\r', '')
 
+    def _key_policy(self, key, ctx):
+        # Sensitive keys are redacted at every nesting level, paths from the top.
+        redact, child_ctx = self.rules.step(ctx, key)
+        return key, redact, child_ctx
+
+    def _clean(self, value):
+        return self.rules.redact_value(self.sanitize_value(value))
+
     def redact(self, data):
         """
-        Recursively traverses a dictionary or list to sanitize strings and
-        redact values associated with sensitive keys.
+        Traverses a dictionary or list (iteratively, within self.limits) to
+        sanitize strings and redact values associated with sensitive keys.
+        Values that are not strings are left as they are.
         """
-        if isinstance(data, dict):
-            # Create a new dict, redacting values where the key is sensitive
-            return {
-                key: REDACTED_VALUE if key.lower() in SENSITIVE_KEYS else self.redact(value)
-                for key, value in data.items()
-            }
-        elif isinstance(data, list):
-            # Recursively call redact on each item in the list
-            return [self.redact(item) for item in data]
-        else:
-            # For any other value (str, int, bool, etc.), sanitize it
-            return self.sanitize_value(data)
+        return sanitize_tree(data, self._clean, self._key_policy, root_ctx=self.rules.root,
+                             limits=self.limits, redacted_value=self.rules.redacted_value, stringify=False)
 
 class SecureJsonFormatter(logging.Formatter):
     """
@@ -222,6 +232,17 @@ def test_handles_non_string_types_correctly():
     assert out['bool'] is True
     assert out['none'] is None
 
+def test_sanitizer_keeps_other_values_as_they_are():
+    when = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    payload = b'\x00raw'
+    clean = Sanitizer().redact({'when': when, 'payload': payload, 'items': [when, 'a\nb']})
+    assert clean['when'] is when and clean['payload'] is payload
+    assert clean['items'] == [when, 'a b']
+
+def test_sanitizer_does_not_truncate_by_default():
+    clean = Sanitizer().redact({'long': 'x' * 100000, 'wide': list(range(5000))})
+    assert len(clean['long']) == 100000 and len(clean['wide']) == 5000
+
 def test_formatter_includes_standard_log_fields():
     out = get_log_output("A standard message", extra={'user': 'test'})
     assert "timestamp" in out
@@ -230,6 +251,31 @@ def test_formatter_includes_standard_log_fields():
     assert "test_logger" in out["logger_name"]
     assert out["user"] == "test"
 
+def test_sanitizer_bounds_deep_and_large_payloads():
+    deep = 'leaf'
+    for _ in range(5000):
+        deep = {'password': FAKE_PASSWORD, 'next': deep}
+    clean = Sanitizer(limits=DEFAULT_LIMITS).redact({'deep': deep, 'tags': ('a\nb', 'c'), 'ids': {3, 1, 2}})
+    json.dumps(clean)
+    assert clean['deep']['password'] == REDACTED_VALUE
+    assert clean['deep']['next']['password'] == REDACTED_VALUE
+    assert clean['tags'] == ['a b', 'c']
+    assert clean['ids'] == [1, 2, 3]
+
+def test_sanitizer_applies_path_and_value_rules():
+    rules = RedactionRules(keys=['*_token'], paths=['headers.authorization'],
+                           value_patterns=[r'(?i:bearer)\s+\S+'])
+    clean = Sanitizer(rules=rules).redact({
+        'headers': {'Authorization': 'Basic abc', 'accept': 'json'},
+        'authorization': 'top-level is not on the path',
+        'nested': {'refresh_token': FAKE_TOKEN},
+        'note': 'sent Bearer ' + FAKE_TOKEN,
+    })
+    assert clean['headers'] == {'Authorization': REDACTED_VALUE, 'accept': 'json'}
+    assert clean['authorization'] == 'top-level is not on the path'
+    assert clean['nested']['refresh_token'] == REDACTED_VALUE
+    assert clean['note'] == 'sent ' + REDACTED_VALUE
+
 
 # ==============================================================================
 # SECTION 3: EXECUTION BLOCK
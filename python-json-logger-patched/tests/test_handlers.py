@@ -0,0 +1,205 @@
+import io
+import json
+import logging
+import threading
+import pytest
+from pythonjsonlogger_patched import JsonFormatter, AsyncJsonHandler, CoalescingHandler, NDJSONStreamHandler
+from pythonjsonlogger_patched.handlers import message_fingerprint
+
+
+class GatedHandler(logging.Handler):
+    """Collects formatted records; blocks in emit until the gate opens."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self.lines = []
+
+    def emit(self, record):
+        self.entered.set()
+        self.gate.wait(5)
+        self.lines.append(json.loads(self.format(record)))
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [handler]
+    return logger
+
+def stall_worker(logger, target):
+    # Park the worker inside the target so later records stay queued.
+    logger.info("first")
+    assert target.entered.wait(5)
+
+def test_writes_all_records_on_close():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    handler = AsyncJsonHandler(target, batch_size=8)
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("async_all", handler)
+    for i in range(100):
+        logger.info("msg %d", i, extra={'extra': {'i': i}})
+    handler.close()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['i'] for line in lines] == list(range(100))
+    assert lines[5]['message'] == "msg 5"
+
+def test_flush_waits_for_worker():
+    stream = io.StringIO()
+    handler = AsyncJsonHandler(logging.StreamHandler(stream))
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("async_flush", handler)
+    logger.info("hello")
+    handler.flush()
+    assert json.loads(stream.getvalue())['message'] == "hello"
+    handler.close()
+
+def test_drop_new_counts_rejected_records():
+    target = GatedHandler()
+    handler = AsyncJsonHandler(target, capacity=2, overflow='drop_new')
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("async_drop_new", handler)
+    stall_worker(logger, target)
+    for name in ("a", "b", "c", "d"):
+        logger.info(name)
+    assert handler.dropped == 2
+    target.gate.set()
+    handler.close()
+    assert [line['message'] for line in target.lines] == ["first", "a", "b"]
+
+def test_drop_oldest_keeps_newest_records():
+    target = GatedHandler()
+    handler = AsyncJsonHandler(target, capacity=2, overflow='drop_oldest')
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("async_drop_oldest", handler)
+    stall_worker(logger, target)
+    for name in ("a", "b", "c", "d"):
+        logger.info(name)
+    assert handler.dropped == 2
+    target.gate.set()
+    handler.close()
+    assert [line['message'] for line in target.lines] == ["first", "c", "d"]
+
+def test_block_policy_loses_nothing():
+    target = GatedHandler()
+    handler = AsyncJsonHandler(target, capacity=1, overflow='block')
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("async_block", handler)
+    stall_worker(logger, target)
+    producer = threading.Thread(target=lambda: [logger.info(str(i)) for i in range(5)])
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()  # waiting for room in the queue
+    target.gate.set()
+    producer.join(5)
+    handler.close()
+    assert handler.dropped == 0
+    assert [line['message'] for line in target.lines] == ["first", "0", "1", "2", "3", "4"]
+
+def test_rejects_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        AsyncJsonHandler(logging.NullHandler(), overflow='spill')
+
+class CountingStream(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+def test_ndjson_handler_writes_each_record_on_its_own_line():
+    stream = io.BytesIO()
+    handler = NDJSONStreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("ndjson_single", handler)
+    logger.info("one")
+    logger.info("two", extra={'extra': {'k': 'v'}})
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['message'] for line in lines] == ["one", "two"]
+    assert lines[1]['k'] == "v"
+
+def test_ndjson_handler_accepts_text_streams():
+    stream = io.StringIO()
+    handler = NDJSONStreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    make_logger("ndjson_text", handler).info("caf\u00e9")
+    assert json.loads(stream.getvalue())['message'] == "caf\u00e9"
+
+def test_async_handler_writes_once_per_batch():
+    stream = CountingStream()
+    target = NDJSONStreamHandler(stream)
+    handler = AsyncJsonHandler(target, batch_size=50)
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("ndjson_batched", handler)
+    target.acquire()  # hold the worker until everything is queued
+    try:
+        for i in range(100):
+            logger.info(str(i))
+    finally:
+        target.release()
+    handler.close()
+    assert len(stream.getvalue().splitlines()) == 100
+    assert stream.writes <= 3
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def dns_record(created, msg="answer %s", args=("example.com",), level=logging.INFO):
+    record = logging.LogRecord("dns", level, __file__, 1, msg, args, None)
+    record.created = created
+    return record
+
+def test_coalescing_forwards_first_and_summarises_repeats():
+    now = [100.0]
+    target = ListHandler()
+    handler = CoalescingHandler(target, window=1.0, sweep=False, clock=lambda: now[0])
+    for i in range(5):
+        handler.handle(dns_record(100.0 + i * 0.1, args=(f"host{i}",)))
+    assert [r.getMessage() for r in target.records] == ["answer host0"]
+    assert handler.suppressed == 4
+    now[0] = 101.5
+    handler.flush()
+    summary = target.records[-1]
+    assert summary.getMessage() == "answer host4"
+    assert summary.repeat_count == 5
+    assert summary.extra['first_seen'] == '1970-01-01T00:01:40.000000Z'
+    assert summary.extra['last_seen'] == '1970-01-01T00:01:40.400000Z'
+    handler.close()
+    assert len(target.records) == 2
+
+def test_coalescing_summary_fields_reach_json_output():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    handler = CoalescingHandler(target, window=60, sweep=False)
+    handler.setFormatter(JsonFormatter())
+    logger = make_logger("coalesce_json", handler)
+    for _ in range(3):
+        logger.warning("disk full", extra={'extra': {'mount': '/var'}})
+    handler.close()
+    first, summary = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert 'repeat_count' not in first
+    assert summary['repeat_count'] == 3 and summary['mount'] == '/var'
+
+def test_coalescing_custom_fingerprint_and_bounded_entries():
+    target = ListHandler()
+    handler = CoalescingHandler(target, window=60, fingerprint=message_fingerprint,
+                                max_entries=2, sweep=False, clock=lambda: 0.0)
+    for host in ("a", "b", "a", "c", "a"):
+        handler.handle(dns_record(0.0, args=(host,)))
+    # "a" was evicted (and summarised) when "c" arrived, so the last "a" starts a new run.
+    messages = [(r.getMessage(), getattr(r, 'repeat_count', 1)) for r in target.records]
+    assert messages == [("answer a", 1), ("answer b", 1), ("answer a", 2), ("answer c", 1), ("answer a", 1)]
+    handler.close()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,5 +1,9 @@
+import io
 import logging
 import json
+import random
+import re
+from datetime import datetime, timezone
 import pytest
 from pythonjsonlogger_patched import JsonFormatter
 
@@ -58,5 +62,140 @@ def test_handles_non_string_types():
     assert out['bool'] is True
     assert out['none'] is None
 
+def legacy_sanitize_str(value):
+    # Reference copy of the original six-pass string sanitizer.
+    value = JsonFormatter.CONTROL_CHARS.sub('', value)
+    value = (
+        value.replace('\\', '\\\\')
+             .replace('"', '\\"')
+             .replace('\n', '\\n')
+             .replace('\r', '\\r')
+    )
+    return re.sub(r'<\s*script.*?>.*?<\s*/\s*script\s*>', '', value, flags=re.IGNORECASE|re.DOTALL)
+
+SANITIZER_CASES = [
+    '',
+    'plain ascii text',
+    'caf\u00e9 \u65e5\u672c \U0001f600',
+    'hello\nworld\r<script>alert("x")</script>\x00',
+    'back\\slash and "quotes"',
+    '< script type="a">x</ script >tail',
+    '<SCRIPT>\n</script\t>',
+    '<script>unterminated',
+    '<scr\x00ipt>joined by control char</script>',
+    '<script>"a"\\</script><script>b</script>',
+    '\x7f\x80\x9f\xa0 c1 controls',
+    '<b>not a script</b> < > <',
+]
+
+@pytest.mark.parametrize('value', SANITIZER_CASES)
+def test_sanitizer_matches_legacy_output(value):
+    assert JsonFormatter()._sanitize(value) == legacy_sanitize_str(value)
+
+def test_sanitizer_matches_legacy_output_fuzzed():
+    rng = random.Random(1234)
+    alphabet = ['a', 'Z', ' ', '\\', '"', '<', '>', '/', '\n', '\r', '\t', '\x00',
+                '\x1b', '\x7f', '\x85', '\u00e9', 'script', 'SCRIPT', '<script>',
+                '</script>', '< / script >']
+    formatter = JsonFormatter()
+    for _ in range(2000):
+        value = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert formatter._sanitize(value) == legacy_sanitize_str(value)
+
+def test_sanitizer_fast_path_returns_same_object():
+    value = 'nothing to escape here'
+    assert JsonFormatter()._sanitize(value) is value
+
+def make_record(message, extra=None):
+    record = logging.LogRecord("batch_logger", logging.INFO, __file__, 1, message, None, None)
+    record.extra = extra or {}
+    return record
+
+def test_format_batch_matches_format():
+    formatter = JsonFormatter()
+    records = [make_record("line %d" % i, {'i': i, 'text': 'caf\u00e9\n<script>x</script>'}) for i in range(5)]
+    batch = bytes(formatter.format_batch(records))
+    assert batch.endswith(b'\n') and batch.count(b'\n') == len(records)
+    for line, record in zip(batch.decode('utf-8').splitlines(), records):
+        got, expected = json.loads(line), json.loads(formatter.format(record))
+        got.pop('timestamp'), expected.pop('timestamp')
+        assert got == expected
+
+def test_format_batch_appends_to_given_buffer():
+    formatter = JsonFormatter()
+    buffer = bytearray(b'{"head": 1}\n')
+    assert formatter.format_batch([make_record("a"), make_record("b")], buffer) is buffer
+    lines = [json.loads(line) for line in buffer.splitlines()]
+    assert [line.get('message') for line in lines] == [None, "a", "b"]
+
+    stream = io.BytesIO()
+    formatter.format_batch([make_record("c")], stream)
+    assert json.loads(stream.getvalue())['message'] == "c"
+
+def test_cache_returns_same_output_and_counts_hits():
+    cached, plain = JsonFormatter(cache_size=16), JsonFormatter()
+    extra = {'host': 'db-1\n', 'Password': 'x', 'tags': ['a', '<script>b</script>'], 'meta': {'k': 'v"'}}
+    for _ in range(3):
+        record = make_record("cached", extra)
+        got, expected = json.loads(cached.format(record)), json.loads(plain.format(record))
+        got.pop('timestamp'), expected.pop('timestamp')
+        assert got == expected
+    info = cached.cache_info()
+    assert info['keys'].misses == 4 and info['keys'].hits == 8
+    assert info['values'].hits > 0
+    assert plain.cache_info() is None
+
+def test_cache_is_bounded_and_evicts_least_recently_used():
+    formatter = JsonFormatter(cache_size=2)
+    for value in ('a"', 'b"', 'a"', 'c"'):
+        formatter._sanitize(value)
+    info = formatter.cache_info()['values']
+    assert info.currsize == 2 and info.hits == 1 and info.misses == 3
+    formatter._sanitize('b"')  # evicted when 'c"' was added
+    assert formatter.cache_info()['values'].misses == 4
+
+def test_cache_skips_long_strings_and_mutable_values():
+    formatter = JsonFormatter(cache_size=8, cache_max_length=4)
+    nested = {'k': ['v']}
+    assert formatter._sanitize('long "value"') == 'long \\"value\\"'
+    assert formatter._sanitize(nested) == {'k': ['v']}
+    nested['k'].append('w"')
+    assert formatter._sanitize(nested) == {'k': ['v', 'w\\"']}
+    info = formatter.cache_info()['values']
+    assert info.currsize == 3  # 'k', 'v' and 'w"' only
+
+def isoformat_timestamp(created):
+    # Layout of the previous datetime.utcnow().isoformat() + 'Z' timestamps.
+    return datetime.fromtimestamp(created, timezone.utc).replace(tzinfo=None).isoformat() + 'Z'
+
+@pytest.mark.parametrize('created', [1700000000.0, 1700000000.5, 1700000000.123456,
+                                     1700000000.9999996, 1700000059.000001, 86399.25])
+def test_timestamp_matches_isoformat_layout(created):
+    record = make_record("ts")
+    record.created = created
+    assert json.loads(JsonFormatter().format(record))['timestamp'] == isoformat_timestamp(created)
+
+def test_timestamp_prefix_is_reused_within_a_second():
+    formatter = JsonFormatter()
+    assert formatter._render_timestamp(1700000000.25) == '2023-11-14T22:13:20.250000Z'
+    prefix = formatter._timestamp_prefix
+    assert formatter._render_timestamp(1700000000.75) == '2023-11-14T22:13:20.750000Z'
+    assert formatter._timestamp_prefix is prefix
+    assert formatter._render_timestamp(1700000001.0) == '2023-11-14T22:13:21Z'
+
+def test_timestamp_precision_options():
+    assert JsonFormatter(timestamp_precision='millisecond')._render_timestamp(1700000000.0123) == '2023-11-14T22:13:20.012Z'
+    assert JsonFormatter(timestamp_precision='second')._render_timestamp(1700000000.9) == '2023-11-14T22:13:20Z'
+    with pytest.raises(ValueError):
+        JsonFormatter(timestamp_precision='minute')
+
+def test_static_fields_are_added_unless_overridden():
+    formatter = JsonFormatter(static_fields={'service': 'dns\n', 'level': 'ignored'})
+    out = json.loads(formatter.format(make_record("static")))
+    assert list(out) == ['timestamp', 'level', 'name', 'service', 'message']
+    assert out['service'] == 'dns' and out['level'] == 'INFO' and out['name'] == 'batch_logger'
+    out = json.loads(formatter.format(make_record("static", {'service': 'override'})))
+    assert out['service'] == 'override'
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
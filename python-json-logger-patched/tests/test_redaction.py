@@ -0,0 +1,88 @@
+import json
+import logging
+import pytest
+from pythonjsonlogger_patched import JsonFormatter, RedactionRules
+from pythonjsonlogger_patched.redaction import BEARER_TOKEN, JWT, GlobAutomaton
+
+
+def test_glob_automaton_matches_all_patterns_at_once():
+    automaton = GlobAutomaton(['*token*', 'api?key', 'pass*', 'x'])
+    assert automaton.match('my_token_1') == {0}
+    assert automaton.match('api_key') == {1}
+    assert automaton.match('apikey') == set()
+    assert automaton.match('password') == {2}
+    assert automaton.match('passtoken') == {0, 2}
+    assert automaton.match('x') == {3}
+    assert automaton.match('xx') == set()
+
+def test_glob_automaton_rebuilds_when_state_limit_is_hit():
+    automaton = GlobAutomaton(['a*b*c'], max_states=2)
+    for _ in range(3):
+        assert automaton.match('aXbYc') == {0}
+        assert automaton.match('abX') == set()
+
+def test_keys_match_at_any_depth_case_insensitively():
+    rules = RedactionRules(keys=['password', '*secret*'])
+    redact, child = rules.step(rules.root, 'Password')
+    assert redact
+    assert rules.step(child, 'client_SECRET_id')[0]
+    assert not rules.step(rules.root, 'user')[0]
+
+def test_paths_follow_the_key_hierarchy():
+    rules = RedactionRules(paths=['headers.authorization', 'users.*.ssn'])
+    _, headers = rules.step(rules.root, 'headers')
+    assert rules.step(headers, 'Authorization')[0]
+    assert not rules.step(rules.root, 'authorization')[0]
+    _, users = rules.step(rules.root, 'users')
+    _, alice = rules.step(users, 'alice')
+    assert rules.step(alice, 'ssn')[0]
+    assert not rules.step(users, 'ssn')[0]
+
+def test_value_patterns_replace_only_the_secret():
+    rules = RedactionRules(value_patterns=[BEARER_TOKEN, JWT])
+    assert rules.redact_value('auth=Bearer abc.DEF-1 ok') == 'auth=***REDACTED*** ok'
+    assert rules.redact_value('jwt eyJhbGc.eyJzdWI.sig_1') == 'jwt ***REDACTED***'
+    assert rules.redact_value('nothing here') == 'nothing here'
+
+def test_from_specs_splits_keys_and_paths():
+    rules = RedactionRules.from_specs(['token', ' headers.cookie ', ''])
+    assert rules.step(rules.root, 'token')[0]
+    _, headers = rules.step(rules.root, 'headers')
+    assert rules.step(headers, 'cookie')[0]
+
+def test_many_rules_stay_correct():
+    keys = [f"field_{i}_*" for i in range(300)] + [f"exact_{i}" for i in range(300)]
+    rules = RedactionRules(keys=keys)
+    assert rules.step(rules.root, 'field_299_anything')[0]
+    assert rules.step(rules.root, 'exact_42')[0]
+    assert not rules.step(rules.root, 'field_300_x')[0]
+
+def test_formatter_uses_rules():
+    rules = RedactionRules(keys=['*token'], paths=['headers.authorization'], value_patterns=[BEARER_TOKEN])
+    formatter = JsonFormatter(redaction_rules=rules, cache_size=32)
+    record = logging.LogRecord("rules", logging.INFO, __file__, 1, "req", None, None)
+    record.extra = {
+        'access_token': 'abc',
+        'headers': {'Authorization': 'Basic xyz', 'host': 'example.com'},
+        'items': [{'refresh_token': 'def'}],
+        'password': 'not covered by these rules',
+        'log': 'got Bearer abc.def',
+    }
+    out = json.loads(formatter.format(record))
+    assert out['access_token'] == '***REDACTED***'
+    assert out['headers'] == {'Authorization': '***REDACTED***', 'host': 'example.com'}
+    assert out['items'] == [{'refresh_token': '***REDACTED***'}]
+    assert out['password'] == 'not covered by these rules'
+    assert out['log'] == 'got ***REDACTED***'
+
+def test_value_patterns_do_not_rewrite_keys():
+    rules = RedactionRules(value_patterns=[BEARER_TOKEN])
+    formatter = JsonFormatter(redaction_rules=rules, cache_size=32)
+    record = logging.LogRecord("rules", logging.INFO, __file__, 1, "req", None, None)
+    record.extra = {'Bearer abc.def': 'Bearer abc.def', 'nested': {'Bearer x.y': 1}}
+    out = json.loads(formatter.format(record))
+    assert out['Bearer abc.def'] == '***REDACTED***'
+    assert out['nested'] == {'Bearer x.y': 1}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,86 @@
+import gzip
+import json
+import logging
+import os
+import pytest
+from pythonjsonlogger_patched import AsyncJsonHandler, JsonFormatter
+from pythonjsonlogger_patched.rotating import RotatingNDJSONFileHandler, read_index, read_window
+
+
+def record_at(created, i):
+    record = logging.LogRecord("rot", logging.INFO, __file__, 1, "event %d", (i,), None)
+    record.created = created
+    record.extra = {'i': i, 'pad': 'x' * 50}
+    return record
+
+def write(handler, count, start=1000.0):
+    for i in range(count):
+        handler.handle(record_at(start + i, i))
+
+def test_rotates_by_size_and_compresses_in_background(tmp_path):
+    path = tmp_path / "events.ndjson"
+    handler = RotatingNDJSONFileHandler(str(path), max_bytes=2000, checkpoint_bytes=500)
+    handler.setFormatter(JsonFormatter())
+    write(handler, 100)
+    handler.wait_for_segments()
+    entries = read_index(str(path))
+    assert len(entries) > 1
+    for entry in entries:
+        assert entry['segment'].endswith('.ndjson.gz') and entry['compressed']
+        assert len(entry['blocks']) > 1
+        segment = tmp_path / entry['segment']
+        lines = gzip.decompress(segment.read_bytes()).splitlines()
+        assert len(lines) == entry['records']
+    handler.close()
+    entries = read_index(str(path))
+    assert sum(entry['records'] for entry in entries) == 100
+    assert not path.exists()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_read_window_only_returns_overlapping_blocks(tmp_path):
+    path = tmp_path / "events.ndjson"
+    handler = RotatingNDJSONFileHandler(str(path), max_bytes=5000, checkpoint_bytes=400)
+    handler.setFormatter(JsonFormatter())
+    write(handler, 200)
+    handler.close()
+    everything = [json.loads(line)['i'] for line in read_window(str(path))]
+    assert everything == list(range(200))
+    window = [json.loads(line)['i'] for line in read_window(str(path), start=1050.0, end=1059.0)]
+    assert set(range(50, 60)) <= set(window)
+    assert len(window) < 40
+
+def test_uncompressed_segments_and_retention(tmp_path):
+    path = tmp_path / "events.ndjson"
+    handler = RotatingNDJSONFileHandler(str(path), max_bytes=1000, backup_count=2, compress=False)
+    handler.setFormatter(JsonFormatter())
+    write(handler, 60)
+    handler.close()
+    entries = read_index(str(path))
+    assert len(entries) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([e['segment'] for e in entries] + ['events.ndjson.index'])
+    last = [json.loads(line)['i'] for line in read_window(str(path))]
+    assert last[-1] == 59
+
+def test_leftover_file_is_rotated_on_startup(tmp_path):
+    path = tmp_path / "events.ndjson"
+    path.write_bytes(b'{"old": 1}\n')
+    handler = RotatingNDJSONFileHandler(str(path))
+    handler.setFormatter(JsonFormatter())
+    write(handler, 1)
+    handler.close()
+    entries = read_index(str(path))
+    assert entries[0]['min_ts'] is None and entries[0]['records'] is None
+    lines = [json.loads(line) for line in read_window(str(path), start=5000.0)]
+    assert lines == [{'old': 1}]  # unknown time range is always included
+
+def test_works_as_async_target(tmp_path):
+    path = tmp_path / "events.ndjson"
+    target = RotatingNDJSONFileHandler(str(path), max_bytes=3000)
+    handler = AsyncJsonHandler(target, batch_size=16)
+    handler.setFormatter(JsonFormatter())
+    write(handler, 100)
+    handler.close()
+    assert sorted(json.loads(line)['i'] for line in read_window(str(path))) == list(range(100))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
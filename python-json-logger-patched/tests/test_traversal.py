@@ -0,0 +1,96 @@
+import dataclasses
+import json
+import pytest
+from pythonjsonlogger_patched import JsonFormatter
+from pythonjsonlogger_patched.traversal import (
+    CIRCULAR_MARKER, DEFAULT_LIMITS, DEPTH_MARKER, OUTPUT_MARKER, STRING_MARKER, TRUNCATED_KEY,
+    TraversalLimits, UNLIMITED, sanitize_tree,
+)
+
+
+def upper(value):
+    return value.upper()
+
+def nest(depth):
+    value = 'leaf'
+    for _ in range(depth):
+        value = {'child': value}
+    return value
+
+def test_deep_nesting_does_not_recurse():
+    out = sanitize_tree(nest(50000), upper, limits=UNLIMITED)
+    for _ in range(50000):
+        out = out['child']
+    assert out == 'LEAF'
+
+def test_depth_limit_replaces_containers_with_marker():
+    out = sanitize_tree(nest(5), upper, limits=TraversalLimits(max_depth=3))
+    assert out == {'child': {'child': {'child': DEPTH_MARKER}}}
+
+def test_item_limit_keeps_prefix_and_counts_the_rest():
+    limits = TraversalLimits(max_items=3)
+    assert sanitize_tree(list('abcdef'), upper, limits=limits) == ['A', 'B', 'C', '[3 more items truncated]']
+    out = sanitize_tree({str(i): i for i in range(5)}, upper, limits=limits)
+    assert out == {'0': 0, '1': 1, '2': 2, TRUNCATED_KEY: '[2 more items truncated]'}
+
+def test_string_limit_applies_after_cleaning():
+    out = sanitize_tree('abcdefgh', upper, limits=TraversalLimits(max_string_length=4))
+    assert out == 'ABCD' + STRING_MARKER
+
+def test_output_budget_stops_traversal():
+    out = sanitize_tree(['x' * 40] * 10, upper, limits=TraversalLimits(max_output_bytes=100))
+    assert len(json.dumps(out)) < 250
+    assert out[-1] == OUTPUT_MARKER
+    assert out[-2].endswith(STRING_MARKER)
+
+def test_tuples_sets_and_dataclasses_are_native():
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        label: str
+
+    out = sanitize_tree({'t': (1, 'a'), 's': {'b', 'a'}, 'p': Point(3, 'pt')}, upper)
+    assert out == {'t': [1, 'A'], 's': ['A', 'B'], 'p': {'x': 3, 'label': 'PT'}}
+
+def test_other_values_are_stringified_unless_disabled():
+    marker = object()
+    assert sanitize_tree([marker, 'a'], upper) == [str(marker).upper(), 'A']
+    assert sanitize_tree([marker, 'a'], upper, stringify=False) == [marker, 'A']
+
+def test_cycles_are_marked():
+    loop = ['a']
+    loop.append(loop)
+    assert sanitize_tree(loop, upper) == ['A', CIRCULAR_MARKER]
+
+def test_key_policy_context_flows_to_children():
+    def policy(key, depth):
+        return key, key == 'secret' and depth == 1, depth + 1
+
+    out = sanitize_tree({'secret': 1, 'a': {'secret': 2}}, upper, policy, root_ctx=0)
+    assert out == {'secret': 1, 'a': {'secret': '***REDACTED***'}}
+
+def test_formatter_survives_hostile_extras():
+    formatter = JsonFormatter(limits=TraversalLimits(max_depth=4, max_items=10))
+    extras = formatter._sanitize({'deep': nest(10000), 'wide': list(range(1000)), 'set': {1, 2}})
+    assert json.dumps(extras)
+    assert len(extras['wide']) == 11
+    assert extras['set'] == [1, 2]
+
+def test_formatter_does_not_truncate_by_default():
+    extras = JsonFormatter()._sanitize({'deep': nest(100), 'wide': list(range(5000)), 'long': 'x' * 100000})
+    assert len(extras['wide']) == 5000
+    assert extras['long'] == 'x' * 100000
+    out = extras['deep']
+    for _ in range(100):
+        out = out['child']
+    assert out == 'leaf'
+
+def test_formatter_default_limits_add_markers():
+    formatter = JsonFormatter(limits=DEFAULT_LIMITS)
+    extras = formatter._sanitize({'deep': nest(100), 'wide': list(range(5000)), 'long': 'x' * 100000})
+    assert extras['wide'][-1] == '[4000 more items truncated]'
+    assert extras['long'].endswith(STRING_MARKER)
+    assert DEPTH_MARKER in json.dumps(extras['deep'])
+
+if __name__ == "__main__":
+    pytest.main([__file__])